@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Time the ANSI importer's parsing over a corpus of .ans files, eg an
+unpacked art pack, to check changes to formats/in_ans.py for speed.
+
+usage: ans_import_benchmark.py [-h] [-r REPEAT] PATH [PATH ...]
+"""
+
+import argparse, os, sys, time, traceback
+
+from formats.in_ans import read_ans
+
+# slowest files to list
+SLOWEST_COUNT = 5
+
+def get_ans_filenames(paths):
+    "Return .ans files at or (recursively) in given paths."
+    filenames = []
+    for path in paths:
+        if not os.path.isdir(path):
+            filenames.append(path)
+            continue
+        for dirpath, dirnames, files in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith('.ans'):
+                    filenames.append(os.path.join(dirpath, filename))
+    return filenames
+
+def time_file(data, repeat):
+    "Return (best seconds taken to parse given data, lines parsed)."
+    best = None
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        chars, fgs, bgs = read_ans(data)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(chars)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time ANSI import of a corpus of .ans files.')
+    parser.add_argument('paths', nargs='+', help='.ans files, or folders of them')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='times to parse each file, best is kept (default: 3)')
+    args = parser.parse_args()
+    filenames = get_ans_filenames(args.paths)
+    if len(filenames) == 0:
+        print('No .ans files found', file=sys.stderr)
+        return 1
+    results = []
+    total_bytes, total_lines, total_time = 0, 0, 0
+    failures = 0
+    for filename in filenames:
+        data = open(filename, 'rb').read()
+        try:
+            elapsed, lines = time_file(data, args.repeat)
+        except:
+            failures += 1
+            print('%s failed:' % filename)
+            print(traceback.format_exc())
+            continue
+        results.append((elapsed, filename, len(data), lines))
+        total_bytes += len(data)
+        total_lines += lines
+        total_time += elapsed
+    if len(results) == 0:
+        return 1
+    print('Parsed %s files (%.1f KB, %s lines) in %.3fs: %.2f MB/s, %.0f lines/s' % (len(results), total_bytes / 1024, total_lines, total_time, total_bytes / total_time / 1024 / 1024, total_lines / total_time))
+    print('Slowest files:')
+    for elapsed, filename, size, lines in sorted(results, reverse=True)[:SLOWEST_COUNT]:
+        print('%8.4fs  %7s bytes  %5s lines  %s' % (elapsed, size, lines, filename))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
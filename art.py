@@ -1,9 +1,11 @@
-import os.path, json, time, traceback
+import os.path, hashlib, mmap, time, traceback
 import random # import random only so art scripts don't have to
 import numpy as np
 
 from edit_command import CommandStack, EntireArtCommand
-from image_export import write_thumbnail
+from art_frames import FrameStack, SharedFrameStack, LazyFrameStack, FrameMemoryBudget, get_changed_frames
+from art_journal import ArtJournal, get_journal_filename, read_journal, get_latest_art_record, apply_records
+from art_format import TILE_ARRAY_NAMES, read_art_file, read_tile_arrays, read_tile_lists, write_art_file, write_json_art_file
 
 # X, Y, Z
 VERT_LENGTH = 3
@@ -14,6 +16,15 @@ ELEM_STRIDE = 6
 # UVs: 2 floats per vert * 4 verts in a quad
 UV_STRIDE = 2 * 4
 
+# tile data is stored compactly, one value per tile; renderables expand it
+# to per-vertex floats only when uploading to GL buffers
+CHAR_DTYPE = np.uint16
+# palettes can have up to 1024 colors, too many for uint8
+COLOR_DTYPE = np.uint16
+XFORM_DTYPE = np.uint8
+# types of tile data arrays, in get_frame_stacks order (see TILE_ARRAY_NAMES)
+TILE_ARRAY_DTYPES = [CHAR_DTYPE, COLOR_DTYPE, COLOR_DTYPE, XFORM_DTYPE]
+
 # starting document defaults
 DEFAULT_CHARSET = 'c64_petscii'
 DEFAULT_PALETTE = 'c64_original'
@@ -78,6 +89,107 @@ uv_types_reverse = {
     uv_types[UV_FLIP270]: UV_FLIP270
 }
 
+# table of per-vertex UV mods indexed by transform, for vectorized lookup
+uv_type_table = np.array([uv_types[i] for i in range(len(uv_types))],
+                         dtype=np.float32)
+
+# transform resulting from a horizontal flip of each transform
+uv_flips_x = {
+    UV_NORMAL: UV_FLIPX,
+    UV_FLIPX: UV_NORMAL,
+    UV_FLIPY: UV_ROTATE180,
+    UV_ROTATE180: UV_FLIPY,
+    UV_ROTATE90: UV_FLIP90,
+    UV_FLIP90: UV_ROTATE90,
+    UV_ROTATE270: UV_FLIP270,
+    UV_FLIP270: UV_ROTATE270
+}
+
+# transform resulting from a vertical flip of each transform
+uv_flips_y = {
+    UV_NORMAL: UV_FLIPY,
+    UV_FLIPY: UV_NORMAL,
+    UV_FLIPX: UV_ROTATE180,
+    UV_ROTATE180: UV_FLIPX,
+    # vertical flip of rotated characters: use inverted (180) "flip"
+    UV_ROTATE90: UV_FLIP270,
+    UV_FLIP270: UV_ROTATE90,
+    UV_ROTATE270: UV_FLIP90,
+    UV_FLIP90: UV_ROTATE270
+}
+
+# flip tables indexed by transform, for remapping whole layers at once
+uv_flip_x_table = np.array([uv_flips_x[i] for i in range(len(uv_flips_x))],
+                           dtype=XFORM_DTYPE)
+uv_flip_y_table = np.array([uv_flips_y[i] for i in range(len(uv_flips_y))],
+                           dtype=XFORM_DTYPE)
+
+# max # of different Art dimensions to keep vert/elem arrays cached for
+GEO_CACHE_MAX_ENTRIES = 64
+
+# legacy storage: each tile value repeated for 4 verts, as float32
+# (char/fg/bg), uint32 (xform map) and 8 float32 UV mods
+EXPANDED_TILE_BYTES = (4 * 4 * 3) + (4 * 4) + (UV_STRIDE * 4)
+
+# (width, height, layers, quad_width, quad_height): (vert array, elem array)
+geo_cache = {}
+
+def get_tile_data_size(d):
+    "Return bytes of tile data in all frames of art with given PSCI header."
+    tile_bytes = sum(np.dtype(dtype).itemsize for dtype in TILE_ARRAY_DTYPES)
+    return tile_bytes * d['width'] * d['height'] * len(d['layers']) * len(d['frames'])
+
+def get_thumbnail_key(filename, mtime, size):
+    """
+    Return name of thumbnail for given art file, as of given modified time
+    and size; cheap to find, unlike a hash of the file's contents.
+    """
+    key = '%s:%s:%s' % (os.path.abspath(filename), mtime, size)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+def build_geo_arrays(width, height, layers, quad_width, quad_height):
+    "Return new vertex and element arrays for an Art of given dimensions."
+    # X/Y of each tile's top left corner; Z of all layers is 0, set in shader
+    left_x = np.arange(width, dtype=np.float64) * quad_width
+    top_y = np.arange(height, dtype=np.float64) * -quad_height
+    right_x = left_x + quad_width
+    bottom_y = top_y - quad_height
+    shape = (layers, height, width, 4, VERT_LENGTH)
+    verts = np.zeros(shape, dtype=np.float32)
+    # corner order: top left, top right, bottom left, bottom right
+    verts[..., 0, 0] = left_x
+    verts[..., 1, 0] = right_x
+    verts[..., 2, 0] = left_x
+    verts[..., 3, 0] = right_x
+    verts[..., 0, 1] = top_y[:, np.newaxis]
+    verts[..., 1, 1] = top_y[:, np.newaxis]
+    verts[..., 2, 1] = bottom_y[:, np.newaxis]
+    verts[..., 3, 1] = bottom_y[:, np.newaxis]
+    verts = verts.reshape((layers, height, width, VERT_STRIDE))
+    # 2 tris per quad: verts 0,1,2 and 1,2,3
+    first_verts = np.arange(layers * height * width, dtype=np.uint32) * 4
+    quad_elems = np.array([0, 1, 2, 1, 2, 3], dtype=np.uint32)
+    elems = (first_verts[:, np.newaxis] + quad_elems).ravel()
+    return verts, elems
+
+def get_geo(width, height, layers, quad_width, quad_height):
+    """
+    Return (vert array, elem array) for an Art of given dimensions, from a
+    process-wide cache so that same-sized Arts share them. Returned arrays
+    are read-only.
+    """
+    key = (width, height, layers, quad_width, quad_height)
+    if key in geo_cache:
+        return geo_cache[key]
+    verts, elems = build_geo_arrays(*key)
+    verts.flags.writeable = False
+    elems.flags.writeable = False
+    # forget oldest entry (dicts preserve insertion order)
+    if len(geo_cache) >= GEO_CACHE_MAX_ENTRIES:
+        del geo_cache[next(iter(geo_cache))]
+    geo_cache[key] = verts, elems
+    return verts, elems
+
 
 class Art:
     """
@@ -98,6 +210,15 @@ class Art:
     log_size_changes = False
     recalc_quad_height = True
     log_creation = False
+    save_format_version = 1
+    "PSCI format to save: 1 = JSON per-tile lists, 2 = binary tile arrays"
+    compress_saves = True
+    "If True, compress tile data in version 2 PSCI files"
+    use_journal = False
+    """
+    If True, log edits to a journal file next to art's file as they're made,
+    so they can be recovered if Playscii quits without saving.
+    """
     
     def __init__(self, filename, app, charset, palette, width, height):
         "Creates a new, blank document with given parameters."
@@ -124,19 +245,22 @@ class Art:
         # cached camera position from before "zoom extents" invoked
         self.non_extents_camera_x = self.non_extents_camera_y = 0
         self.non_extents_camera_z = self.app.camera.start_zoom
-        # list of char/fg/bg arrays, one for each frame
-        self.chars, self.fg_colors, self.bg_colors = [], [], []
-        # char transforms: UV coords, plus map (unused by renderer) for fast access
-        self.uv_mods, self.uv_maps = [], []
         # table of {frame_number: bool} changed frames, processed each update()
         self.char_changed_frames, self.uv_changed_frames = {}, {}
         self.fg_changed_frames, self.bg_changed_frames = {}, {}
+        # table of {frame_number: {layer: [x0, y0, x1, y1]}} tile regions
+        # changed since last update(), or {frame_number: None} for frames that
+        # changed entirely; lets renderables upload only what changed
+        self.dirty_regions = {}
         self.renderables = []
         "List of TileRenderables using us - each new Renderable adds itself"
         self.instances = []
         "List of ArtInstances using us as their source"
+        self.journal = None
+        "ArtJournal logging our unsaved edits, if any"
         # init frames and layers - ArtFromDisk has its own logic for this
         self.init_layers()
+        self.init_frame_stacks()
         self.init_frames()
         # support non-square characters:
         # derive quad_height from chars aspect; quad_width always 1.0
@@ -172,6 +296,20 @@ class Art:
         self.layers_visibility = [True]
         self.layer_names = ['Layer 1']
     
+    def init_frame_stacks(self, capacity=1):
+        "Create empty per-attribute stacks that hold all frames' tile data."
+        shape = (self.layers, self.height, self.width)
+        # char/fg/bg index stacks, each frame a (layers, height, width) array
+        self.chars = FrameStack(shape, CHAR_DTYPE, capacity)
+        self.fg_colors = FrameStack(shape, COLOR_DTYPE, capacity)
+        self.bg_colors = FrameStack(shape, COLOR_DTYPE, capacity)
+        # char transforms, one enum per tile; renderables derive UVs from these
+        self.uv_maps = FrameStack(shape, XFORM_DTYPE, capacity)
+    
+    def get_frame_stacks(self):
+        "Return list of all our tile data FrameStacks."
+        return [self.chars, self.fg_colors, self.bg_colors, self.uv_maps]
+    
     def init_frames(self):
         self.frames = 0
         # current frame being edited
@@ -190,26 +328,19 @@ class Art:
         "Add a blank frame at the specified index (len+1 to add to end)."
         self.frames += 1
         self.frame_delays.insert(index, delay)
-        tiles = self.layers * self.width * self.height
-        shape = (self.layers, self.height, self.width, 4)
         fg, bg = 0, 0
         if self.app.ui:
             fg = self.app.ui.selected_fg_color
             bg = self.app.ui.selected_bg_color
-        new_char = np.zeros(shape, dtype=np.float32)
-        new_fg = np.full(shape, fg, dtype=np.float32)
-        new_bg = np.full(shape, bg, dtype=np.float32)
-        new_uv = np.full(shape, UV_NORMAL, dtype=np.uint32)
-        self.chars.insert(index, new_char)
-        self.fg_colors.insert(index, new_fg)
-        self.bg_colors.insert(index, new_bg)
-        self.uv_maps.insert(index, new_uv)
-        # UV init is more complex than just all zeroes
-        self.uv_mods.insert(index, self.new_uv_layers(self.layers))
+        self.chars.insert(index, 0)
+        self.fg_colors.insert(index, fg)
+        self.bg_colors.insert(index, bg)
+        self.uv_maps.insert(index, UV_NORMAL)
         # all but lowest layer = transparent
         for l in range(1, self.layers):
             self.clear_frame_layer(index, l, 0, fg)
-        self.mark_all_frames_changed()
+        # only frames at and after insertion point have moved
+        self.mark_frames_changed(index, self.frames)
         # set new frame as active
         if self.app.ui and self is self.app.ui.active_art:
             self.app.ui.set_active_frame(index)
@@ -229,12 +360,9 @@ class Art:
         self.frames += 1
         self.frame_delays.insert(dest_frame_index, delay)
         # copy source frame's char/color arrays
-        self.chars.insert(dest_frame_index, self.chars[src_frame_index].copy())
-        self.uv_mods.insert(dest_frame_index, self.uv_mods[src_frame_index].copy())
-        self.uv_maps.insert(dest_frame_index, self.uv_maps[src_frame_index].copy())
-        self.fg_colors.insert(dest_frame_index, self.fg_colors[src_frame_index].copy())
-        self.bg_colors.insert(dest_frame_index, self.bg_colors[src_frame_index].copy())
-        self.mark_all_frames_changed()
+        for stack in self.get_frame_stacks():
+            stack.duplicate(src_frame_index, dest_frame_index)
+        self.mark_frames_changed(dest_frame_index, self.frames)
         # set new frame as active
         if self is self.app.ui.active_art:
             self.app.ui.set_active_frame(dest_frame_index-1)
@@ -242,29 +370,21 @@ class Art:
     
     def delete_frame_at(self, index):
         "Delete frame at given index."
-        self.chars.pop(index)
-        self.fg_colors.pop(index)
-        self.bg_colors.pop(index)
-        self.uv_mods.pop(index)
-        self.uv_maps.pop(index)
+        for stack in self.get_frame_stacks():
+            stack.pop(index)
+        self.frame_delays.pop(index)
         self.frames -= 1
-        self.mark_all_frames_changed()
+        self.mark_frames_changed(index, self.frames)
         if self is self.app.ui.active_art:
             self.app.ui.set_active_frame(index)
     
     def move_frame_to_index(self, src_index, dest_index):
         "Move frame at given index to new given index."
-        char_data = self.chars.pop(src_index)
-        fg_data = self.fg_colors.pop(src_index)
-        bg_data = self.bg_colors.pop(src_index)
-        uv_data = self.uv_mods.pop(src_index)
-        uv_map_data = self.uv_maps.pop(src_index)
-        self.chars.insert(dest_index, char_data)
-        self.fg_colors.insert(dest_index, fg_data)
-        self.bg_colors.insert(dest_index, bg_data)
-        self.uv_mods.insert(dest_index, uv_data)
-        self.uv_maps.insert(dest_index, uv_map_data)
-        self.mark_all_frames_changed()
+        for stack in self.get_frame_stacks():
+            stack.move(src_index, dest_index)
+        self.frame_delays.insert(dest_index, self.frame_delays.pop(src_index))
+        self.mark_frames_changed(min(src_index, dest_index),
+                                 max(src_index, dest_index) + 1)
     
     def add_layer(self, z=None, name=None):
         "Add a new layer with given Z with given name."
@@ -282,15 +402,9 @@ class Art:
     
     def duplicate_layer(self, src_index, z=None, new_name=None):
         "Duplicate layer with given index. Duplicate uses given Z and name."
-        def duplicate_layer_array(array):
-            src_data = np.array([array[src_index]])
-            return np.append(array, src_data, 0)
-        for frame in range(self.frames):
-            self.chars[frame] = duplicate_layer_array(self.chars[frame])
-            self.fg_colors[frame] = duplicate_layer_array(self.fg_colors[frame])
-            self.bg_colors[frame] = duplicate_layer_array(self.bg_colors[frame])
-            self.uv_mods[frame] = duplicate_layer_array(self.uv_mods[frame])
-            self.uv_maps[frame] = duplicate_layer_array(self.uv_maps[frame])
+        for stack in self.get_frame_stacks():
+            array = stack.get_array()
+            stack.set_array(np.append(array, array[:, [src_index]], 1))
         self.layers += 1
         z = z if z is not None else self.layers_z[src_index]
         self.layers_z.append(z)
@@ -310,27 +424,13 @@ class Art:
     def clear_frame_layer(self, frame, layer, bg_color=0, fg_color=None):
         "Clear given layer of given frame to transparent BG + no characters."
         # "clear" UVs to UV_NORMAL
-        for y in range(self.height):
-            for x in range(self.width):
-                self.uv_mods[frame][layer][y][x] = uv_types[UV_NORMAL]
-                self.uv_maps[frame][layer][y][x] = UV_NORMAL
-                self.chars[frame][layer][y][x] = 0
-                self.fg_colors[frame][layer][y][x] = fg_color or 0
-                self.bg_colors[frame][layer][y][x] = bg_color
-        # tell this frame to update
-        self.char_changed_frames[frame] = True
-        self.fg_changed_frames[frame] = True
-        self.bg_changed_frames[frame] = True
-        self.uv_changed_frames[frame] = True
+        self.fill_rect(frame, layer, 0, 0, self.width, self.height, 0,
+                       fg_color or 0, bg_color, UV_NORMAL)
     
     def delete_layer(self, index):
         "Delete layer at given index."
-        for frame in range(self.frames):
-            self.chars[frame] = np.delete(self.chars[frame], index, 0)
-            self.fg_colors[frame] = np.delete(self.fg_colors[frame], index, 0)
-            self.bg_colors[frame] = np.delete(self.bg_colors[frame], index, 0)
-            self.uv_mods[frame] = np.delete(self.uv_mods[frame], index, 0)
-            self.uv_maps[frame] = np.delete(self.uv_maps[frame], index, 0)
+        for stack in self.get_frame_stacks():
+            stack.set_array(np.delete(stack.get_array(), index, 1))
         self.layers_z.pop(index)
         self.layers_visibility.pop(index)
         self.layer_names.pop(index)
@@ -395,48 +495,46 @@ class Art:
         x1, y1 = x0 + new_width, y0 + new_height
         crop_x = new_width < self.width
         crop_y = new_height < self.height
-        for frame in range(self.frames):
-            for array in [self.chars, self.fg_colors, self.bg_colors,
-                          self.uv_mods, self.uv_maps]:
-                if crop_x:
-                    array[frame] = array[frame].take(range(x0, x1), axis=2)
-                if crop_y:
-                    array[frame] = array[frame].take(range(y0, y1), axis=1)
+        for stack in self.get_frame_stacks():
+            array = stack.get_array()
+            if crop_x:
+                array = array.take(range(x0, x1), axis=3)
+            if crop_y:
+                array = array.take(range(y0, y1), axis=2)
+            stack.set_array(array)
     
     def expand(self, new_width, new_height, bg_fill):
         x_add = new_width - self.width
         y_add = new_height - self.height
         #print('%s expand: %sw + %s = %s, %sh + %s = %s' % (self.filename,
         #    self.width, x_add, new_width, self.height, y_add, new_height))
-        def expand_array(array, fill_value, stride):
+        def expand_stack(stack, fill_value):
+            array = stack.get_array()
             # add columns (increasing width)
             if x_add > 0:
                 # before height has changed, take care not to append
                 # incorrectly sized columns
                 h = new_height if new_height < self.height else self.height
-                add_shape = (self.layers, h, x_add, stride)
-                add = np.full(add_shape, fill_value, dtype=np.float32)
-                array = np.append(array, add, 2)
+                add_shape = (self.frames, self.layers, h, x_add)
+                add = np.full(add_shape, fill_value, dtype=array.dtype)
+                array = np.append(array, add, 3)
             # add rows (increasing height)
             if y_add > 0:
-                add_shape = (self.layers, y_add, new_width, stride)
-                add = np.full(add_shape, fill_value, dtype=np.float32)
-                array = np.append(array, add, 1)
-            # can't modify passed array in-place
-            return array
-        for frame in range(self.frames):
-            self.chars[frame] = expand_array(self.chars[frame], 0, 4)
-            fg, bg = 0, 0
-            if self.app.ui:
-                fg = self.app.ui.selected_fg_color
-                # fill with BG color? ResizeArtDialog can specify this
-                # if not, blank bg for all new tiles (original default behavior)
-                if bg_fill:
-                    bg = self.app.ui.selected_bg_color
-            self.fg_colors[frame] = expand_array(self.fg_colors[frame], fg, 4)
-            self.bg_colors[frame] = expand_array(self.bg_colors[frame], bg, 4)
-            self.uv_mods[frame] = expand_array(self.uv_mods[frame], uv_types[UV_NORMAL], UV_STRIDE)
-            self.uv_maps[frame] = expand_array(self.uv_maps[frame], UV_NORMAL, 4)
+                add_shape = (self.frames, self.layers, y_add, new_width)
+                add = np.full(add_shape, fill_value, dtype=array.dtype)
+                array = np.append(array, add, 2)
+            stack.set_array(array)
+        fg, bg = 0, 0
+        if self.app.ui:
+            fg = self.app.ui.selected_fg_color
+            # fill with BG color? ResizeArtDialog can specify this
+            # if not, blank bg for all new tiles (original default behavior)
+            if bg_fill:
+                bg = self.app.ui.selected_bg_color
+        expand_stack(self.chars, 0)
+        expand_stack(self.fg_colors, fg)
+        expand_stack(self.bg_colors, bg)
+        expand_stack(self.uv_maps, UV_NORMAL)
     
     def mark_frame_changed(self, frame):
         "Given frame at given index as changed for next render."
@@ -444,11 +542,42 @@ class Art:
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
         self.uv_changed_frames[frame] = True
+        self.dirty_regions[frame] = None
+    
+    def mark_region_changed(self, frame, layer, x0, y0, x1, y1):
+        """
+        Grow given frame+layer's dirty region to include given tile
+        rectangle, (x0, y0) inclusive to (x1, y1) exclusive. Callers must
+        also set the changed_frames flags for whatever tile data changed.
+        """
+        if frame in self.dirty_regions:
+            regions = self.dirty_regions[frame]
+            # entire frame is already dirty
+            if regions is None:
+                return
+        else:
+            regions = self.dirty_regions[frame] = {}
+        r = regions.get(layer, None)
+        if r is None:
+            regions[layer] = [x0, y0, x1, y1]
+            return
+        if x0 < r[0]: r[0] = x0
+        if y0 < r[1]: r[1] = y0
+        if x1 > r[2]: r[2] = x1
+        if y1 > r[3]: r[3] = y1
+    
+    def mark_tile_changed(self, frame, layer, x, y):
+        "Add given tile to given frame+layer's dirty region."
+        self.mark_region_changed(frame, layer, x, y, x + 1, y + 1)
+    
+    def mark_frames_changed(self, start_frame, end_frame):
+        "Mark frames from start index up to (not including) end as changed."
+        for frame in range(start_frame, end_frame):
+            self.mark_frame_changed(frame)
     
     def mark_all_frames_changed(self):
         "Mark all frames as changed for next render."
-        for frame in range(self.frames):
-            self.mark_frame_changed(frame)
+        self.mark_frames_changed(0, self.frames)
     
     def resize(self, new_width, new_height, origin_x=0, origin_y=0, bg_fill=False):
         """
@@ -469,53 +598,44 @@ class Art:
         """
         (Re)build the vertex and element arrays used by all layers.
         Run if the Art has untracked changes to size or layer count.
+        Arrays are shared by all Arts with the same dimensions, don't modify!
+        """
+        self.vert_array, self.elem_array = get_geo(self.width, self.height,
+                                                   self.layers,
+                                                   self.quad_width,
+                                                   self.quad_height)
+    
+    def get_vertex_tile_data(self, frame, chars=True, uvs=True, fg=True,
+                             bg=True, start=0, end=None):
+        """
+        Return (chars, uv mods, fg colors, bg colors) float32 arrays for given
+        frame, with each tile's values repeated for each of its quad's 4 verts,
+        as expected by TileRenderable's GL buffers. Arrays not requested are
+        returned as None. Optional start/end restrict output to that range of
+        tiles, counting across all layers in buffer order.
+        """
+        def expand(array):
+            tiles = array.reshape(-1)[start:end]
+            return np.repeat(tiles.astype(np.float32), 4)
+        chars = expand(self.chars[frame]) if chars else None
+        if uvs:
+            uvs = uv_type_table[self.uv_maps[frame].reshape(-1)[start:end]].ravel()
+        else:
+            uvs = None
+        fg = expand(self.fg_colors[frame]) if fg else None
+        bg = expand(self.bg_colors[frame]) if bg else None
+        return chars, uvs, fg, bg
+    
+    def get_memory_usage(self):
+        """
+        Return (bytes used, bytes legacy per-vertex float storage would use)
+        for this Art's tile data.
         """
-        shape = (self.layers, self.height, self.width, VERT_STRIDE)
-        self.vert_array = np.empty(shape, dtype=np.float32)
-        all_elems_size = self.layers * self.width * self.height * ELEM_STRIDE
-        self.elem_array = np.empty(shape=all_elems_size, dtype=np.uint32)
-        # generate geo according to art size
-        # vert_index corresponds to # of verts, loc_index to position in array
-        # (given that each vert has 3 components)
-        vert_index = 0
-        elem_index = 0
-        for layer in range(self.layers):
-            for tile_y in range(self.height):
-                for tile_x in range(self.width):
-                    # vertices
-                    left_x = tile_x * self.quad_width
-                    top_y = tile_y * -self.quad_height
-                    right_x = left_x + self.quad_width
-                    bottom_y = top_y - self.quad_height
-                    x0,y0 = left_x, top_y
-                    x1,y1 = right_x, top_y
-                    x2,y2 = left_x, bottom_y
-                    x3,y3 = right_x, bottom_y
-                    # Z of all layers is 0, layer Z set in shader
-                    verts = [x0, y0, 0]
-                    verts += [x1, y1, 0]
-                    verts += [x2, y2, 0]
-                    verts += [x3, y3, 0]
-                    self.vert_array[layer][tile_y][tile_x] = verts
-                    # vertex elements
-                    elements = [vert_index, vert_index+1, vert_index+2]
-                    elements += [vert_index+1, vert_index+2, vert_index+3]
-                    self.elem_array[elem_index:elem_index+ELEM_STRIDE] = elements
-                    elem_index += ELEM_STRIDE
-                    # 4 verts in a quad
-                    vert_index += 4
-    
-    def new_uv_layers(self, layers):
-        "Return given # of layer's worth of vanilla UV array data."
-        shape = (layers, self.height, self.width, UV_STRIDE)
-        array = np.zeros(shape, dtype=np.float32)
-        # default new layer of UVs to "normal" transform
-        uvs = uv_types[UV_NORMAL]
-        for layer in range(layers):
-            for y in range(self.height):
-                for x in range(self.width):
-                    array[layer][y][x] = uvs
-        return array
+        used = 0
+        for stack in self.get_frame_stacks():
+            used += stack.get_nbytes()
+        tiles = self.frames * self.layers * self.width * self.height
+        return used, tiles * EXPANDED_TILE_BYTES
     
     def is_tile_inside(self, x, y):
         "Return True if given x,y tile coord is within our bounds."
@@ -524,20 +644,20 @@ class Art:
     # get methods
     def get_char_index_at(self, frame, layer, x, y):
         "Return character index for given frame/layer/x,y tile."
-        return int(self.chars[frame][layer][y][x][0])
+        return int(self.chars[frame][layer][y][x])
     
     def get_fg_color_index_at(self, frame, layer, x, y):
         "Return foreground color index for given frame/layer/x,y tile."
-        return int(self.fg_colors[frame][layer][y][x][0])
+        return int(self.fg_colors[frame][layer][y][x])
     
     def get_bg_color_index_at(self, frame, layer, x, y):
         "Return background color index for given frame/layer/x,y tile."
-        return int(self.bg_colors[frame][layer][y][x][0])
+        return int(self.bg_colors[frame][layer][y][x])
     
     def get_char_transform_at(self, frame, layer, x, y):
         "Return character transform enum for given frame/layer/x,y tile."
         # read from mapping, rather than casting raw UV coords for tuple key
-        return self.uv_maps[frame][layer][y][x][0]
+        return int(self.uv_maps[frame][layer][y][x])
     
     def get_tile_at(self, frame, layer, x, y):
         """
@@ -553,9 +673,10 @@ class Art:
     # set methods
     def set_char_index_at(self, frame, layer, x, y, char_index):
         "Set character index for given frame/layer/x,y tile."
-        self.chars[frame][layer][y][x] = char_index
+        self.chars.get_writable(frame)[layer][y][x] = char_index
         # next update, tell renderables on the changed frame to update buffers
         self.char_changed_frames[frame] = True
+        self.mark_tile_changed(frame, layer, x, y)
     
     def set_color_at(self, frame, layer, x, y, color_index, fg=True):
         """
@@ -563,44 +684,62 @@ class Art:
         Foreground or background specified with "fg" boolean.
         """
         if color_index is None: return
-        # modulo to resolve any negative indices
-        if 0 < color_index >= len(self.palette.colors):
-            color_index %= len(self.palette.colors)
+        color_index = self.get_valid_color_index(color_index)
         # no functional differences between fg and bg color update,
         # so use the same code path with different parameters
-        update_array = self.fg_colors[frame] if fg else self.bg_colors[frame]
+        update_array = self.fg_colors if fg else self.bg_colors
+        update_array = update_array.get_writable(frame)
         update_array[layer][y][x] = color_index
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
+        self.mark_tile_changed(frame, layer, x, y)
+    
+    def get_valid_color_index(self, color_index):
+        """
+        Return given color index (or array of indices) wrapped to our
+        palette's size. Negative indices, which display as transparent,
+        become 0 (transparent).
+        """
+        colors = len(self.palette.colors)
+        if np.ndim(color_index) == 0:
+            if color_index < 0:
+                return 0
+            return color_index % colors if color_index >= colors else color_index
+        color_index = np.asarray(color_index)
+        return np.where(color_index < 0, 0, color_index % colors)
     
     def set_all_non_transparent_colors(self, new_color_index):
         """
         Set color index for all non-transparent (index 0) colors on all tiles
         on all frames and layers.
         """
-        for frame, layer, x, y in TileIter(self):
-            # non-transparent color could be FG or BG
-            char, fg, bg, xform = self.get_tile_at(frame, layer, x, y)
-            change_fg = bg == 0
-            self.set_color_at(frame, layer, x, y, new_color_index, change_fg)
+        for frame in range(self.frames):
+            for layer in range(self.layers):
+                # non-transparent color could be FG or BG
+                transparent_bg = self.bg_colors[frame][layer] == 0
+                self.set_tiles_masked(frame, layer, transparent_bg,
+                                      fg=new_color_index)
+                self.set_tiles_masked(frame, layer, ~transparent_bg,
+                                      bg=new_color_index)
     
     def set_all_bg_colors(self, new_color_index, exclude_layers=[]):
         "Set background color index for all tiles on all frames and layers."
-        for frame, layer, x, y in TileIter(self):
-            # exclude all layers named in list
-            if self.layer_names[layer] in exclude_layers:
-                continue
-            self.set_color_at(frame, layer, x, y, new_color_index, fg=False)
+        for frame in range(self.frames):
+            for layer in range(self.layers):
+                # exclude all layers named in list
+                if self.layer_names[layer] in exclude_layers:
+                    continue
+                self.fill_rect(frame, layer, 0, 0, self.width, self.height,
+                               bg=new_color_index)
     
     def set_char_transform_at(self, frame, layer, x, y, transform):
         """
         Set character transform (X/Y flip, 0/90/180/270 rotate) for given
         frame/layer/x,y tile.
         """
-        self.uv_mods[frame][layer][y][x] = uv_types[transform]
-        # keep mapping, used only for quick access, in sync
-        self.uv_maps[frame][layer][y][x] = transform
+        self.uv_maps.get_writable(frame)[layer][y][x] = transform
         self.uv_changed_frames[frame] = True
+        self.mark_tile_changed(frame, layer, x, y)
     
     def set_tile_at(self, frame, layer, x, y, char_index=None, fg=None, bg=None,
                     transform=None, set_all=False):
@@ -625,67 +764,175 @@ class Art:
         if transform is not None:
             self.set_char_transform_at(frame, layer, x, y, transform)
     
-    def flip_all_xforms(self, flip_dict):
-        # kinda ugly brute force approach: individually set all tiles in all
-        # layers in all frames :/
-        for frame in range(self.frames):
-            for layer in range(self.layers):
-                for y in range(self.height):
-                    for x in range(self.width):
-                        self.set_char_transform_at(frame, layer, x, y, flip_dict[self.get_char_transform_at(frame, layer, x, y)])
+    # bulk set methods
+    def set_tile_values(self, frame, layer, index, char_index=None, fg=None,
+                        bg=None, transform=None):
+        """
+        Set any given tile attributes for tiles at given NumPy index into a
+        (height, width) layer, eg a tuple of slices or a boolean mask. Values
+        can be single values or arrays matching the indexed tiles' shape.
+        Only sets change tracking flags; callers mark dirty regions.
+        """
+        if char_index is not None:
+            self.chars.get_writable(frame)[layer][index] = char_index
+            self.char_changed_frames[frame] = True
+        if fg is not None:
+            self.fg_colors.get_writable(frame)[layer][index] = self.get_valid_color_index(fg)
+            self.fg_changed_frames[frame] = True
+        if bg is not None:
+            self.bg_colors.get_writable(frame)[layer][index] = self.get_valid_color_index(bg)
+            self.bg_changed_frames[frame] = True
+        if transform is not None:
+            self.uv_maps.get_writable(frame)[layer][index] = transform
+            self.uv_changed_frames[frame] = True
     
-    def flip_horizontal(self, frame, layer):
-        "Mirrors Art left-to-right."
+    def fill_rect(self, frame, layer, x, y, width, height, char_index=None,
+                  fg=None, bg=None, transform=None):
+        """
+        Set any given tile attributes (character index, fg/bg color index,
+        transform) for all tiles in given rectangle of given frame/layer.
+        Each value can be a single value, or a (height, width) array of values.
+        Parts of the rectangle outside our bounds are ignored.
+        """
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + width), min(self.height, y + height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        # clip any array values to match clipped rectangle
+        value_region = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        def get_values(values):
+            if values is None or np.ndim(values) == 0:
+                return values
+            return np.asarray(values)[value_region]
+        self.set_tile_values(frame, layer, (slice(y0, y1), slice(x0, x1)),
+                             get_values(char_index), get_values(fg),
+                             get_values(bg), get_values(transform))
+        self.mark_region_changed(frame, layer, x0, y0, x1, y1)
+    
+    def set_tiles_masked(self, frame, layer, mask, char_index=None, fg=None,
+                         bg=None, transform=None):
+        """
+        Set any given tile attributes for tiles selected by given mask, either
+        a (height, width) boolean array or a (y indices, x indices) tuple of
+        arrays. Each value can be a single value, a (height, width) array
+        that selected tiles take their values from, or an array with one
+        value per selected tile.
+        """
+        if type(mask) is tuple:
+            ys, xs = np.asarray(mask[0]), np.asarray(mask[1])
+        else:
+            mask = np.asarray(mask, dtype=bool)
+            ys, xs = np.nonzero(mask)
+        if len(ys) == 0:
+            return
+        index = (ys, xs)
+        def get_values(values):
+            if values is None or np.ndim(values) == 0:
+                return values
+            values = np.asarray(values)
+            if values.shape == (self.height, self.width):
+                return values[index]
+            return values
+        self.set_tile_values(frame, layer, index, get_values(char_index),
+                             get_values(fg), get_values(bg),
+                             get_values(transform))
+        self.mark_region_changed(frame, layer, int(xs.min()), int(ys.min()),
+                                 int(xs.max()) + 1, int(ys.max()) + 1)
+    
+    def get_layer_view(self, frame, layer):
+        """
+        Return a TileLayerView of given frame/layer, for editing its tile
+        data directly as NumPy arrays.
+        """
+        return TileLayerView(self, frame, layer)
+    
+    def get_region_overlap(self, src_x, src_y, width, height, dest_art,
+                           dest_x, dest_y):
+        """
+        Clip given source rectangle of ours, to be copied to given location in
+        given Art, to both Arts' bounds. Return (src x, src y, dest x, dest y,
+        width, height), or None if nothing overlaps.
+        """
+        # clip to source bounds
+        x0, y0 = max(0, src_x), max(0, src_y)
+        x1 = min(self.width, src_x + width)
+        y1 = min(self.height, src_y + height)
+        # clip to dest bounds, in source space
+        x0 = max(x0, src_x - dest_x)
+        y0 = max(y0, src_y - dest_y)
+        x1 = min(x1, src_x - dest_x + dest_art.width)
+        y1 = min(y1, src_y - dest_y + dest_art.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, dest_x + (x0 - src_x), dest_y + (y0 - src_y), x1 - x0, y1 - y0
+    
+    def get_region(self, frame, layer, x, y, width, height):
+        """
+        Return (chars, fg colors, bg colors, transforms) arrays copied from
+        given rectangle of given frame/layer, which must be within bounds.
+        """
+        region = (slice(y, y + height), slice(x, x + width))
+        return (self.chars[frame][layer][region].copy(),
+                self.fg_colors[frame][layer][region].copy(),
+                self.bg_colors[frame][layer][region].copy(),
+                self.uv_maps[frame][layer][region].copy())
+    
+    def copy_region(self, src_frame, src_layer, src_x, src_y, width, height,
+                    dest_art, dest_frame, dest_layer, dest_x, dest_y):
+        """
+        Copy all tile attributes in given rectangle of given frame/layer to
+        given location in given frame/layer of given Art, which may be us.
+        """
+        overlap = self.get_region_overlap(src_x, src_y, width, height,
+                                          dest_art, dest_x, dest_y)
+        if not overlap:
+            return
+        sx, sy, dx, dy, w, h = overlap
+        chars, fg, bg, xforms = self.get_region(src_frame, src_layer, sx, sy, w, h)
+        dest_art.fill_rect(dest_frame, dest_layer, dx, dy, w, h, chars, fg,
+                           bg, xforms)
+    
+    def flip_xforms(self, frame, layer, flip_table):
+        """
+        Remap transforms of all tiles on given frame/layer through given
+        table, eg uv_flip_x_table.
+        """
+        uv_maps = self.uv_maps.get_writable(frame)
+        uv_maps[layer] = flip_table[uv_maps[layer]]
+    
+    def flip(self, frame, layer, flip_function, flip_table):
+        "Mirror given frame/layer with given NumPy flip function."
         command = EntireArtCommand(self)
         command.save_tiles(before=True)
-        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_mods, self.uv_maps]:
-            a[frame][layer] = np.fliplr(a[frame][layer])
+        for a in self.get_frame_stacks():
+            frame_data = a.get_writable(frame)
+            frame_data[layer] = flip_function(frame_data[layer])
         if self.app.ui.flip_affects_xforms:
-            flips = {
-                UV_NORMAL: UV_FLIPX,
-                UV_FLIPX: UV_NORMAL,
-                UV_FLIPY: UV_ROTATE180,
-                UV_ROTATE180: UV_FLIPY,
-                UV_ROTATE90: UV_FLIP90,
-                UV_FLIP90: UV_ROTATE90,
-                UV_ROTATE270: UV_FLIP270,
-                UV_FLIP270: UV_ROTATE270
-            }
-            self.flip_all_xforms(flips)
-        self.mark_frame_changed(frame)
+            self.flip_xforms(frame, layer, flip_table)
+        # only the flipped layer needs to update
+        self.char_changed_frames[frame] = True
+        self.fg_changed_frames[frame] = True
+        self.bg_changed_frames[frame] = True
+        self.uv_changed_frames[frame] = True
+        self.mark_region_changed(frame, layer, 0, 0, self.width, self.height)
         self.set_unsaved_changes(True)
         command.save_tiles(before=False)
         self.command_stack.commit_commands([command])
     
+    def flip_horizontal(self, frame, layer):
+        "Mirrors Art left-to-right."
+        self.flip(frame, layer, np.fliplr, uv_flip_x_table)
+    
     def flip_vertical(self, frame, layer):
         "Flips Art upside down."
-        command = EntireArtCommand(self)
-        command.save_tiles(before=True)
-        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_mods, self.uv_maps]:
-            a[frame][layer] = np.flipud(a[frame][layer])
-        if self.app.ui.flip_affects_xforms:
-            flips = {
-                UV_NORMAL: UV_FLIPY,
-                UV_FLIPY: UV_NORMAL,
-                UV_FLIPX: UV_ROTATE180,
-                UV_ROTATE180: UV_FLIPX,
-                # vertical flip of rotated characters: use inverted (180) "flip"
-                UV_ROTATE90: UV_FLIP270,
-                UV_FLIP270: UV_ROTATE90,
-                UV_ROTATE270: UV_FLIP90,
-                UV_FLIP90: UV_ROTATE270
-            }
-            self.flip_all_xforms(flips)
-        self.mark_frame_changed(frame)
-        self.set_unsaved_changes(True)
-        command.save_tiles(before=False)
-        self.command_stack.commit_commands([command])
+        self.flip(frame, layer, np.flipud, uv_flip_y_table)
     
     def shift(self, frame, layer, amount_x, amount_y):
         "Shift + wrap art on given frame and layer by given amount in X and Y."
-        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_mods, self.uv_maps]:
-            a[frame][layer] = np.roll(a[frame][layer], amount_x, 1)
-            a[frame][layer] = np.roll(a[frame][layer], amount_y, 0)
+        for a in self.get_frame_stacks():
+            frame_data = a.get_writable(frame)
+            frame_data[layer] = np.roll(frame_data[layer], amount_x, 1)
+            frame_data[layer] = np.roll(frame_data[layer], amount_y, 0)
         self.mark_frame_changed(frame)
     
     def shift_all_frames(self, amount_x, amount_y):
@@ -705,47 +952,58 @@ class Art:
     
     def changed_this_frame(self):
         return self.geo_changed or \
-            True in self.char_changed_frames.values() or \
-            True in self.fg_changed_frames.values() or \
-            True in self.bg_changed_frames.values() or \
-            True in self.uv_changed_frames.values()
+            len(self.char_changed_frames) > 0 or \
+            len(self.fg_changed_frames) > 0 or \
+            len(self.bg_changed_frames) > 0 or \
+            len(self.uv_changed_frames) > 0
     
     def update(self):
         self.update_scripts()
+        # compact a big journal once edits stop for a while
+        if self.journal and self.journal.should_compact() and \
+           not self.app.svl.is_saving(self.filename):
+            self.save_to_file()
         # update our camera if we're active
         if not self.app.game_mode and self.app.ui and self.app.ui.active_art is self:
             self.update_saved_camera(self.app.camera)
             self.update_selected_tile_attributes()
         # update our renderables if they're on a frame whose char/colors changed
-        if self.geo_changed:
+        geo_changed = self.geo_changed
+        if geo_changed:
             self.build_geo()
         for r in self.renderables:
-            if self.geo_changed:
+            if geo_changed:
+                # buffer sizes may have changed, re-send everything
                 r.update_geo_buffers()
-                self.geo_changed = False
-            do_char = self.char_changed_frames[r.frame]
-            do_uvs = self.uv_changed_frames[r.frame]
-            do_fg = self.fg_changed_frames[r.frame]
-            do_bg = self.bg_changed_frames[r.frame]
+                r.update_tile_buffers(True, True, True, True)
+                continue
+            do_char = self.char_changed_frames.get(r.frame, False)
+            do_uvs = self.uv_changed_frames.get(r.frame, False)
+            do_fg = self.fg_changed_frames.get(r.frame, False)
+            do_bg = self.bg_changed_frames.get(r.frame, False)
             if do_char or do_fg or do_bg or do_uvs:
-                r.update_tile_buffers(do_char, do_uvs, do_fg, do_bg)
+                r.update_tile_buffers(do_char, do_uvs, do_fg, do_bg,
+                                      self.dirty_regions.get(r.frame, None))
+        if self.renderables:
+            self.geo_changed = False
         # update instances if we chaned
         if self.changed_this_frame() and self.instances:
             for instance in self.instances:
                 if instance.update_when_source_changes:
                     instance.restore_from_source()
         # empty table of changed frames
-        for f in range(self.frames):
-            self.char_changed_frames[f] = False
-            self.fg_changed_frames[f] = False
-            self.bg_changed_frames[f] = False
-            self.uv_changed_frames[f] = False
+        self.char_changed_frames.clear()
+        self.fg_changed_frames.clear()
+        self.bg_changed_frames.clear()
+        self.uv_changed_frames.clear()
+        self.dirty_regions.clear()
         self.updated_this_tick = True
     
     def save_to_file(self):
         """
         Write this Art to disk.
-        Build a dict serializing all this art's data and write it to a file.
+        Tile data is snapshot now and written in the background by the app's
+        SaveLord, so edits can continue while saving.
         """
         # if trying to save to a dir that doesn't exist, switch file to the
         # Art Mode documents dir, which we should assume does exist
@@ -754,104 +1012,120 @@ class Art:
             #self.app.log('Tried to save to directory %s which does not exist!' % filedir, error=True)
             new_path = self.app.documents_dir + ART_DIR + os.path.basename(self.filename)
             self.set_filename(new_path)
-        start_time = time.time()
         # cursor might be hovering, undo any preview changes
         for edit in self.app.cursor.preview_edits:
             edit.undo()
-        d = {'width': self.width, 'height': self.height,
-             'charset': self.charset.name, 'palette': self.palette.name,
-             'active_frame': self.active_frame,
-             'active_layer': self.active_layer,
-             'camera': (self.camera_x, self.camera_y, self.camera_z),
-             'selected_char': int(self.selected_char),
-             'selected_fg_color': int(self.selected_fg_color),
-             'selected_bg_color': int(self.selected_bg_color),
-             'selected_xform': int(self.selected_xform)
-        }
-        # preferred character set and palette, default used if not found
-        # remember camera location
-        # frames and layers are dicts w/ lists of their data + a few properties
-        frames = []
-        for frame_index in range(self.frames):
-            frame = { 'delay': self.frame_delays[frame_index] }
-            layers = []
-            for layer_index in range(self.layers):
-                layer = {'z': self.layers_z[layer_index],
-                         'visible': int(self.layers_visibility[layer_index]),
-                         'name': self.layer_names[layer_index]
-                }
-                tiles = []
-                for y in range(self.height):
-                    for x in range(self.width):
-                        char = int(self.chars[frame_index][layer_index][y][x][0])
-                        fg = int(self.fg_colors[frame_index][layer_index][y][x][0])
-                        bg = int(self.bg_colors[frame_index][layer_index][y][x][0])
-                        # use get method for transform, data's not simply an int
-                        xform = int(self.get_char_transform_at(frame_index, layer_index, x, y))
-                        tiles.append({'char': char, 'fg': fg, 'bg': bg, 'xform': xform})
-                layer['tiles'] = tiles
-                layers.append(layer)
-            frame['layers'] = layers
-            frames.append(frame)
-        d['frames'] = frames
-        # MAYBE-TODO: below gives not-so-pretty-printing, find out way to control
-        # formatting for better output
-        json.dump(d, open(self.filename, 'w'), sort_keys=True, indent=1)
-        end_time = time.time()
+        if self.use_journal and not self.journal:
+            self.journal = ArtJournal(self)
+        # journal records from now on won't be in saved file
+        journal_mark = self.journal.get_mark() if self.journal else None
+        snapshots = self.get_tile_snapshots()
+        write_function = self.get_file_writer(snapshots)
+        def done(job):
+            for snapshot in snapshots:
+                snapshot.release()
+            if self.journal and not job.error:
+                self.journal.compact(journal_mark)
+            self.save_finished(job)
+        # edits from now on are unsaved
         self.set_unsaved_changes(False)
-        #self.app.log('saved %s to disk in %.5f seconds' % (self.filename, end_time - start_time))
-        self.app.log('saved %s' % self.filename)
-        # remove old thumbnail
-        thumb_dir = self.app.cache_dir + THUMBNAIL_CACHE_DIR
-        if os.path.exists(self.filename):
-            old_thumb_filename = thumb_dir + self.app.get_file_hash(self.filename) + '.png'
-            if os.path.exists(old_thumb_filename):
-                os.remove(old_thumb_filename)
-        # write thumbnail
-        new_thumb_filename = thumb_dir + self.app.get_file_hash(self.filename) + '.png'
-        write_thumbnail(self.app, self.filename, new_thumb_filename)
-        # thumbnail write process actually sets active frame! set it back
-        for r in self.renderables:
-            r.set_frame(self.active_frame)
+        self.app.svl.save(self.filename, write_function, done,
+                          self.save_progress, self.can_save_in_background())
+    
+    def get_tile_snapshots(self):
+        "Return FrameSnapshots of our tile data stacks for saving."
+        return [stack.get_snapshot() for stack in self.get_frame_stacks()]
     
-    def ALT_save_to_file(self):
-        # TEST alt save format research
-        # main idea: save flat lists of char/fg/bg/xform per-frame-per-layer
-        # savetest.psci: 500x300x5, 38s vs 8.6s save, 63MB vs 33MB (vs 11MB w/ indent=None)
-        # TODO:
-        # - test read perf too
-        # - save version checking (if none found in PSCI, assume v1)
-        # - support multiple save+load code paths for different save versions
-        def get_flat_int_list(layer_array):
-            return list(map(int, layer_array.flatten()))[::4]
-        start_time = time.time()
-        d = {'width': self.width, 'height': self.height,
-             'charset': self.charset.name, 'palette': self.palette.name,
-             'active_frame': self.active_frame,
-             'active_layer': self.active_layer,
-             'camera': (self.camera_x, self.camera_y, self.camera_z)
+    def can_save_in_background(self):
+        return True
+    
+    def get_file_writer(self, snapshots):
+        """
+        Return function that writes our current state, with tile data from
+        given snapshots, to a given filename. Function returns version 2
+        header dict (or None for version 1), and thumbnail keys of previous
+        and new file.
+        """
+        d = self.get_file_properties()
+        d['frames'] = [{'delay': delay} for delay in self.frame_delays]
+        d['layers'] = self.get_layer_properties()
+        arrays = dict(zip(TILE_ARRAY_NAMES, snapshots))
+        filename = self.filename
+        version, compress = self.save_format_version, self.compress_saves
+        def get_key(written_filename):
+            stat = os.stat(written_filename)
+            return get_thumbnail_key(filename, stat.st_mtime, stat.st_size)
+        def write(temp_filename, progress):
+            old_key = None
+            if os.path.exists(filename):
+                old_key = get_key(filename)
+            if version >= 2:
+                # version 2: JSON header, then packed arrays of each frame's
+                # tile data
+                write_art_file(temp_filename, d, arrays, compress, progress)
+                header = d
+            else:
+                # version 1: JSON with a dict for every tile
+                write_json_art_file(temp_filename, d, arrays, progress)
+                header = None
+            # temp file keeps its modified time when it replaces file
+            return header, old_key, get_key(temp_filename)
+        return write
+    
+    def get_layer_properties(self):
+        "Return list of dicts of each layer's properties saved in PSCI files."
+        layers = []
+        for layer_index in range(self.layers):
+            layers.append({'z': self.layers_z[layer_index],
+                           'visible': int(self.layers_visibility[layer_index]),
+                           'name': self.layer_names[layer_index]})
+        return layers
+    
+    def save_progress(self, job, progress):
+        if self.app.ui:
+            self.app.ui.message_line.post_line('Saving %s... %d%%' % (job.filename, progress * 100))
+    
+    def save_finished(self, job):
+        "Log result of a save, and queue a new thumbnail for it."
+        if job.error:
+            self.app.log('Error saving %s:' % job.filename, error=True)
+            for line in job.error.splitlines():
+                self.app.log(line)
+            self.set_unsaved_changes(True)
+            return
+        self.app.log('saved %s' % job.filename)
+        header, old_key, new_key = job.result
+        if old_key:
+            self.app.thl.remove(old_key)
+        self.app.thl.queue(job.filename, self.app.thl.get_filename(new_key),
+                           self.charset, self.palette)
+    
+    def get_file_properties(self):
+        "Return dict of non-tile data saved in all PSCI format versions."
+        # preferred character set and palette, default used if not found
+        # remember camera location
+        return {'width': self.width, 'height': self.height,
+                'charset': self.charset.name, 'palette': self.palette.name,
+                'active_frame': self.active_frame,
+                'active_layer': self.active_layer,
+                'camera': (self.camera_x, self.camera_y, self.camera_z),
+                'selected_char': int(self.selected_char),
+                'selected_fg_color': int(self.selected_fg_color),
+                'selected_bg_color': int(self.selected_bg_color),
+                'selected_xform': int(self.selected_xform)
         }
-        frames = []
-        for frame_index in range(self.frames):
-            frame = { 'delay': self.frame_delays[frame_index] }
-            layers = []
-            for layer_index in range(self.layers):
-                layer = {'z': self.layers_z[layer_index],
-                         'visible': int(self.layers_visibility[layer_index]),
-                         'name': self.layer_names[layer_index]
-                }
-                # compile lists-of-ints for chars, colors, xforms
-                layer['chars'] = get_flat_int_list(self.chars[frame_index][layer_index])
-                layer['fgs'] = get_flat_int_list(self.fg_colors[frame_index][layer_index])
-                layer['bgs'] = get_flat_int_list(self.bg_colors[frame_index][layer_index])
-                layer['xforms'] = get_flat_int_list(self.uv_maps[frame_index][layer_index])
-                layers.append(layer)
-            frame['layers'] = layers
-            frames.append(frame)
-        d['frames'] = frames
-        json.dump(d, open(self.filename + '2', 'w'), sort_keys=True, indent=None)
-        end_time = time.time()
-        self.app.log('ALT saved %s to disk in %.5f seconds' % (self.filename, end_time - start_time))
+    
+    def journal_command(self, command):
+        "Log given just applied, undone or redone command to our journal."
+        if self.journal:
+            self.journal.add_command(command)
+    
+    def discard_journal(self):
+        "Delete our journal, eg when our unsaved changes are discarded."
+        if self.journal:
+            self.journal.discard()
+        elif os.path.exists(get_journal_filename(self.filename)):
+            os.remove(get_journal_filename(self.filename))
     
     def set_unsaved_changes(self, new_status):
         "Mark this Art as having unsaved changes in Art Mode."
@@ -915,6 +1189,55 @@ class Art:
             self.command_stack.commit_commands([command])
         self.app.ui.message_line.post_line(logline, error=error)
     
+    def time_script(self, script_filename, iterations=10):
+        """
+        Run given script on this Art given number of times and return average
+        seconds per run, or None if script wasn't found or raised an error.
+        Tile data is restored afterward, so scripts that add or remove frames
+        or layers shouldn't be timed this way.
+        """
+        script_filename = self.get_valid_script_filename(script_filename)
+        if not script_filename:
+            return None
+        # frames the script writes to are copied, see get_snapshot
+        snapshots = [stack.get_snapshot() for stack in self.get_frame_stacks()]
+        # catch and log any exception, as run_script does
+        try:
+            script = compile(open(script_filename).read(), script_filename,
+                             'exec')
+            start_time = time.perf_counter()
+            for i in range(iterations):
+                exec(script)
+            return (time.perf_counter() - start_time) / iterations
+        except Exception:
+            self.app.log('Error executing %s:' % script_filename)
+            # skip first 3 lines of callstack before artscript exec
+            for line in traceback.format_exc().split('\n')[3:]:
+                if line.strip():
+                    self.app.log(line.rstrip())
+            return None
+        finally:
+            self.restore_tile_snapshots(snapshots)
+    
+    def restore_tile_snapshots(self, snapshots):
+        """
+        Write tile data from given snapshots of our stacks back to frames
+        changed since, and release the snapshots.
+        """
+        stacks = self.get_frame_stacks()
+        changed = get_changed_frames(stacks, snapshots)
+        for stack, snapshot in zip(stacks, snapshots):
+            if changed is None:
+                frames = [snapshot[frame] for frame in range(len(snapshot))]
+                stack.set_array(np.array(frames, dtype=stack.dtype))
+            else:
+                # write in place, so eg shared and lazily loaded stacks
+                # stay so rather than being replaced by private copies
+                for frame in changed:
+                    stack[frame] = snapshot[frame]
+            snapshot.release()
+        self.mark_all_frames_changed()
+    
     def is_script_running(self, script_filename):
         "Return True if script with given filename is currently running."
         script_filename = self.get_valid_script_filename(script_filename)
@@ -975,13 +1298,9 @@ class Art:
     def clear_line(self, frame, layer, line_y, fg_color_index=None,
                    bg_color_index=None):
         "Clear characters on given horizontal line, to optional given colors."
-        # TODO: use numpy slicing to do this much more quickly!
-        for x in range(self.width):
-            self.set_char_index_at(frame, layer, x, line_y, 0)
-            if fg_color_index:
-                self.set_color_at(frame, layer, x, line_y, fg_color_index)
-            if bg_color_index:
-                self.set_color_at(frame, layer, x, line_y, bg_color_index, False)
+        # 0 = leave color as-is
+        self.fill_rect(frame, layer, 0, line_y, self.width, 1, 0,
+                       fg_color_index or None, bg_color_index or None)
     
     def write_string(self, frame, layer, x, y, text, fg_color_index=None,
                      bg_color_index=None, right_justify=False):
@@ -999,39 +1318,34 @@ class Art:
             x_offset = 0
         # never let string drawing go out of bounds
         text = text[:self.width - (x+x_offset)]
-        for char in text:
-            idx = self.charset.get_char_index(char)
-            self.set_char_index_at(frame, layer, x+x_offset, y, idx)
-            if fg_color_index is not None:
-                self.set_color_at(frame, layer, x+x_offset, y, fg_color_index, True)
-            if bg_color_index is not None:
-                self.set_color_at(frame, layer, x+x_offset, y, bg_color_index, False)
-            x_offset += 1
+        if len(text) == 0:
+            return
+        chars = [self.charset.get_char_index(char) for char in text]
+        # right-justified strings may start at negative x, ie wrap around
+        xs = np.arange(x + x_offset, x + x_offset + len(text)) % self.width
+        ys = np.full(len(text), y)
+        self.set_tiles_masked(frame, layer, (ys, xs), chars, fg_color_index,
+                              bg_color_index)
     
     def composite_to(self, src_frame, src_layer, src_x, src_y, width, height,
                      dest_art, dest_frame, dest_layer, dest_x, dest_y):
-        for y in range(src_y, src_y + height):
-            for x in range(src_x, src_x + width):
-                # never try to write out of bounds on dest art; let user be lazy
-                if x < 0 or x >= dest_art.width or y < 0 or y >= dest_art.height:
-                    continue
-                # only consider non-blank characters
-                if self.get_char_index_at(src_frame, src_layer, x, y) == 0:
-                    continue
-                # skip tiles with transparent FG
-                # TODO: decide if there's a reasonable behavior here
-                if self.get_fg_color_index_at(src_frame, src_layer, x, y) == 0:
-                    continue
-                ch, fg, bg, xform = self.get_tile_at(src_frame, src_layer, x, y)
-                # get coords in dest art space
-                dx = dest_x + (x - src_x)
-                dy = dest_y + (y - src_y)
-                # transparent bg -> keep dest bg, else use entire src tile
-                if self.get_bg_color_index_at(src_frame, src_layer, x, y) == 0:
-                    bg = dest_art.get_bg_color_index_at(dest_frame, dest_layer,
-                                                        dx, dy)
-                dest_art.set_tile_at(dest_frame, dest_layer, dx, dy,
-                                     ch, fg, bg, xform)
+        # never try to write out of bounds on dest art; let user be lazy
+        overlap = self.get_region_overlap(src_x, src_y, width, height,
+                                          dest_art, dest_x, dest_y)
+        if not overlap:
+            return
+        sx, sy, dx, dy, w, h = overlap
+        chars, fg, bg, xforms = self.get_region(src_frame, src_layer, sx, sy, w, h)
+        # only consider non-blank characters
+        # skip tiles with transparent FG
+        # TODO: decide if there's a reasonable behavior here
+        mask = (chars != 0) & (fg != 0)
+        # transparent bg -> keep dest bg, else use entire src tile
+        dest_bg = dest_art.bg_colors[dest_frame][dest_layer][dy:dy+h, dx:dx+w]
+        bg = np.where(bg == 0, dest_bg, bg)
+        ys, xs = np.nonzero(mask)
+        dest_art.set_tiles_masked(dest_frame, dest_layer, (ys + dy, xs + dx),
+                                  chars[mask], fg[mask], bg[mask], xforms[mask])
     
     def composite_from(self, src_art, src_frame, src_layer, src_x, src_y,
                        width, height, dest_frame, dest_layer, dest_x, dest_y):
@@ -1040,14 +1354,10 @@ class Art:
     
     def get_filtered_tiles(self, frame, layer, char_value, invert_filter=False):
         "Return list of (x,y) tile coords that match (or don't) a char value."
-        tiles = []
-        for y in range(self.height):
-            for x in range(self.width):
-                char = self.get_char_index_at(frame, layer, x, y)
-                if (not invert_filter and char == char_value) or \
-                   (invert_filter and char != char_value):
-                    tiles.append((x, y))
-        return tiles
+        chars = self.chars[frame][layer]
+        mask = chars != char_value if invert_filter else chars == char_value
+        ys, xs = np.nonzero(mask)
+        return list(zip(xs.tolist(), ys.tolist()))
     
     def get_blank_tiles(self, frame, layer):
         "Return a list of (x,y) tile coords whose character is blank (0)."
@@ -1063,10 +1373,38 @@ class Art:
 
 class ArtFromDisk(Art):
     "Subclass of Art that loads from a file. Main difference is initialization."
+    lazy_load_min_bytes = 128 * 1024 * 1024
+    """
+    Version 2 files with more tile data than this only load frames as
+    they're used, eg viewed or edited. 0 = always load all frames.
+    """
+    lazy_load_max_bytes = 64 * 1024 * 1024
+    "Max bytes of unedited frames a lazily loaded file keeps in memory"
+    
     def __init__(self, filename, app):
         self.valid = False
+        # memory map of file we load frames from as needed, if any
+        self.file_map = None
+        # file might still be being saved
+        app.svl.wait(filename)
+        # edits logged since file was last saved
+        journal_records = []
         try:
-            d = json.load(open(filename))
+            if os.path.exists(get_journal_filename(filename)):
+                journal_records = read_journal(get_journal_filename(filename))
+            # journal may hold the whole art, if its structure changed
+            art_record, journal_records = get_latest_art_record(journal_records)
+            if art_record:
+                d, self.loaded_arrays = art_record
+                d['version'] = 2
+            else:
+                d = read_art_file(filename)
+                # version 2+ files store tile data as arrays after the header
+                if d.get('version', 1) >= 2:
+                    if 0 < self.lazy_load_min_bytes < get_tile_data_size(d):
+                        self.open_file_map(filename)
+                    else:
+                        self.loaded_arrays = read_tile_arrays(filename, d)
         except:
             return
         width = d['width']
@@ -1100,6 +1438,10 @@ class ArtFromDisk(Art):
             self.selected_bg_color = d['selected_bg_color']
         if 'selected_xform' in d:
             self.selected_xform = d['selected_xform']
+        if art_record or journal_records:
+            self.recover_from_journal(journal_records)
+        elif self.use_journal:
+            self.journal = ArtJournal(self)
         # update renderables with new data
         self.update()
         # signify to app that this file loaded successfully
@@ -1114,11 +1456,15 @@ class ArtFromDisk(Art):
         self.app.log('  layers: %s' % self.layers)
     
     def init_layers(self):
-        frames = self.loaded_data['frames']
-        # number of layers should be same for all frames
-        self.layers = len(frames[0]['layers'])
+        # version 2+ files list layers once, version 1 files for each frame
+        if 'layers' in self.loaded_data:
+            layers = self.loaded_data['layers']
+        else:
+            # number of layers should be same for all frames
+            layers = self.loaded_data['frames'][0]['layers']
+        self.layers = len(layers)
         self.layers_z, self.layers_visibility, self.layer_names = [], [], []
-        for i,layer in enumerate(frames[0]['layers']):
+        for i,layer in enumerate(layers):
             self.layers_z.append(layer['z'])
             self.layers_visibility.append(bool(layer.get('visible', 1)))
             layer_num = str(i + 1)
@@ -1131,36 +1477,104 @@ class ArtFromDisk(Art):
         self.frames = len(frames)
         self.active_frame = 0
         self.frame_delays = []
-        # build tile data arrays from frame+layer lists
-        shape = (self.layers, self.height, self.width, 4)
         for frame in frames:
             self.frame_delays.append(frame['delay'])
-            chars = np.zeros(shape, dtype=np.float32)
-            uvs = self.new_uv_layers(self.layers)
-            uv_maps = np.zeros(shape, dtype=np.uint32)
-            fg_colors = chars.copy()
-            bg_colors = chars.copy()
-            for layer_index,layer in enumerate(frame['layers']):
-                x, y = 0, 0
-                for tile in layer['tiles']:
-                    chars[layer_index][y][x] = tile['char']
-                    fg_colors[layer_index][y][x] = tile['fg']
-                    bg_colors[layer_index][y][x] = tile['bg']
-                    uvs[layer_index][y][x] = uv_types[tile.get('xform', UV_NORMAL)]
-                    uv_maps[layer_index][y][x] = tile.get('xform', UV_NORMAL)
-                    x += 1
-                    if x >= self.width:
-                        x = 0
-                        y += 1
-            self.chars.append(chars)
-            self.fg_colors.append(fg_colors)
-            self.bg_colors.append(bg_colors)
-            self.uv_mods.append(uvs)
-            self.uv_maps.append(uv_maps)
+        if self.file_map:
+            self.init_lazy_frame_stacks()
+        elif self.loaded_data.get('version', 1) >= 2:
+            self.init_frame_stacks(1)
+            for name, stack in zip(TILE_ARRAY_NAMES, self.get_frame_stacks()):
+                stack.set_array(self.loaded_arrays[name])
+            self.loaded_arrays = None
+        else:
+            self.init_tiles_from_lists()
         # set active frame properly
         active_frame = self.loaded_data.get('active_frame', 0)
         self.set_active_frame(active_frame)
     
+    def recover_from_journal(self, records):
+        "Apply given records from our journal, and keep journaling."
+        apply_records(self, records)
+        self.journal = ArtJournal(self)
+        self.unsaved_changes = True
+        self.app.log('Recovered unsaved changes to %s from %s' % (self.filename, self.journal.filename))
+    
+    def open_file_map(self, filename):
+        self.map_file = open(filename, 'rb')
+        self.file_map = mmap.mmap(self.map_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+    
+    def close_file_map(self):
+        self.file_map.close()
+        self.map_file.close()
+        self.file_map = None
+    
+    def init_lazy_frame_stacks(self):
+        "Create stacks that read frames from our file map as they're used."
+        budget = FrameMemoryBudget(self.lazy_load_max_bytes)
+        stacks = []
+        for name, dtype in zip(TILE_ARRAY_NAMES, TILE_ARRAY_DTYPES):
+            stacks.append(LazyFrameStack(self.file_map, self.loaded_data,
+                                         name, dtype, budget))
+        self.chars, self.fg_colors, self.bg_colors, self.uv_maps = stacks
+    
+    def get_lazy_frame_stacks(self):
+        "Return those of our stacks still reading from our file map."
+        return [s for s in self.get_frame_stacks() if isinstance(s, LazyFrameStack)]
+    
+    def load_all_frames(self):
+        "Load any lazily loaded frames into memory and stop reading our file."
+        if not self.file_map:
+            return
+        for name, stack in zip(TILE_ARRAY_NAMES, self.get_frame_stacks()):
+            if isinstance(stack, LazyFrameStack):
+                setattr(self, name, stack.copy())
+        self.close_file_map()
+    
+    def get_tile_snapshots(self):
+        # we're about to overwrite the file our frames are loaded from; a
+        # version 1 save needs all its tiles anyway
+        if self.save_format_version < 2:
+            self.load_all_frames()
+        # edits may have replaced all our lazily loaded stacks
+        elif self.file_map and not self.get_lazy_frame_stacks():
+            self.close_file_map()
+        return Art.get_tile_snapshots(self)
+    
+    def can_save_in_background(self):
+        # lazy stacks' unloaded frames are read from the file being replaced
+        return not self.file_map
+    
+    def get_file_writer(self, snapshots):
+        write = Art.get_file_writer(self, snapshots)
+        if not self.file_map:
+            return write
+        def write_and_close(temp_filename, progress):
+            result = write(temp_filename, progress)
+            # done reading from our file, let it be replaced
+            self.close_file_map()
+            return result
+        return write_and_close
+    
+    def save_finished(self, job):
+        if self.get_lazy_frame_stacks() and not self.file_map:
+            self.open_file_map(self.filename)
+            for stack in self.get_lazy_frame_stacks():
+                if job.error:
+                    # old file is still there, frames are as they were
+                    stack.source = self.file_map
+                else:
+                    # all frames are now unchanged from the new file
+                    stack.set_source(self.file_map, job.result[0])
+        Art.save_finished(self, job)
+    
+    def init_tiles_from_lists(self):
+        "Build tile data arrays from version 1 frame+layer tile lists."
+        self.init_frame_stacks(self.frames)
+        arrays = read_tile_lists(self.loaded_data)
+        for name, stack in zip(TILE_ARRAY_NAMES, self.get_frame_stacks()):
+            stack.set_array(arrays[name])
+    
     def first_update(self):
         # do nothing on first update during Art.init; we update after loading
         pass
@@ -1168,11 +1582,16 @@ class ArtFromDisk(Art):
 
 class ArtInstance(Art):
     """
-    Deep copy / clone of a source Art that can hold unique changes and be
-    restored to its source.
+    Clone of a source Art that can hold unique changes and be restored to its
+    source. Tile data is shared with source until written to, at which point
+    the written frame is copied.
     """
     update_when_source_changes = True
-    "Set False if you want to manually update this Art."
+    """
+    Set False if you want to manually update this Art. Must be set before
+    restore_from_source, eg in a subclass, as only then do we stop sharing
+    source's tile data.
+    """
     def __init__(self, source):
         self.source = source
         # unique(?) filename
@@ -1181,6 +1600,10 @@ class ArtInstance(Art):
         self.instances = None
         self.char_changed_frames, self.uv_changed_frames = {}, {}
         self.fg_changed_frames, self.bg_changed_frames = {}, {}
+        self.dirty_regions = {}
+        self.restored_properties = None
+        # instances aren't saved, so have nothing to journal
+        self.journal = None
         # init lists that should be retained across refreshes
         self.scripts = []
         self.script_rates = []
@@ -1194,33 +1617,115 @@ class ArtInstance(Art):
     def set_unsaved_changes(self, new_status):
         pass
     
+    def get_source_properties(self):
+        "Return values that, if changed in source, require a full restore."
+        return [getattr(self.source, prop) for prop in ['width', 'height',
+                'charset', 'quad_width', 'quad_height', 'layers', 'frames']]
+    
     def restore_from_source(self):
         "Restore ArtInstance to its source Art's new values."
-        # copy common references/values
-        for prop in ['app', 'width', 'height', 'charset', 'palette',
-                     'quad_width', 'quad_height', 'layers', 'frames']:
-            setattr(self, prop, getattr(self.source, prop))
         # copy lists
         self.layers_z = self.source.layers_z[:]
         self.layers_visibility = self.source.layers_visibility[:]
         self.layer_names = self.source.layer_names[:]
         self.frame_delays = self.source.frame_delays[:]
-        # deep copy tile data lists
-        self.chars, self.fg_colors, self.bg_colors = [], [], []
-        self.uv_mods, self.uv_maps = [], []
-        for frame_chars in self.source.chars:
-            self.chars.append(frame_chars.copy())
-        for frame_uvs in self.source.uv_mods:
-            self.uv_mods.append(frame_uvs.copy())
-        for frame_uv_maps in self.source.uv_maps:
-            self.uv_maps.append(frame_uv_maps.copy())
-        for frame_fg_colors in self.source.fg_colors:
-            self.fg_colors.append(frame_fg_colors.copy())
-        for frame_bg_colors in self.source.bg_colors:
-            self.bg_colors.append(frame_bg_colors.copy())
+        # only copy changes if our dimensions match source's, and we still
+        # share source's data
+        if self.get_source_properties() == self.restored_properties and \
+           all(type(s) is SharedFrameStack and not s.detached
+               for s in self.get_frame_stacks()):
+            self.restore_changes_from_source()
+            return
+        # copy common references/values
+        for prop in ['app', 'width', 'height', 'charset', 'palette',
+                     'quad_width', 'quad_height', 'layers', 'frames']:
+            setattr(self, prop, getattr(self.source, prop))
+        self.restored_properties = self.get_source_properties()
+        # share source's tile data stacks
+        self.chars = SharedFrameStack(lambda: self.source.chars)
+        self.fg_colors = SharedFrameStack(lambda: self.source.fg_colors)
+        self.bg_colors = SharedFrameStack(lambda: self.source.bg_colors)
+        self.uv_maps = SharedFrameStack(lambda: self.source.uv_maps)
+        # manually updated instances mustn't see source's changes
+        if not self.update_when_source_changes:
+            for stack in self.get_frame_stacks():
+                stack.detach()
         self.geo_changed = True
         self.mark_all_frames_changed()
         self.update()
+    
+    def restore_changes_from_source(self):
+        """
+        Drop any unique changes, and mark regions that changed in source
+        this frame as changed here too.
+        """
+        self.palette = self.source.palette
+        for stack in self.get_frame_stacks():
+            # frames with unique changes go back to source's data
+            for frame in stack.revert():
+                self.mark_frame_changed(frame)
+        source = self.source
+        for flags, source_flags in [
+                (self.char_changed_frames, source.char_changed_frames),
+                (self.fg_changed_frames, source.fg_changed_frames),
+                (self.bg_changed_frames, source.bg_changed_frames),
+                (self.uv_changed_frames, source.uv_changed_frames)]:
+            flags.update(source_flags)
+        for frame, regions in source.dirty_regions.items():
+            if regions is None:
+                self.dirty_regions[frame] = None
+                continue
+            for layer, region in regions.items():
+                self.mark_region_changed(frame, layer, *region)
+        self.update()
+
+
+class TileLayerView:
+    """
+    Writable NumPy views of one frame/layer of an Art's tile data, for
+    editing many tiles at once, eg from art scripts:
+    chars, fg_colors, bg_colors and xforms are (height, width) arrays.
+    Call commit() after editing to have the changed tiles redrawn.
+    Views are only valid until the Art's frames, layers or size change.
+    Unlike Art.set_color_at, color indices written here aren't wrapped to
+    the palette's size.
+    """
+    def __init__(self, art, frame, layer):
+        self.art, self.frame, self.layer = art, frame, layer
+        self.chars = art.chars.get_writable(frame)[layer]
+        self.fg_colors = art.fg_colors.get_writable(frame)[layer]
+        self.bg_colors = art.bg_colors.get_writable(frame)[layer]
+        self.xforms = art.uv_maps.get_writable(frame)[layer]
+        # copy of data as of last commit, to find what changed
+        self.committed = [a.copy() for a in self.get_arrays()]
+    
+    def get_arrays(self):
+        return [self.chars, self.fg_colors, self.bg_colors, self.xforms]
+    
+    def commit(self):
+        """
+        Mark all tiles changed since view creation or last commit, so Art
+        updates its renderables. Returns True if anything changed.
+        """
+        art, frame = self.art, self.frame
+        flags = [art.char_changed_frames, art.fg_changed_frames,
+                 art.bg_changed_frames, art.uv_changed_frames]
+        changed = np.zeros(self.chars.shape, dtype=bool)
+        for array, committed, changed_frames in zip(self.get_arrays(),
+                                                    self.committed, flags):
+            array_changed = array != committed
+            if not array_changed.any():
+                continue
+            changed_frames[frame] = True
+            changed |= array_changed
+            committed[:] = array
+        ys, xs = np.nonzero(changed)
+        if len(ys) == 0:
+            return False
+        art.mark_region_changed(frame, self.layer, int(xs.min()),
+                                int(ys.min()), int(xs.max()) + 1,
+                                int(ys.max()) + 1)
+        return True
 
 
 class TileIter:
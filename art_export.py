@@ -1,5 +1,5 @@
 
-import traceback
+import os.path, traceback
 
 from art import ART_DIR
 
@@ -26,8 +26,9 @@ class ArtExporter:
         # add file extension to output filename if not present
         if self.file_extension and not out_filename.endswith('.%s' % self.file_extension):
             out_filename += '.%s' % self.file_extension
-        # output filename in documents/art dir
-        if not out_filename.startswith(self.app.documents_dir + ART_DIR):
+        # output filename in documents/art dir, unless a full path is given
+        if not os.path.isabs(out_filename) and \
+           not out_filename.startswith(self.app.documents_dir + ART_DIR):
             out_filename = self.app.documents_dir + ART_DIR + out_filename
         self.success = False
         "Set True on successful export."
@@ -0,0 +1,165 @@
+import json, shutil, struct, tempfile, zlib
+from operator import itemgetter
+import numpy as np
+
+# version 1 .psci files are JSON, with a dict per tile.
+# version 2+ files are binary: a fixed header (below), then a JSON header
+# describing the art and where its tile data is, then the tile data itself:
+# for each frame, each tile attribute's (layers, height, width) array,
+# packed little-endian and optionally zlib compressed.
+
+PSCI_MAGIC = b'PSCI'
+PSCI_VERSION = 2
+# magic, format version, JSON header length
+FIXED_HEADER = struct.Struct('<4sHI')
+# names of tile data arrays in version 2+ files, matching Art attributes
+TILE_ARRAY_NAMES = ['chars', 'fg_colors', 'bg_colors', 'uv_maps']
+
+def read_art_file(filename):
+    """
+    Return dict of data from given PSCI file, of any version. For version 2+
+    files this is only the header; see read_tile_arrays.
+    """
+    with open(filename, 'rb') as f:
+        start = f.read(FIXED_HEADER.size)
+        if not start.startswith(PSCI_MAGIC):
+            f.seek(0)
+            return json.load(f)
+        magic, version, header_length = FIXED_HEADER.unpack(start)
+        d = json.loads(f.read(header_length).decode('utf-8'))
+    d['version'] = version
+    # tile data block offsets are relative to end of header
+    d['data_offset'] = FIXED_HEADER.size + header_length
+    return d
+
+def read_tile_lists(d):
+    """
+    Return dict of (frames, layers, height, width) int64 tile arrays from
+    given version 1 file's dict of frame+layer tile lists.
+    """
+    frames = d['frames']
+    layers = len(frames[0]['layers'])
+    tiles_shape = (len(frames), layers, d['height'] * d['width'])
+    arrays = {}
+    # tile dict keys for each tile data array
+    keys = ['char', 'fg', 'bg', 'xform']
+    for key, name in zip(keys, TILE_ARRAY_NAMES):
+        array = np.zeros(tiles_shape, dtype=np.int64)
+        get_value = itemgetter(key)
+        for frame_index, frame in enumerate(frames):
+            for layer_index, layer in enumerate(frame['layers']):
+                tiles = layer['tiles']
+                try:
+                    values = np.fromiter(map(get_value, tiles), np.int64,
+                                         len(tiles))
+                except KeyError:
+                    # files from before transforms existed have no xforms;
+                    # 0 is no transform
+                    values = np.fromiter((t.get(key, 0) for t in tiles),
+                                         np.int64, len(tiles))
+                array[frame_index, layer_index, :len(values)] = values
+        # negative indices can't be stored, and display as 0 anyway
+        np.maximum(array, 0, out=array)
+        arrays[name] = array.reshape((len(frames), layers, d['height'],
+                                      d['width']))
+    return arrays
+
+def read_frame_array(data, d, frame_index, name):
+    """
+    Return given frame's (layers, height, width) array of given tile data,
+    from given version 2 file data (bytes or mmap) and header dict d.
+    """
+    offset, length = d['frames'][frame_index]['blocks'][name]
+    offset += d['data_offset']
+    block = data[offset:offset+length]
+    if d.get('compression') == 'zlib':
+        block = zlib.decompress(block)
+    array = np.frombuffer(block, dtype=d['dtypes'][name])
+    return array.reshape((len(d['layers']), d['height'], d['width']))
+
+def read_frame_arrays(data, d, frame_index):
+    "Return dict of all given frame's tile data arrays; see read_frame_array."
+    return {name: read_frame_array(data, d, frame_index, name)
+            for name in d['dtypes']}
+
+def read_tile_arrays(filename, d):
+    """
+    Return dict of (frames, layers, height, width) tile arrays from given
+    version 2 file with given header dict d.
+    """
+    data = open(filename, 'rb').read()
+    frames = [read_frame_arrays(data, d, i) for i in range(len(d['frames']))]
+    return {name: np.array([frame[name] for frame in frames])
+            for name in d['dtypes']}
+
+def write_json_art_file(filename, d, arrays, progress=None):
+    """
+    Write a version 1 PSCI file, with a dict for every tile, from given
+    header dict d and tile arrays as for write_art_file.
+    If given, progress function is called with fraction of frames written.
+    """
+    keys = ['char', 'fg', 'bg', 'xform']
+    frames = []
+    for frame_index, frame in enumerate(d['frames']):
+        layers = []
+        for layer_index, layer in enumerate(d['layers']):
+            values = [arrays[name][frame_index][layer_index].ravel().tolist()
+                      for name in TILE_ARRAY_NAMES]
+            layer = dict(layer)
+            layer['tiles'] = [dict(zip(keys, tile)) for tile in zip(*values)]
+            layers.append(layer)
+        frames.append({'delay': frame['delay'], 'layers': layers})
+        if progress:
+            progress((frame_index + 1) / len(d['frames']))
+    d = dict(d)
+    del d['layers']
+    d['frames'] = frames
+    # MAYBE-TODO: below gives not-so-pretty-printing, find out way to control
+    # formatting for better output
+    with open(filename, 'w') as f:
+        json.dump(d, f, sort_keys=True, indent=1)
+
+def write_tile_blocks(f, d, arrays, compress=True, progress=None):
+    """
+    Write each frame's tile data from given dict of arrays or FrameStacks
+    to given file object, adding its block locations (relative to where we
+    started writing) to header dict d's frame dicts, and dtypes and
+    compression info to d. Frame data is read one frame at a time, so lazily
+    loaded stacks needn't be loaded all at once.
+    If given, progress function is called with fraction of frames written.
+    """
+    dtypes = {name: np.dtype(array.dtype).newbyteorder('<')
+              for name, array in arrays.items()}
+    offset = 0
+    for frame_index, frame in enumerate(d['frames']):
+        frame['blocks'] = {}
+        for name, array in arrays.items():
+            data = np.asarray(array[frame_index]).astype(dtypes[name]).tobytes()
+            if compress:
+                data = zlib.compress(data)
+            frame['blocks'][name] = [offset, len(data)]
+            f.write(data)
+            offset += len(data)
+        if progress:
+            progress((frame_index + 1) / len(d['frames']))
+    d['dtypes'] = {name: dtype.str for name, dtype in dtypes.items()}
+    d['compression'] = 'zlib' if compress else None
+
+def write_art_file(filename, d, arrays, compress=True, progress=None):
+    """
+    Write a version 2 PSCI file with given header dict d, which must have a
+    'frames' list and 'layers' list, and given dict of (frames, layers,
+    height, width) tile arrays, or FrameStacks; see write_tile_blocks.
+    """
+    # header holds block locations, so buffer tile data until it's written
+    blocks_file = tempfile.TemporaryFile()
+    write_tile_blocks(blocks_file, d, arrays, compress, progress)
+    header = json.dumps(d, sort_keys=True).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(FIXED_HEADER.pack(PSCI_MAGIC, PSCI_VERSION, len(header)))
+        f.write(header)
+        blocks_file.seek(0)
+        shutil.copyfileobj(blocks_file, f)
+    blocks_file.close()
+    d['version'] = PSCI_VERSION
+    d['data_offset'] = FIXED_HEADER.size + len(header)
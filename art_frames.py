@@ -0,0 +1,585 @@
+from collections import OrderedDict
+import numpy as np
+
+from art_format import read_frame_array
+
+# frame slots to allocate for a new stack if no capacity given
+DEFAULT_CAPACITY = 4
+
+
+def get_changed_frames(stacks, snapshots):
+    """
+    Return list of frames that any of given stacks has changed since given
+    snapshots of them were taken, or None if frames were added, removed or
+    resized since.
+    """
+    for stack, snapshot in zip(stacks, snapshots):
+        if len(stack) != len(snapshot):
+            return None
+        if len(stack) > 0 and stack[0].shape != snapshot[0].shape:
+            return None
+    changed = []
+    for frame in range(len(stacks[0])):
+        for stack, snapshot in zip(stacks, snapshots):
+            # frames written to since may still hold the same values
+            if not snapshot.is_unchanged(frame) and \
+               not np.array_equal(snapshot[frame], stack[frame]):
+                changed.append(frame)
+                break
+    return changed
+
+
+class FrameStack:
+    """
+    All frames of one tile attribute (eg character indices) of an Art, stored
+    in a single (slots, layers, height, width) array. Frame N's data lives in
+    the slot given by the frame order index, so inserting, deleting and
+    reordering frames only shuffles slot numbers rather than array data.
+    Indexing a FrameStack with a frame number returns a writable view of that
+    frame's (layers, height, width) data, like the per-frame arrays Art used
+    to keep in plain lists.
+    """
+    
+    def __init__(self, frame_shape, dtype, capacity=DEFAULT_CAPACITY):
+        self.frame_shape = tuple(frame_shape)
+        "(layers, height, width) shape of each frame's data."
+        self.dtype = dtype
+        self.data = np.zeros((max(1, capacity),) + self.frame_shape, dtype=dtype)
+        "Backing array of all slots, used or free, in no particular order."
+        self.order = []
+        "Slot index of each frame, in frame order."
+        self.free_slots = list(range(len(self.data) - 1, -1, -1))
+        self.frozen_slots = {}
+        """
+        Slots read by unreleased FrameSnapshots, with snapshot counts; frames
+        written while their slot is frozen are copied to a new slot first.
+        """
+        self.generation = 0
+        "Incremented when set_array replaces all slots."
+    
+    def __len__(self):
+        return len(self.order)
+    
+    def __iter__(self):
+        for slot in self.order:
+            yield self.data[slot]
+    
+    def __getitem__(self, frame):
+        return self.data[self.order[frame]]
+    
+    def __setitem__(self, frame, frame_data):
+        self.get_writable(frame)[:] = frame_data
+    
+    def get_writable(self, frame):
+        "Return given frame's data for writing to."
+        slot = self.order[frame]
+        if slot in self.frozen_slots:
+            # a snapshot is reading this slot, write to a copy instead
+            new_slot = self._alloc_slot()
+            self.data[new_slot] = self.data[slot]
+            self.order[frame] = slot = new_slot
+        return self.data[slot]
+    
+    def get_capacity(self):
+        return len(self.data)
+    
+    def get_nbytes(self):
+        "Return bytes used by frames in use, ie excluding spare capacity."
+        return len(self.order) * self.data[0].nbytes
+    
+    def _grow(self):
+        "Double slot capacity; existing slots keep their indices."
+        old_capacity = len(self.data)
+        new_data = np.zeros((old_capacity * 2,) + self.frame_shape,
+                            dtype=self.dtype)
+        new_data[:old_capacity] = self.data
+        self.data = new_data
+        # hand out lowest new slots first
+        self.free_slots = list(range(old_capacity * 2 - 1, old_capacity - 1, -1)) + self.free_slots
+    
+    def _alloc_slot(self):
+        if len(self.free_slots) == 0:
+            self._grow()
+        return self.free_slots.pop()
+    
+    def insert(self, index, fill_value=0):
+        "Insert a new frame filled with given value at given frame index."
+        slot = self._alloc_slot()
+        self.data[slot] = fill_value
+        self.order.insert(index, slot)
+    
+    def append(self, frame_data):
+        "Add a new frame with a copy of given data to the end of the stack."
+        slot = self._alloc_slot()
+        self.data[slot] = frame_data
+        self.order.append(slot)
+    
+    def duplicate(self, src_index, dest_index):
+        "Insert a copy of frame at given source index at given dest index."
+        src_slot = self.order[src_index]
+        slot = self._alloc_slot()
+        self.data[slot] = self.data[src_slot]
+        self.order.insert(dest_index, slot)
+    
+    def pop(self, index):
+        "Remove frame at given index; its slot is recycled by later inserts."
+        slot = self.order.pop(index)
+        if not slot in self.frozen_slots:
+            self.free_slots.append(slot)
+    
+    def move(self, src_index, dest_index):
+        "Move frame at given index to new given index."
+        self.order.insert(dest_index, self.order.pop(src_index))
+    
+    def get_array(self):
+        "Return a new contiguous (frames, layers, height, width) array."
+        return self.data[self.order]
+    
+    def set_array(self, array):
+        """
+        Replace all frames with given (frames, layers, height, width) array,
+        which may have a different frame shape, eg after a resize.
+        """
+        frames = len(array)
+        self.frame_shape = tuple(array.shape[1:])
+        self.order = list(range(frames))
+        # snapshots keep the old data array, new slots needn't be frozen
+        self.frozen_slots = {}
+        self.generation += 1
+        if frames == 0:
+            self.data = np.zeros((1,) + self.frame_shape, dtype=self.dtype)
+            self.free_slots = [0]
+            return
+        self.data = np.array(array, dtype=self.dtype)
+        self.free_slots = []
+    
+    def copy(self):
+        "Return a compacted deep copy of this stack, eg for undo snapshots."
+        array = self.get_array()
+        new_stack = FrameStack(array.shape[1:], self.dtype, 1)
+        new_stack.set_array(array)
+        return new_stack
+    
+    def get_snapshot(self):
+        """
+        Return a FrameSnapshot of all frames as they are now, without copying
+        them: frames written to later get new slots instead.
+        """
+        for slot in self.order:
+            self.frozen_slots[slot] = self.frozen_slots.get(slot, 0) + 1
+        return FrameSnapshot(self, self.data, list(self.order), self.generation)
+    
+    def release_slots(self, slots, generation):
+        "Unfreeze slots read by a released FrameSnapshot."
+        if generation != self.generation:
+            return
+        used_slots = set(self.order)
+        for slot in slots:
+            self.frozen_slots[slot] -= 1
+            if self.frozen_slots[slot] > 0:
+                continue
+            del self.frozen_slots[slot]
+            # slots of frames deleted or written since can now be reused
+            if not slot in used_slots:
+                self.free_slots.append(slot)
+
+
+class FrameSnapshot:
+    """
+    Read-only frames of a FrameStack at the time the snapshot was taken, eg
+    for saving on another thread while edits continue. Supports len() and
+    indexing by frame like a FrameStack. Release when done with it, from the
+    thread the stack is edited on.
+    """
+    
+    def __init__(self, stack, data, order, generation=0):
+        self.stack = stack
+        "Stack we froze slots of, or None if data is a copy."
+        self.data, self.order = data, order
+        self.dtype = data.dtype
+        self.generation = generation
+    
+    def __len__(self):
+        return len(self.order)
+    
+    def __getitem__(self, frame):
+        return self.data[self.order[frame]]
+    
+    def is_unchanged(self, frame):
+        """
+        Return True if given frame of our stack is still the data we read,
+        ie it hasn't been written to, moved or replaced since.
+        """
+        stack = self.stack
+        return stack is not None and stack.generation == self.generation and \
+            frame < len(stack) and stack.order[frame] == self.order[frame]
+    
+    def release(self):
+        if self.stack:
+            self.stack.release_slots(self.order, self.generation)
+            self.stack = None
+
+
+class SharedFrameStack(FrameStack):
+    """
+    Copy-on-write FrameStack that reads another Art's stack, eg an
+    ArtInstance's view of its source Art's data. Frames are shared read-only
+    until written via get_writable, which makes a private copy of just that
+    frame. Structural changes (inserting, deleting, moving frames or
+    resizing) detach the whole stack into an ordinary private FrameStack.
+    """
+    
+    def __init__(self, get_source):
+        self.get_source = get_source
+        "Function returning source FrameStack; source Art may replace it."
+        self.dtype = get_source().dtype
+        self.private_frames = {}
+        "Private copies of frames written to, by frame index."
+        self.detached = False
+        self.frozen_slots = {}
+        self.generation = 0
+    
+    def __len__(self):
+        if self.detached:
+            return FrameStack.__len__(self)
+        return len(self.get_source())
+    
+    def __iter__(self):
+        for frame in range(len(self)):
+            yield self[frame]
+    
+    def __getitem__(self, frame):
+        if self.detached:
+            return FrameStack.__getitem__(self, frame)
+        if frame < 0:
+            frame += len(self)
+        if frame in self.private_frames:
+            return self.private_frames[frame]
+        # read-only view, so that stray writes can't change source
+        frame_data = self.get_source()[frame].view()
+        frame_data.flags.writeable = False
+        return frame_data
+    
+    def __setitem__(self, frame, frame_data):
+        if not self.detached:
+            if frame < 0:
+                frame += len(self)
+            # share source's data again rather than keep a copy of it
+            if np.array_equal(frame_data, self.get_source()[frame]):
+                self.private_frames.pop(frame, None)
+                return
+        self.get_writable(frame)[:] = frame_data
+    
+    def get_writable(self, frame):
+        if self.detached:
+            return FrameStack.get_writable(self, frame)
+        if frame < 0:
+            frame += len(self)
+        if not frame in self.private_frames:
+            self.private_frames[frame] = self.get_source()[frame].copy()
+        return self.private_frames[frame]
+    
+    def is_shared(self, frame):
+        "Return True if given frame's data is still source's."
+        return not self.detached and not frame in self.private_frames
+    
+    def revert(self):
+        """
+        Drop all private data and share source's again. Returns list of
+        frames that had private copies, or None if whole stack was detached.
+        """
+        reverted = None if self.detached else list(self.private_frames.keys())
+        self.private_frames = {}
+        self.detached = False
+        return reverted
+    
+    def detach(self):
+        "Copy all frames into private storage, to allow structural changes."
+        if self.detached:
+            return
+        self.set_array(self.get_array())
+    
+    def get_capacity(self):
+        if self.detached:
+            return FrameStack.get_capacity(self)
+        return len(self.private_frames)
+    
+    def get_snapshot(self):
+        if self.detached:
+            return FrameStack.get_snapshot(self)
+        # source's frames aren't ours to freeze, so copy
+        array = self.get_array()
+        return FrameSnapshot(None, array, list(range(len(array))))
+    
+    def get_nbytes(self):
+        "Return bytes used by private frames, ie not shared with source."
+        if self.detached:
+            return FrameStack.get_nbytes(self)
+        return sum(f.nbytes for f in self.private_frames.values())
+    
+    def get_array(self):
+        if self.detached:
+            return FrameStack.get_array(self)
+        source = self.get_source()
+        array = source.get_array()
+        for frame, frame_data in self.private_frames.items():
+            array[frame] = frame_data
+        return array
+    
+    def set_array(self, array):
+        self.detached = True
+        self.private_frames = {}
+        FrameStack.set_array(self, array)
+    
+    def insert(self, index, fill_value=0):
+        self.detach()
+        FrameStack.insert(self, index, fill_value)
+    
+    def append(self, frame_data):
+        self.detach()
+        FrameStack.append(self, frame_data)
+    
+    def duplicate(self, src_index, dest_index):
+        self.detach()
+        FrameStack.duplicate(self, src_index, dest_index)
+    
+    def pop(self, index):
+        self.detach()
+        FrameStack.pop(self, index)
+    
+    def move(self, src_index, dest_index):
+        self.detach()
+        FrameStack.move(self, src_index, dest_index)
+
+
+class FrameMemoryBudget:
+    """
+    Tracks frames loaded by LazyFrameStacks, in least to most recently used
+    order, and unloads the least recently used unchanged ("clean") frames
+    when the total loaded exceeds a cap. Several stacks can share a budget,
+    eg all of one Art's tile attributes.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.loaded = OrderedDict()
+        "LazyFrames with loaded data, least recently used first."
+        self.total_bytes = 0
+    
+    def add(self, lazy_frame):
+        self.loaded[lazy_frame] = lazy_frame.data.nbytes
+        self.total_bytes += lazy_frame.data.nbytes
+        self.evict()
+    
+    def touch(self, lazy_frame):
+        self.loaded.move_to_end(lazy_frame)
+    
+    def remove(self, lazy_frame):
+        if lazy_frame in self.loaded:
+            self.total_bytes -= self.loaded.pop(lazy_frame)
+    
+    def evict(self):
+        "Unload least recently used clean frames until we're under our cap."
+        # never evict most recently used frame, it's likely about to be read
+        for lazy_frame in list(self.loaded.keys())[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if lazy_frame.dirty:
+                continue
+            lazy_frame.data = None
+            self.remove(lazy_frame)
+
+
+class LazyFrame:
+    "One frame of a LazyFrameStack: location of its data on disk and/or in memory."
+    
+    def __init__(self, block_frame, data=None, dirty=False):
+        self.block_frame = block_frame
+        "Frame index of our data in source file, or None if we have none there."
+        self.data = data
+        "Loaded (layers, height, width) array, or None if not loaded."
+        self.dirty = dirty
+        "True if data differs from source file, and so can't be unloaded."
+        self.frozen = 0
+        "Number of unreleased LazyFrameSnapshots reading us."
+
+
+class LazyFrameStack(FrameStack):
+    """
+    FrameStack that reads frames from a version 2 PSCI file's data (usually a
+    memory map) only when they're used, eg when a frame becomes active or is
+    rendered. Loaded frames are read-only until written via get_writable,
+    after which they stay loaded; others may be unloaded by the given
+    FrameMemoryBudget, and are read back from file when next needed.
+    """
+    
+    def __init__(self, source, header, name, dtype, budget):
+        self.dtype = dtype
+        self.name = name
+        "Name of our tile data in file, eg 'chars'."
+        self.budget = budget
+        self.frame_shape = (len(header['layers']), header['height'],
+                            header['width'])
+        self.frames = []
+        self.set_source(source, header)
+    
+    def set_source(self, source, header):
+        """
+        Read from given file data and header from now on. Used after loading
+        and after saving; all frames are then clean, in file frame order.
+        """
+        self.source, self.header = source, header
+        if len(self.frames) != len(header['frames']):
+            for lazy_frame in self.frames:
+                self.budget.remove(lazy_frame)
+            self.frames = [LazyFrame(i) for i in range(len(header['frames']))]
+        for i, lazy_frame in enumerate(self.frames):
+            lazy_frame.block_frame = i
+            lazy_frame.dirty = False
+            if lazy_frame.data is not None:
+                lazy_frame.data.flags.writeable = False
+        self.budget.evict()
+    
+    def __len__(self):
+        return len(self.frames)
+    
+    def __iter__(self):
+        for frame in range(len(self)):
+            yield self[frame]
+    
+    def __getitem__(self, frame):
+        lazy_frame = self.frames[frame]
+        if lazy_frame.data is not None:
+            self.budget.touch(lazy_frame)
+            return lazy_frame.data
+        return self.load(lazy_frame)
+    
+    def load(self, lazy_frame):
+        "Read given LazyFrame's data from source file."
+        data = read_frame_array(self.source, self.header,
+                                lazy_frame.block_frame, self.name)
+        # frombuffer arrays are read-only; copy so a write can reuse it
+        lazy_frame.data = data.astype(self.dtype)
+        lazy_frame.data.flags.writeable = False
+        self.budget.add(lazy_frame)
+        return lazy_frame.data
+    
+    def __setitem__(self, frame, frame_data):
+        self.get_writable(frame)[:] = frame_data
+    
+    def get_writable(self, frame):
+        data = self[frame]
+        lazy_frame = self.frames[frame]
+        if lazy_frame.frozen:
+            # a snapshot is reading this frame, write to a copy instead
+            self.remove(lazy_frame)
+            lazy_frame = LazyFrame(None, data.copy(), True)
+            self.frames[frame] = lazy_frame
+            self.budget.add(lazy_frame)
+            return lazy_frame.data
+        if not lazy_frame.dirty:
+            lazy_frame.dirty = True
+            data.flags.writeable = True
+        return data
+    
+    def is_loaded(self, frame):
+        return self.frames[frame].data is not None
+    
+    def get_capacity(self):
+        return len(self.frames)
+    
+    def get_nbytes(self):
+        "Return bytes used by loaded frames."
+        return sum(f.data.nbytes for f in self.frames if f.data is not None)
+    
+    def _add_frame(self, index, data):
+        lazy_frame = LazyFrame(None, data, True)
+        self.frames.insert(index, lazy_frame)
+        self.budget.add(lazy_frame)
+    
+    def remove(self, lazy_frame):
+        """
+        Stop tracking given LazyFrame, which we no longer use. Snapshots
+        reading it keep its data loaded, as its place in the source file may
+        not be known after later saves.
+        """
+        if lazy_frame.frozen and lazy_frame.data is None:
+            self.load(lazy_frame)
+        self.budget.remove(lazy_frame)
+    
+    def insert(self, index, fill_value=0):
+        self._add_frame(index, np.full(self.frame_shape, fill_value,
+                                       dtype=self.dtype))
+    
+    def append(self, frame_data):
+        self._add_frame(len(self.frames), np.array(frame_data, dtype=self.dtype))
+    
+    def duplicate(self, src_index, dest_index):
+        self._add_frame(dest_index, self[src_index].copy())
+    
+    def pop(self, index):
+        self.remove(self.frames.pop(index))
+    
+    def move(self, src_index, dest_index):
+        self.frames.insert(dest_index, self.frames.pop(src_index))
+    
+    def get_snapshot(self):
+        """
+        Return a LazyFrameSnapshot of all frames as they are now. Frames not
+        yet loaded are read from file, so saves of lazily loaded art read it
+        in the foreground rather than in the background.
+        """
+        for lazy_frame in self.frames:
+            lazy_frame.frozen += 1
+        return LazyFrameSnapshot(self, list(self.frames))
+    
+    def get_array(self):
+        array = np.zeros((len(self.frames),) + self.frame_shape, dtype=self.dtype)
+        for frame in range(len(self.frames)):
+            array[frame] = self[frame]
+        return array
+    
+    def set_array(self, array):
+        # new data isn't in source file, so all frames stay loaded
+        for lazy_frame in self.frames:
+            self.remove(lazy_frame)
+        self.frame_shape = tuple(array.shape[1:])
+        self.frames = []
+        for frame_data in array:
+            self._add_frame(len(self.frames), np.array(frame_data, dtype=self.dtype))
+
+
+class LazyFrameSnapshot:
+    """
+    Read-only frames of a LazyFrameStack at the time the snapshot was taken.
+    Frames written to since are copies, see LazyFrameStack.get_writable.
+    Supports len() and indexing by frame like a FrameSnapshot.
+    """
+    
+    def __init__(self, stack, frames):
+        self.stack = stack
+        self.frames = frames
+        "LazyFrames of stack when snapshot was taken, in frame order."
+        self.dtype = stack.dtype
+    
+    def __len__(self):
+        return len(self.frames)
+    
+    def __getitem__(self, frame):
+        lazy_frame = self.frames[frame]
+        if lazy_frame.data is not None:
+            return lazy_frame.data
+        # frames we read that stack no longer uses are always loaded
+        return self.stack.load(lazy_frame)
+    
+    def is_unchanged(self, frame):
+        "Return True if given frame of our stack is still the data we read."
+        return self.stack is not None and frame < len(self.stack) and \
+            self.stack.frames[frame] is self.frames[frame]
+    
+    def release(self):
+        if not self.stack:
+            return
+        for lazy_frame in self.frames:
+            lazy_frame.frozen -= 1
+        self.stack = None
@@ -0,0 +1,154 @@
+import json, os, threading, time, traceback
+from collections import deque
+
+from art_format import read_art_file
+from art import get_thumbnail_key
+
+ART_INDEX_FILENAME = 'art_index.json'
+# bump when entry contents change, to discard indices from older versions
+ART_INDEX_VERSION = 2
+
+def get_file_key(filename):
+    "Return (mtime, size) of given file, which change when it's written."
+    stat = os.stat(filename)
+    return stat.st_mtime, stat.st_size
+
+def read_art_metadata(filename):
+    "Return dict of given art file's high level stats, as shown in art chooser."
+    d = read_art_file(filename)
+    # version 2+ files list layers once, version 1 files for each frame
+    if 'layers' in d:
+        layers = len(d['layers'])
+    else:
+        layers = len(d['frames'][0]['layers'])
+    return {'width': d['width'], 'height': d['height'],
+            'frames': len(d['frames']), 'layers': layers,
+            'charset': d['charset'], 'palette': d['palette']}
+
+
+class ArtIndexLord:
+    """
+    Index of art files' metadata and thumbnail keys, saved in cache dir so
+    the art chooser needn't read every file it lists. Entries are keyed by
+    filename and valid while the file's mtime and size are unchanged; a
+    worker thread reads files whose entries are missing or out of date.
+    """
+    save_delay = 2
+    "Seconds after index last changed to write it to disk"
+    
+    def __init__(self, app):
+        self.app = app
+        self.filename = app.cache_dir + ART_INDEX_FILENAME
+        self.entries = {}
+        "Metadata dicts by filename, with the 'mtime' and 'size' they're for."
+        self.generation = 0
+        "Incremented when entries change, so views know to refresh."
+        self.pending = deque()
+        "Filenames for worker to read, in order."
+        self.condition = threading.Condition()
+        self.results = deque()
+        "(filename, entry) read by worker, applied to entries in update()."
+        self.thread = None
+        self.dirty = False
+        self.last_change_time = 0
+        self.load()
+    
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            d = json.load(open(self.filename))
+        except:
+            self.app.log('Error reading art index %s, rebuilding it' % self.filename)
+            return
+        if d.get('version') == ART_INDEX_VERSION:
+            self.entries = d['entries']
+    
+    def save(self):
+        d = {'version': ART_INDEX_VERSION, 'entries': self.entries}
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            json.dump(d, f)
+        os.replace(temp_filename, self.filename)
+        self.dirty = False
+    
+    def get_entry(self, filename):
+        """
+        Return given art file's metadata if index has it up to date, else
+        None; in that case it's read as soon as possible.
+        """
+        try:
+            mtime, size = get_file_key(filename)
+        except OSError:
+            return None
+        entry = self.entries.get(filename)
+        if entry and entry['mtime'] == mtime and entry['size'] == size:
+            return entry
+        self.scan([filename], True)
+        return None
+    
+    def scan(self, filenames, first=False):
+        """
+        Queue given art files to be read if not already indexed, at front
+        of queue if first is True, eg for file selected in chooser.
+        """
+        with self.condition:
+            for filename in filenames:
+                if filename in self.pending:
+                    self.pending.remove(filename)
+                if first:
+                    self.pending.appendleft(filename)
+                else:
+                    self.pending.append(filename)
+            self.condition.notify()
+        if not self.thread:
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+    
+    def worker(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                filename = self.pending.popleft()
+            if filename is None:
+                break
+            try:
+                mtime, size = get_file_key(filename)
+            except OSError:
+                continue
+            # entries only change on main thread, reading is safe
+            entry = self.entries.get(filename)
+            if entry and entry['mtime'] == mtime and entry['size'] == size:
+                continue
+            try:
+                entry = read_art_metadata(filename)
+            except:
+                # don't retry an unreadable file until it changes
+                entry = {'error': traceback.format_exc().splitlines()[-1]}
+            entry['mtime'], entry['size'] = mtime, size
+            entry['thumbnail'] = get_thumbnail_key(filename, mtime, size)
+            self.results.append((filename, entry))
+    
+    def update(self):
+        "Add entries read by worker to index, save index when it settles."
+        while len(self.results) > 0:
+            filename, entry = self.results.popleft()
+            self.entries[filename] = entry
+            self.generation += 1
+            self.dirty = True
+            self.last_change_time = time.time()
+        if self.dirty and len(self.pending) == 0 and \
+           time.time() - self.last_change_time > self.save_delay:
+            self.save()
+    
+    def destroy(self):
+        if self.thread:
+            with self.condition:
+                self.pending.clear()
+                self.pending.append(None)
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+        if self.dirty:
+            self.save()
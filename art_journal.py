@@ -0,0 +1,226 @@
+import io, json, os, struct, time
+import numpy as np
+
+from art_format import TILE_ARRAY_NAMES, read_frame_array, write_tile_blocks
+from edit_command import EditCommand, EntireArtCommand
+
+# a journal is a sequence of records, each a fixed header (below), then a
+# JSON header, then a payload:
+# - TILE: (tiles, 8) int32 array of frame, layer, x, y, char, fg, bg, xform
+# - FRAM: tile data of some frames, stored as in version 2 PSCI files
+# - ART: entire art, header + tile data as in a version 2 PSCI file
+# records are only appended, so a crash can at worst truncate the last one.
+
+JOURNAL_FILE_EXTENSION = 'journal'
+# record kind, JSON header length, payload length
+RECORD_HEADER = struct.Struct('<4sII')
+TILE_DTYPE = np.dtype('<i4')
+
+def get_journal_filename(art_filename):
+    return '%s.%s' % (art_filename, JOURNAL_FILE_EXTENSION)
+
+def read_journal(filename):
+    "Return list of (kind, header dict, payload bytes) from given journal."
+    records = []
+    data = open(filename, 'rb').read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, header_length, payload_length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        end = offset + header_length + payload_length
+        # stop at a record cut off by a crash mid-write
+        if end > len(data):
+            break
+        header = json.loads(data[offset:offset+header_length].decode('utf-8'))
+        # payload block offsets are relative to payload start
+        header['data_offset'] = 0
+        records.append((kind, header, data[offset+header_length:end]))
+        offset = end
+    return records
+
+def get_latest_art_record(records):
+    """
+    Return (header, arrays) of given records' last ART record, ie the whole
+    art as of that point, and list of records after it; or None and all
+    records if there is no ART record.
+    """
+    for i in range(len(records) - 1, -1, -1):
+        kind, header, payload = records[i]
+        if kind != b'ART ':
+            continue
+        frames = range(len(header['frames']))
+        arrays = {name: np.array([read_frame_array(payload, header, f, name)
+                                  for f in frames])
+                  for name in header['dtypes']}
+        return (header, arrays), records[i+1:]
+    return None, records
+
+def apply_records(art, records):
+    "Apply given TILE and FRAM journal records to given Art."
+    stacks = dict(zip(TILE_ARRAY_NAMES, art.get_frame_stacks()))
+    for kind, header, payload in records:
+        if kind == b'TILE':
+            tiles = np.frombuffer(payload, dtype=TILE_DTYPE).reshape((-1, 8))
+            for frame in np.unique(tiles[:, 0]):
+                frame_tiles = tiles[tiles[:, 0] == frame]
+                layers, xs, ys = frame_tiles[:, 1], frame_tiles[:, 2], frame_tiles[:, 3]
+                for i, stack in enumerate(stacks.values()):
+                    stack.get_writable(frame)[layers, ys, xs] = frame_tiles[:, 4 + i]
+        elif kind == b'FRAM':
+            for i, frame in enumerate(header['frames']):
+                for name, stack in stacks.items():
+                    data = read_frame_array(payload, header, i, name)
+                    stack.get_writable(frame['index'])[:] = data
+    art.mark_all_frames_changed()
+
+
+class ArtJournal:
+    """
+    Append-only log of an Art's committed edits (and undos/redos) since it
+    was last saved, kept in a file next to it. If Playscii quits without
+    saving, eg crashes, loading the art replays the journal.
+    Saving the art compacts the journal, removing records that are now in
+    the art file.
+    """
+    compact_idle_seconds = 60
+    "Save art (compacting its journal) after this long with no edits..."
+    compact_min_bytes = 4 * 1024 * 1024
+    "...if its journal is at least this big"
+    
+    def __init__(self, art):
+        self.art = art
+        self.filename = get_journal_filename(art.filename)
+        self.file = None
+        # art structure as of last record, changes mean we need an ART record
+        self.structure = self.get_structure()
+        self.last_record_time = time.time()
+    
+    def get_structure(self):
+        "Return everything about art other than its tiles' contents."
+        art = self.art
+        return (art.width, art.height, art.frames, art.layers,
+                tuple(art.frame_delays), tuple(art.layers_z),
+                tuple(art.layers_visibility), tuple(art.layer_names),
+                art.charset.name, art.palette.name)
+    
+    def get_size(self):
+        if self.file:
+            return self.file.tell()
+        elif os.path.exists(self.filename):
+            return os.path.getsize(self.filename)
+        return 0
+    
+    def write_record(self, kind, header, payload):
+        if not self.file:
+            self.file = open(self.filename, 'ab')
+        header = json.dumps(header, sort_keys=True).encode('utf-8')
+        self.file.write(RECORD_HEADER.pack(kind, len(header), len(payload)))
+        self.file.write(header)
+        self.file.write(payload)
+        # write through to OS now, in case we crash before next record
+        self.file.flush()
+        self.last_record_time = time.time()
+    
+    def add_command(self, command):
+        "Record given command's effect, after it's applied or undone."
+        # cursor might be hovering, keep its preview edits out of journal
+        preview_edits = self.art.app.cursor.preview_edits
+        for edit in preview_edits:
+            edit.undo()
+        structure = self.get_structure()
+        if structure != self.structure:
+            self.structure = structure
+            self.write_art_record()
+        elif isinstance(command, EditCommand):
+            self.write_tile_record(command)
+        elif isinstance(command, EntireArtCommand):
+            self.write_frames_record(command)
+        for edit in preview_edits:
+            edit.apply()
+    
+    def write_tile_record(self, command):
+        tiles = []
+        for frame, layers in command.tile_commands.items():
+            for layer, rows in layers.items():
+                for y, columns in rows.items():
+                    for x in columns.keys():
+                        tiles.append((frame, layer, x, y))
+        if len(tiles) == 0:
+            return
+        tiles = np.array(tiles, dtype=TILE_DTYPE)
+        # record tiles as they are now, rather than command's before/after
+        # values, as tools may not have changed all of a tile's attributes
+        values = [self.art.get_tile_at(*tile) for tile in tiles.tolist()]
+        tiles = np.hstack([tiles, np.array(values, dtype=TILE_DTYPE)])
+        self.write_record(b'TILE', {'count': len(tiles)}, tiles.tobytes())
+    
+    def write_frames_record(self, command):
+        # only record frames that command changed
+        changed = command.changed_frames
+        if changed is None:
+            changed = range(self.art.frames)
+        if len(changed) == 0:
+            return
+        stacks = self.art.get_frame_stacks()
+        arrays = {name: np.array([stack[frame] for frame in changed])
+                  for name, stack in zip(TILE_ARRAY_NAMES, stacks)}
+        header = self.get_tile_header()
+        header['frames'] = [{'index': frame} for frame in changed]
+        self.write_tile_record_blocks(b'FRAM', header, arrays)
+    
+    def write_art_record(self):
+        header = self.get_tile_header()
+        header.update(self.art.get_file_properties())
+        header['frames'] = [{'delay': delay} for delay in self.art.frame_delays]
+        header['layers'] = self.art.get_layer_properties()
+        arrays = dict(zip(TILE_ARRAY_NAMES, self.art.get_frame_stacks()))
+        self.write_tile_record_blocks(b'ART ', header, arrays)
+    
+    def get_tile_header(self):
+        return {'width': self.art.width, 'height': self.art.height,
+                'layers': [{} for i in range(self.art.layers)]}
+    
+    def write_tile_record_blocks(self, kind, header, arrays):
+        payload = io.BytesIO()
+        write_tile_blocks(payload, header, arrays)
+        self.write_record(kind, header, payload.getvalue())
+    
+    def get_mark(self):
+        "Return position up to which a save started now will include records."
+        return (self.filename, self.get_size())
+    
+    def compact(self, mark):
+        """
+        Remove records before given mark, which are now in saved art file.
+        """
+        filename, size = mark
+        self.close()
+        # keep records made while saving
+        data = b''
+        if os.path.exists(filename):
+            data = open(filename, 'rb').read()[size:]
+            os.remove(filename)
+        # art may have been saved under a new name
+        self.filename = get_journal_filename(self.art.filename)
+        if len(data) > 0:
+            with open(self.filename + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(self.filename + '.tmp', self.filename)
+        elif os.path.exists(self.filename):
+            os.remove(self.filename)
+    
+    def should_compact(self):
+        return self.get_size() >= self.compact_min_bytes and \
+            time.time() - self.last_record_time >= self.compact_idle_seconds
+    
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    def discard(self):
+        "Delete journal, eg when art's unsaved changes are discarded."
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.structure = self.get_structure()
@@ -0,0 +1,157 @@
+import numpy as np
+from PIL import Image
+
+from art import uv_type_table
+
+# software (NumPy) equivalent of rendering art through renderable_v/f.glsl
+# for export: each visible layer's tiles are composited in Z order, with
+# the same fg/bg/transparency rules and alpha blending as the GL path.
+# needs no GL context, so works headless, off the main thread, and at any
+# size; output should match GL's to within rounding.
+
+# (char image filename, last change time): glyph pixel array
+glyph_cache = {}
+# (char width, char height): per-transform glyph pixel index maps
+xform_map_cache = {}
+
+def get_glyph_pixels(charset):
+    """
+    Return (characters, char height * char width, RGBA) float32 array of
+    given CharacterSet's glyphs, from its image data.
+    """
+    key = (charset.image_filename, charset.last_image_change)
+    if key in glyph_cache:
+        return glyph_cache[key]
+    cw, ch = charset.char_width, charset.char_height
+    mw, mh = charset.map_width, charset.map_height
+    img = np.asarray(charset.image_data.convert('RGBA'), dtype=np.float32)
+    img = img[:mh*ch, :mw*cw] / 255
+    glyphs = img.reshape((mh, ch, mw, cw, 4)).transpose((0, 2, 1, 3, 4))
+    glyphs = np.ascontiguousarray(glyphs.reshape((mh * mw, ch * cw, 4)))
+    glyph_cache[key] = glyphs
+    return glyphs
+
+def get_xform_maps(char_width, char_height):
+    """
+    Return (transforms, char height, char width) array of which glyph pixel
+    each pixel of a tile shows, for each char transform.
+    """
+    key = (char_width, char_height)
+    if key in xform_map_cache:
+        return xform_map_cache[key]
+    # sample at pixel centers, as GL does
+    s = (np.arange(char_width) + 0.5) / char_width
+    t = (np.arange(char_height) + 0.5) / char_height
+    s, t = s[np.newaxis, :], t[:, np.newaxis]
+    maps = []
+    for uvs in uv_type_table:
+        # UV mods at top left, top right and bottom left corners, which
+        # define the (affine) mapping from tile to glyph
+        u0, v0, u1, v1, u2, v2 = uvs[:6]
+        u = u0 + s * (u1 - u0) + t * (u2 - u0)
+        v = v0 + s * (v1 - v0) + t * (v2 - v0)
+        x = np.clip(np.floor(u * char_width), 0, char_width - 1).astype(np.intp)
+        y = np.clip(np.floor(v * char_height), 0, char_height - 1).astype(np.intp)
+        maps.append(y * char_width + x)
+    maps = np.array(maps)
+    xform_map_cache[key] = maps
+    return maps
+
+def get_palette_colors(palette, max_index):
+    "Return (colors, RGBA) float32 array covering given max color index."
+    colors = np.zeros((max(len(palette.colors), max_index + 1), 4),
+                      dtype=np.float32)
+    colors[:len(palette.colors)] = np.array(palette.colors) / 255
+    return colors
+
+def render_tiles(charset, palette, chars, fg_colors, bg_colors, uv_maps,
+                 bg_color=(0, 0, 0, 0), bg_alpha=1.):
+    """
+    Return (height, width, RGBA) float32 array of given (layers, height,
+    width) tile data composited over bg_color, first layer first.
+    """
+    layers, height, width = chars.shape
+    cw, ch = charset.char_width, charset.char_height
+    glyphs = get_glyph_pixels(charset)
+    maps = get_xform_maps(cw, ch)
+    colors = get_palette_colors(palette, int(max(fg_colors.max(initial=0),
+                                                 bg_colors.max(initial=0))))
+    out = np.empty((height, width, ch, cw, 4), dtype=np.float32)
+    out[:] = bg_color or (0, 0, 0, 0)
+    for layer in range(layers):
+        # out-of-range chars sample the last glyph
+        char = np.minimum(chars[layer], len(glyphs) - 1)
+        xform = np.minimum(uv_maps[layer], len(maps) - 1)
+        # (height, width, ch, cw, RGBA) glyph pixels
+        glyph = glyphs[char[:, :, np.newaxis, np.newaxis], maps[xform]]
+        glyph_a = glyph[..., 3:]
+        fg = colors[fg_colors[layer]][:, :, np.newaxis, np.newaxis]
+        bg = colors[bg_colors[layer]][:, :, np.newaxis, np.newaxis]
+        fg_zero = (fg_colors[layer] == 0)[:, :, np.newaxis, np.newaxis, np.newaxis]
+        bg_zero = (bg_colors[layer] == 0)[:, :, np.newaxis, np.newaxis, np.newaxis]
+        # fg + bg: glyph tinted by fg, over bg
+        rgb = bg[..., :3] * (1 - glyph_a) + glyph[..., :3] * fg[..., :3] * glyph_a
+        a = bg[..., 3:] * bg_alpha * (1 - glyph_a) + glyph_a * glyph_a
+        # no fg: bg with glyph cut out of it
+        rgb = np.where(fg_zero, bg[..., :3], rgb)
+        a = np.where(fg_zero, (1 - glyph_a) * bg_alpha, a)
+        # no fg or bg: nothing
+        a = np.where(fg_zero & bg_zero, 0, a)
+        # blend over what's drawn so far, as glBlendFunc(SRC_ALPHA,
+        # ONE_MINUS_SRC_ALPHA) does; alpha is blended the same way
+        out[..., :3] = rgb * a + out[..., :3] * (1 - a)
+        out[..., 3:] = a * a + out[..., 3:] * (1 - a)
+    out = out.transpose((0, 2, 1, 3, 4))
+    return out.reshape((height * ch, width * cw, 4))
+
+def render_tile_indices(charset, chars, fg_colors, bg_colors, uv_maps):
+    """
+    Return (height, width) array of palette indices of given (layers,
+    height, width) tile data composited, first layer first, 0 where
+    transparent; for indexed formats, eg GIF. Glyph pixels are on or off
+    (at half alpha) and colors opaque, so it can differ from render_tiles
+    where they aren't.
+    """
+    layers, height, width = chars.shape
+    cw, ch = charset.char_width, charset.char_height
+    glyphs = get_glyph_pixels(charset)[..., 3] >= 0.5
+    maps = get_xform_maps(cw, ch)
+    out = np.zeros((height, width, ch, cw), dtype=fg_colors.dtype)
+    for layer in range(layers):
+        char = np.minimum(chars[layer], len(glyphs) - 1)
+        xform = np.minimum(uv_maps[layer], len(maps) - 1)
+        glyph = glyphs[char[:, :, np.newaxis, np.newaxis], maps[xform]]
+        # fg 0 cuts glyph out of bg, bg 0 shows through around glyph
+        index = np.where(glyph, fg_colors[layer][:, :, np.newaxis, np.newaxis],
+                         bg_colors[layer][:, :, np.newaxis, np.newaxis])
+        out = np.where(index != 0, index, out)
+    out = out.transpose((0, 2, 1, 3))
+    return out.reshape((height * ch, width * cw))
+
+def get_layer_order(art, show_hidden=False):
+    "Return indices of given Art's layers to render, in Z order."
+    layers = sorted(range(art.layers), key=lambda i: art.layers_z[i])
+    if show_hidden:
+        return layers
+    return [i for i in layers if art.layers_visibility[i]]
+
+def get_image(pixels, scale=1):
+    "Return RGBA PIL Image of given float pixel array, scaled if needed."
+    pixels = np.round(np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+    img = Image.fromarray(pixels, 'RGBA')
+    if scale != 1:
+        w, h = img.size
+        img = img.resize((int(w * scale), int(h * scale)),
+                         resample=Image.NEAREST)
+    return img
+
+def get_frame_image(art, frame, scale=1, bg_color=(0, 0, 0, 0),
+                    show_hidden=False):
+    """
+    Return a PIL image of given frame of given Art, like
+    image_export.get_frame_image without CRT, rendered in software.
+    """
+    layers = get_layer_order(art, show_hidden)
+    stacks = [np.asarray(stack[frame])[layers] for stack in art.get_frame_stacks()]
+    pixels = render_tiles(art.charset, art.palette, *stacks, bg_color)
+    return get_image(pixels, scale)
@@ -0,0 +1,132 @@
+import os, queue, threading, traceback
+
+
+class SaveJob:
+    "A file being saved, with the functions that write it and handle results."
+    
+    def __init__(self, filename, write_function, done_function=None,
+                 progress_function=None):
+        self.filename = filename
+        self.write_function = write_function
+        """
+        Called with temp filename to write to, and a function to report
+        fractional progress to; return value is saved as result.
+        """
+        self.done_function = done_function
+        "Called with this job on main thread when save finishes or fails."
+        self.progress_function = progress_function
+        "Called with this job and progress fraction on main thread."
+        self.result = None
+        self.error = None
+        "Traceback string if save failed."
+    
+    def run(self, report_progress):
+        """
+        Write our file to a temp file, then replace any existing file with
+        it, so that a failed or interrupted save never leaves a partial file.
+        """
+        temp_filename = self.filename + '.tmp'
+        try:
+            self.result = self.write_function(temp_filename, report_progress)
+            os.replace(temp_filename, self.filename)
+        except:
+            self.error = traceback.format_exc()
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+
+class SaveLord:
+    """
+    Writes files on a worker thread so that saving doesn't stall the UI.
+    Write functions must only read data that won't change during the save,
+    eg snapshots. Progress and done functions happen on the main thread
+    during update().
+    """
+    save_in_background = True
+    "If False, saves happen immediately and block until done"
+    
+    def __init__(self, app):
+        self.app = app
+        self.jobs = queue.Queue()
+        "Jobs for worker thread to write, in order queued."
+        self.events = queue.Queue()
+        "(job, progress) from worker, progress None when job is done."
+        self.pending_jobs = []
+        "Jobs queued or being written, whose done functions haven't run."
+        self.thread = None
+    
+    def save(self, filename, write_function, done_function=None,
+             progress_function=None, background=True):
+        "Save given file with given SaveJob functions, return the SaveJob."
+        job = SaveJob(filename, write_function, done_function,
+                      progress_function)
+        self.pending_jobs.append(job)
+        if not background or not self.save_in_background:
+            # pending saves of same file must finish first
+            self.wait(filename, job)
+            job.run(lambda progress: self.report_progress(job, progress))
+            self.finish_job(job)
+            return job
+        if not self.thread:
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+        self.jobs.put(job)
+        return job
+    
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            job.run(lambda progress: self.events.put((job, progress)))
+            self.events.put((job, None))
+    
+    def report_progress(self, job, progress):
+        if job.progress_function:
+            job.progress_function(job, progress)
+    
+    def finish_job(self, job):
+        self.pending_jobs.remove(job)
+        if job.done_function:
+            job.done_function(job)
+    
+    def handle_event(self, job, progress):
+        if progress is None:
+            self.finish_job(job)
+        else:
+            self.report_progress(job, progress)
+    
+    def is_saving(self, filename=None):
+        "Return True if given file, or any file if none given, is being saved."
+        return any(filename in (None, job.filename) for job in self.pending_jobs)
+    
+    def wait(self, filename=None, ignore_job=None):
+        """
+        Block until given file, or all files if none given, is saved, eg
+        before loading it.
+        """
+        while any(job is not ignore_job and filename in (None, job.filename)
+                  for job in self.pending_jobs):
+            self.handle_event(*self.events.get())
+    
+    def update(self):
+        "Run callbacks for saves' progress and completion."
+        # only report latest progress for each job
+        progress = {}
+        while not self.events.empty():
+            job, job_progress = self.events.get()
+            if job_progress is None:
+                progress.pop(job, None)
+                self.finish_job(job)
+            else:
+                progress[job] = job_progress
+        for job, job_progress in progress.items():
+            self.report_progress(job, job_progress)
+    
+    def destroy(self):
+        "Finish all pending saves."
+        self.wait()
+        if self.thread:
+            self.jobs.put(None)
+            self.thread.join()
+            self.thread = None
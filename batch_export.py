@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Export art files to other formats from the command line, without opening
+a window, eg as part of a build. Art renders in software, and files are
+spread across a pool of processes, each of which loads each character set
+and palette once.
+
+usage: batch_export.py [-h] [-o OUTPUT_DIR] [-p PROCESSES] [-s KEY=VALUE]
+                       FORMATS PATH [PATH ...]
+
+FORMATS is a comma-separated list of exporter file extensions or class
+names, eg png,gif,ans,txt. PATHs are art files, or folders to export all
+art files in (recursively).
+"""
+
+import argparse, ast, multiprocessing, os, sys, time, traceback
+
+import playscii
+from playscii import Application, get_paths
+from art import ArtFromDisk, ART_FILE_EXTENSION
+from background_save import SaveLord
+from camera import Camera
+
+# directory playscii (and its formats/ etc) lives in
+APP_DIR = os.path.dirname(os.path.abspath(playscii.__file__))
+
+
+class BatchLogger:
+    "Logger that collects lines, so each file's can be reported together."
+    def __init__(self):
+        self.lines = []
+    
+    def log(self, new_line):
+        self.lines.append(str(new_line))
+
+
+class HeadlessCursor:
+    "Stands in for Cursor, which exporters check for preview edits."
+    preview_edits = []
+
+
+class HeadlessMessageLine:
+    def __init__(self, app):
+        self.app = app
+    
+    def post_line(self, new_line, hold_time=None, error=False):
+        self.app.logger.log(new_line)
+
+
+class HeadlessUI:
+    "Stands in for UI, which exporters get their art from."
+    def __init__(self, app):
+        self.active_art = None
+        self.message_line = HeadlessMessageLine(app)
+
+
+class HeadlessApplication(Application):
+    """
+    Application with no window, GL context or UI; enough to load art and
+    run ArtExporters.
+    """
+    headless = True
+    can_edit = False
+    
+    def __init__(self, config_dir, documents_dir, cache_dir, logger):
+        self.init_success = False
+        self.config_dir = config_dir
+        self.documents_dir = documents_dir
+        self.cache_dir = cache_dir
+        self.logger = logger
+        self.game_mode = False
+        self.gw = None
+        self.ui = HeadlessUI(self)
+        self.cursor = HeadlessCursor()
+        self.camera = Camera(self)
+        self.svl = SaveLord(self)
+        self.charsets, self.palettes = [], []
+        self.converter_modules = {}
+        self.last_export_options = {}
+        self.inactive_layer_visibility = 1
+        self.onion_frames_visible = False
+        self.init_success = True
+    
+    def get_elapsed_time(self):
+        return int(time.perf_counter() * 1000)
+    
+    def get_exporter(self, name):
+        """
+        Return ArtExporter subclass with given class name or file extension;
+        for an extension several share, eg png, prefer formats/out_EXT.py's.
+        """
+        name = name.lower()
+        exporters = self.get_exporters()
+        for exporter in exporters:
+            if exporter.__name__.lower() == name:
+                return exporter
+        matches = [e for e in exporters if e.file_extension.lower() == name]
+        for exporter in matches:
+            if exporter.__module__.endswith('out_' + name):
+                return exporter
+        return matches[0] if matches else None
+
+
+# each worker process's app, created by init_worker
+worker_app = None
+
+def init_worker():
+    global worker_app
+    os.chdir(APP_DIR)
+    worker_app = HeadlessApplication(*get_paths(), BatchLogger())
+
+def export_file(task):
+    """
+    Export given (art filename, output filename, exporter name, options)
+    in a worker process, return (art filename, output filename, success,
+    seconds taken, log lines).
+    """
+    art_filename, out_filename, exporter_name, options = task
+    app = worker_app
+    app.logger.lines = []
+    start_time = time.perf_counter()
+    success = False
+    try:
+        exporter_class = app.get_exporter(exporter_name)
+        art = ArtFromDisk(art_filename, app)
+        if not art.valid:
+            app.log("Couldn't load %s" % art_filename)
+        else:
+            app.ui.active_art = art
+            os.makedirs(os.path.dirname(out_filename), exist_ok=True)
+            success = exporter_class(app, out_filename, options).success
+    except:
+        for line in traceback.format_exc().splitlines():
+            app.log(line)
+    app.ui.active_art = None
+    elapsed = time.perf_counter() - start_time
+    return art_filename, out_filename, success, elapsed, app.logger.lines
+
+def get_art_filenames(paths):
+    "Return (art filename, path relative to output dir) for given paths."
+    filenames = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            filenames.append((path, os.path.basename(path)))
+            continue
+        for dirpath, dirnames, files in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith('.' + ART_FILE_EXTENSION):
+                    full_filename = os.path.join(dirpath, filename)
+                    filenames.append((full_filename,
+                                      os.path.relpath(full_filename, path)))
+    return filenames
+
+def parse_option(option):
+    "Return (key, value) from a KEY=VALUE option, eg scale=2 or crt=False."
+    key, value = option.split('=', 1)
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        # take anything else as a string
+        pass
+    return key, value
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Export Playscii art files without opening a window.')
+    parser.add_argument('formats', help='comma-separated exporter file extensions or class names, eg png,gif')
+    parser.add_argument('paths', nargs='+', help='art files, or folders of them')
+    parser.add_argument('-o', '--output-dir', default='.', help='folder to write exported files to (default: current folder)')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(), help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='KEY=VALUE', help='exporter option, eg scale=2 or crt=False; may be repeated')
+    return parser.parse_args()
+
+def main():
+    args = get_args()
+    options = dict(parse_option(option) for option in args.set)
+    output_dir = os.path.abspath(args.output_dir)
+    art_filenames = get_art_filenames(args.paths)
+    # exporters and charsets etc are found relative to app dir
+    os.chdir(APP_DIR)
+    app = HeadlessApplication(*get_paths(), BatchLogger())
+    tasks = []
+    for name in args.formats.split(','):
+        exporter_class = app.get_exporter(name)
+        if not exporter_class:
+            print('No exporter found for %s' % name, file=sys.stderr)
+            return 1
+        for art_filename, relative_filename in art_filenames:
+            out_filename = os.path.splitext(relative_filename)[0]
+            out_filename = os.path.join(output_dir, out_filename)
+            if exporter_class.file_extension:
+                out_filename += '.' + exporter_class.file_extension
+            tasks.append((art_filename, out_filename, name, options))
+    if len(tasks) == 0:
+        print('No art files found', file=sys.stderr)
+        return 1
+    processes = max(1, min(args.processes, len(tasks)))
+    print('Exporting %s files with %s processes...' % (len(tasks), processes))
+    start_time = time.perf_counter()
+    failures = 0
+    with multiprocessing.Pool(processes, init_worker) as pool:
+        for result in pool.imap_unordered(export_file, tasks):
+            art_filename, out_filename, success, elapsed, lines = result
+            status = 'ok' if success else 'FAILED'
+            print('%8.3fs  %-6s %s -> %s' % (elapsed, status, art_filename,
+                                              out_filename))
+            if not success:
+                failures += 1
+                for line in lines:
+                    print('    %s' % line)
+    total_time = time.perf_counter() - start_time
+    print('Exported %s of %s files in %.2fs (%.1f files/s)' % (len(tasks) - failures,
+                                                              len(tasks), total_time,
+                                                              len(tasks) / total_time))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -139,7 +139,8 @@ class CharacterSet:
                 if color[:3] == self.transparent_color[:3]:
                     # MAYBE-TODO: does keeping non-alpha color improve sampling?
                     img.putpixel((x, y), (color[0], color[1], color[2], 0))
-        self.texture = Texture(img.tobytes(), self.image_width, self.image_height)
+        if not self.app.headless:
+            self.texture = Texture(img.tobytes(), self.image_width, self.image_height)
         # flip image data back and save it for later, eg image conversion
         img = img.transpose(Image.FLIP_TOP_BOTTOM)
         self.image_data = img
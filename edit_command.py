@@ -1,4 +1,7 @@
 import time
+import numpy as np
+
+from art_frames import get_changed_frames
 
 class EditCommand:
     
@@ -79,7 +82,7 @@ class EntireArtCommand:
     """
     
     # art arrays to grab
-    array_types = ['chars', 'fg_colors', 'bg_colors', 'uv_mods']
+    array_types = ['chars', 'fg_colors', 'bg_colors', 'uv_maps']
     
     def __init__(self, art, origin_x=0, origin_y=0):
         self.art = art
@@ -88,23 +91,48 @@ class EntireArtCommand:
         self.before_frame = art.active_frame
         self.before_layer = art.active_layer
         self.start_time = self.finish_time = art.app.get_elapsed_time()
+        # frames whose data we hold, or None if we hold all frames
+        self.changed_frames = []
     
     def save_tiles(self, before=True):
-        # save copies of tile data lists
-        prefix = 'b' if before else 'a'
-        for atype in self.array_types:
-            # save list as eg "b_chars" for "character data before operation"
-            src_data = getattr(self.art, atype)
-            var_name = '%s_%s' % (prefix, atype)
-            # deep copy each frame's data, else before == after
-            new_data = []
-            for frame in src_data:
-                new_data.append(frame.copy())
-            setattr(self, var_name, new_data)
         if before:
+            # snapshot tile data stacks; frames the operation writes to are
+            # copied then, so unchanged frames (possibly not even loaded,
+            # see LazyFrameStack) needn't be
+            self.snapshots = [getattr(self.art, atype).get_snapshot()
+                              for atype in self.array_types]
             self.before_size = (self.art.width, self.art.height)
-        else:
-            self.after_size = (self.art.width, self.art.height)
+            return
+        self.after_size = (self.art.width, self.art.height)
+        stacks = [getattr(self.art, atype) for atype in self.array_types]
+        # if frames were added, removed or resized, hold all of them
+        self.changed_frames = get_changed_frames(stacks, self.snapshots)
+        for atype, stack, snapshot in zip(self.array_types, stacks,
+                                          self.snapshots):
+            # save eg "b_chars" for "character data before operation"
+            setattr(self, 'b_' + atype, self.get_frames(snapshot))
+            setattr(self, 'a_' + atype, self.get_frames(stack))
+            snapshot.release()
+        self.snapshots = None
+    
+    def get_frames(self, stack):
+        "Return array of copies of given stack's frames that we hold."
+        frames = self.changed_frames
+        if frames is None:
+            frames = range(len(stack))
+        return np.array([stack[frame] for frame in frames], dtype=stack.dtype)
+    
+    def set_frames(self, prefix):
+        "Write our before (prefix 'b') or after ('a') frames to art's stacks."
+        for atype in self.array_types:
+            stack = getattr(self.art, atype)
+            data = getattr(self, '%s_%s' % (prefix, atype))
+            if self.changed_frames is None:
+                stack.set_array(data)
+                continue
+            # write in place, so eg shared and lazily loaded stacks stay so
+            for i, frame in enumerate(self.changed_frames):
+                stack.get_writable(frame)[:] = data[i]
     
     def undo(self):
         # undo might remove frames/layers that were added
@@ -113,9 +141,7 @@ class EntireArtCommand:
         if self.before_size != self.after_size:
             x, y = self.before_size
             self.art.resize(x, y, self.origin_x, self.origin_y)
-        for atype in self.array_types:
-            new_data = getattr(self, 'b_' + atype)
-            setattr(self.art, atype, new_data[:])
+        self.set_frames('b')
         if self.before_size != self.after_size:
             # Art.resize will set geo_changed and mark all frames changed
             self.art.app.ui.adjust_for_art_resize(self.art)
@@ -125,9 +151,7 @@ class EntireArtCommand:
         if self.before_size != self.after_size:
             x, y = self.after_size
             self.art.resize(x, y, self.origin_x, self.origin_y)
-        for atype in self.array_types:
-            new_data = getattr(self, 'a_' + atype)
-            setattr(self.art, atype, new_data[:])
+        self.set_frames('a')
         if self.before_size != self.after_size:
             self.art.app.ui.adjust_for_art_resize(self.art)
         self.art.mark_all_frames_changed()
@@ -226,6 +250,8 @@ class CommandStack:
     def commit_commands(self, new_commands):
         self.undo_commands += new_commands[:]
         self.clear_redo()
+        for command in new_commands:
+            self.art.journal_command(command)
     
     def undo(self):
         if len(self.undo_commands) == 0:
@@ -233,6 +259,7 @@ class CommandStack:
         command = self.undo_commands.pop()
         self.art.app.cursor.undo_preview_edits()
         command.undo()
+        self.art.journal_command(command)
         self.redo_commands.append(command)
         self.art.app.cursor.update_cursor_preview()
     
@@ -244,6 +271,7 @@ class CommandStack:
         # edits will "stick"
         self.art.app.cursor.undo_preview_edits()
         command.apply()
+        self.art.journal_command(command)
         # add to end of undo stack
         self.undo_commands.append(command)
         self.art.app.cursor.update_cursor_preview()
@@ -1,9 +1,199 @@
 
+import re
+import numpy as np
+
 from art_import import ArtImporter
 
 DEFAULT_FG, DEFAULT_BG = 7, 0
 WIDTH = 80
-MAX_LINES = 250
+# lines to allocate at first; grows as needed
+START_LINES = 64
+
+# one token per match: escape sequence (with its parameters and command
+# letter), line break, tab, end of file, or run of characters to draw
+TOKEN_RE = re.compile(rb"""
+    \x1b\[(?P<params>[0-9;?=]*)(?P<cmd>[\x40-\x7e])
+    | (?P<newline>\r?\n)
+    | (?P<cr>\r)
+    | (?P<tab>\t)
+    | (?P<eof>\x1a)
+    | (?P<text>[^\x1b\r\n\t\x1a]+|\x1b)
+""", re.VERBOSE)
+
+# (parameter bytes, default): parsed parameters; files repeat a few a lot
+params_cache = {}
+MAX_CACHED_PARAMS = 4096
+
+def get_params(params, default=0):
+    "Return list of ints from given escape sequence parameter bytes."
+    key = (params, default)
+    if not key in params_cache:
+        # cursor positions can vary a lot, don't grow without limit
+        if len(params_cache) > MAX_CACHED_PARAMS:
+            params_cache.clear()
+        params_cache[key] = [int(p) if p.isdigit() else default
+                             for p in params.split(b';')]
+    return params_cache[key]
+
+def grow_lines(chars, fgs, bgs, lines):
+    "Return given tile arrays, grown if needed to have given lines."
+    if lines <= len(chars):
+        return chars, fgs, bgs
+    new_lines = max(lines, len(chars) * 2) - len(chars)
+    width = chars.shape[1]
+    return (np.concatenate((chars, np.zeros((new_lines, width), dtype=np.uint8))),
+            np.concatenate((fgs, np.zeros((new_lines, width), dtype=np.uint8))),
+            np.concatenate((bgs, np.full((new_lines, width), DEFAULT_BG + 1,
+                                         dtype=np.uint8))))
+
+def draw_runs(runs, chars, fgs, bgs):
+    """
+    Write given (y, x, bytes, fg, bg) runs of characters to given tile
+    arrays all at once, return arrays (grown if needed).
+    """
+    width = chars.shape[1]
+    ys, xs, texts, run_fgs, run_bgs = zip(*runs)
+    chars, fgs, bgs = grow_lines(chars, fgs, bgs, max(ys) + 1)
+    lengths = [len(text) for text in texts]
+    total = sum(lengths)
+    # flat index into arrays of each character's tile
+    starts = np.cumsum(lengths) - lengths
+    tiles = np.repeat(np.array(ys) * width + np.array(xs) - starts, lengths)
+    tiles += np.arange(total)
+    # later characters overwrite earlier ones on the same tile
+    tiles, last = np.unique(tiles[::-1], return_index=True)
+    last = total - 1 - last
+    chars.ravel()[tiles] = np.frombuffer(b''.join(texts), dtype=np.uint8)[last]
+    # account for color 0 (transparent)
+    fgs.ravel()[tiles] = np.repeat(np.array(run_fgs, dtype=np.uint8) + 1, lengths)[last]
+    bgs.ravel()[tiles] = np.repeat(np.array(run_bgs, dtype=np.uint8) + 1, lengths)[last]
+    return chars, fgs, bgs
+
+def read_ans(data, width=WIDTH):
+    """
+    Return (chars, fg colors, bg colors) (lines, width) arrays of given ANSI
+    file data, with color indices offset so 0 = transparent. Characters
+    are collected in runs and written to the arrays in bulk.
+    """
+    # tiles drawn so far, grown as lines are reached
+    chars = np.zeros((START_LINES, width), dtype=np.uint8)
+    fgs = np.zeros((START_LINES, width), dtype=np.uint8)
+    bgs = np.full((START_LINES, width), DEFAULT_BG + 1, dtype=np.uint8)
+    # (y, x, bytes, fg, bg) runs of characters not yet written to arrays
+    runs = []
+    x, y = 0, 0
+    # cursor save/restore codes position
+    saved_x, saved_y = 0, 0
+    # final value of y might be lower than last line touched if
+    # cursor up/reset codes used; track highest value
+    max_y = 0
+    fg, bg = DEFAULT_FG, DEFAULT_BG
+    fg_bright, bg_bright = False, False
+    for match in TOKEN_RE.finditer(data):
+        if x >= width:
+            x = 0
+            y += 1
+            max_y = max(y, max_y)
+        kind = match.lastgroup
+        if kind == 'text':
+            text = match.group('text')
+            # split run into lines, wrapping at right edge
+            while len(text) > 0:
+                if x >= width:
+                    x = 0
+                    y += 1
+                    max_y = max(y, max_y)
+                n = min(len(text), width - x)
+                runs.append((y, x, text[:n], fg, bg))
+                x += n
+                text = text[n:]
+        elif kind == 'newline':
+            x = 0
+            y += 1
+            max_y = max(y, max_y)
+        elif kind == 'cr':
+            x = 0
+        elif kind == 'tab':
+            x += 8
+        elif kind == 'eof':
+            # SAUCE metadata etc may follow
+            break
+        else:
+            params, cmd = match.group('params', 'cmd')
+            # display control
+            if cmd == b'm':
+                for code in get_params(params):
+                    # reset colors
+                    if code == 0:
+                        fg, bg = DEFAULT_FG, DEFAULT_BG
+                        fg_bright, bg_bright = False, False
+                    # "bright" colors
+                    elif code == 1:
+                        # bump fg color if isn't already bright
+                        if not fg_bright:
+                            fg += 8
+                        fg_bright = True
+                    elif code == 5:
+                        if not bg_bright:
+                            bg += 8
+                        bg_bright = True
+                    # swap fg/bg
+                    elif code == 7:
+                        fg, bg = bg, fg
+                    # change fg color
+                    elif 30 <= code <= 37:
+                        fg = code - 30
+                        if fg_bright: fg += 8
+                    # change bg color
+                    elif 40 <= code <= 47:
+                        bg = code - 40
+                        if bg_bright: bg += 8
+            # cursor up/down/forward/back
+            elif cmd == b'A':
+                y = max(0, y - (get_params(params)[0] or 1))
+            elif cmd == b'B':
+                y += get_params(params)[0] or 1
+                max_y = max(y, max_y)
+            elif cmd == b'C':
+                x += get_params(params)[0] or 1
+            elif cmd == b'D':
+                x = max(0, x - (get_params(params)[0] or 1))
+            # move cursor to Y,X
+            elif cmd == b'H' or cmd == b'f':
+                coords = get_params(params, 1) + [1]
+                x, y = max(0, coords[1] - 1), max(0, coords[0] - 1)
+                max_y = max(y, max_y)
+            # clear line/screen
+            elif cmd == b'J':
+                code = get_params(params)[0]
+                if runs:
+                    chars, fgs, bgs = draw_runs(runs, chars, fgs, bgs)
+                    runs = []
+                # 0: clear from cursor to end of screen
+                if code == 0 and y < len(chars):
+                    chars[y, x:] = 0
+                # 1: clear from cursor to beginning of screen
+                elif code == 1 and y < len(chars):
+                    chars[y, :x] = 0
+                # 2: clear entire screen, move cursor to 0,0
+                elif code == 2:
+                    x, y = 0, 0
+                    chars[:], fgs[:], bgs[:] = 0, 0, DEFAULT_BG + 1
+            # save cursor position
+            elif cmd == b's':
+                saved_x, saved_y = x, y
+            # restore cursor position
+            elif cmd == b'u':
+                x, y = saved_x, saved_y
+            # ignore others, eg set line wrap
+    if runs:
+        chars, fgs, bgs = draw_runs(runs, chars, fgs, bgs)
+    # last line drawn on may not have ended with a line break
+    drawn = np.flatnonzero((chars != 0).any(axis=1))
+    height = max(max_y, drawn[-1] + 1 if len(drawn) > 0 else 0)
+    chars, fgs, bgs = grow_lines(chars, fgs, bgs, height)
+    return chars[:height], fgs[:height], bgs[:height]
+
 
 class ANSImporter(ArtImporter):
     format_name = 'ANSI'
@@ -13,170 +203,15 @@ Assumes 80 columns, DOS character set and EGA palette.
     """
     allowed_file_extensions = ['ans', 'txt']
     
-    def get_sequence(self, data):
-        "returns a list of ints from given data ending in a letter"
-        i = 0
-        seq = []
-        while not 64 <= data[i] <= 126:
-            seq.append(data[i])
-            i += 1
-        seq.append(data[i])
-        return seq
-    
-    def get_commands_from_sequence(self, seq):
-        "returns command type & commands (separated by semicolon) from sequence"
-        cmds = []
-        new_cmd = ''
-        for k in seq[:-1]:
-            if k != 59:
-                new_cmd += chr(k)
-            else:
-                cmds.append(new_cmd)
-                new_cmd = ''
-        # include last command
-        cmds.append(new_cmd)
-        return chr(seq[-1]), cmds
-    
     def run_import(self, in_filename, options={}):
         self.set_art_charset('dos')
         self.set_art_palette('ansi')
-        # resize to arbitrary height, crop once we know final line count
-        self.resize(WIDTH, MAX_LINES)
-        self.art.clear_frame_layer(0, 0, DEFAULT_BG + 1)
         data = open(in_filename, 'rb').read()
-        x, y = 0, 0
-        # cursor save/restore codes position
-        saved_x, saved_y = 0, 0
-        # final value of y might be lower than last line touched if
-        # cursor up/reset codes used; track highest value
-        max_y = 0
-        fg, bg = DEFAULT_FG, DEFAULT_BG
-        i = 0
-        fg_bright, bg_bright = False, False
-        while i < len(data):
-            if x >= WIDTH:
-                x = 0
-                y += 1
-                if y > max_y: max_y = y
-            # how much we will advance through bytes for next iteration
-            increment = 1
-            # command sequence
-            if data[i] == 27 and data[i+1] == 91:
-                increment += 1
-                # grab full length of sequence
-                seq = self.get_sequence(data[i+2:])
-                # split sequence into individual commands
-                cmd_type, cmds = self.get_commands_from_sequence(seq)
-                # display control
-                if cmd_type == 'm':
-                    # empty command = reset
-                    if len(cmds) == 0:
-                        fg, bg = DEFAULT_FG, DEFAULT_BG
-                        fg_bright, bg_bright = False, False
-                    else:
-                        for cmd in cmds:
-                            code = int(cmd)
-                            # reset colors
-                            if code == 0:
-                                fg, bg = DEFAULT_FG, DEFAULT_BG
-                                fg_bright, bg_bright = False, False
-                            # "bright" colors
-                            elif code == 1:
-                                # bump fg color if isn't already bright
-                                if not fg_bright:
-                                    fg += 8
-                                fg_bright = True
-                            elif code == 5:
-                                if not bg_bright:
-                                    bg += 8
-                                bg_bright = True
-                            # swap fg/bg
-                            elif code == 7:
-                                fg, bg = bg, fg
-                            # change fg color
-                            elif 30 <= code <= 37:
-                                fg = code - 30
-                                if fg_bright: fg += 8
-                            # change bg color
-                            elif 40 <= code <= 47:
-                                bg = code - 40
-                                if bg_bright: bg += 8
-                            #else: print('unhandled display code %s' % code)
-                # cursor up/down/forward/back
-                elif cmd_type == 'A':
-                    y -= int(cmds[0]) if cmds[0] else 1
-                elif cmd_type == 'B':
-                    y += int(cmds[0]) if cmds[0] else 1
-                    if y > max_y: max_y = y
-                elif cmd_type == 'C':
-                    x += int(cmds[0]) if cmds[0] else 1
-                elif cmd_type == 'D':
-                    x -= int(cmds[0]) if cmds[0] else 1
-                # break
-                elif ord(cmd_type) == 26:
-                    break
-                # set line wrap (ignore for now)
-                elif cmd_type == 'h':
-                    pass
-                # move cursor to Y,X
-                elif cmd_type == 'H' or cmd_type == 'f':
-                    if len(cmds) == 0 or len(cmds[0]) == 0:
-                        new_y = 0
-                    else:
-                        new_y = int(cmds[0]) - 1
-                    if len(cmds) < 2 or len(cmds[1]) == 0:
-                        new_x = 0
-                    else:
-                        new_x = int(cmds[1]) - 1
-                    x, y = new_x, new_y
-                    if y > max_y: max_y = y
-                # clear line/screen
-                elif cmd_type == 'J':
-                    cmd = int(cmds[0]) if cmds else 0
-                    # 0: clear from cursor to end of screen
-                    if cmd == 0:
-                        for xi in range(x, WIDTH):
-                            self.art.set_char_index_at(0, 0, xi, y, 0)
-                    # 1: clear from cursor to beginning of screen
-                    elif cmd == 1:
-                        for xi in range(x):
-                            self.art.set_char_index_at(0, 0, xi, y, 0)
-                    # 2: clear entire screen, move cursor to 0,0
-                    elif cmd == 2:
-                        x, y = 0, 0
-                        self.art.clear_frame_layer(0, 0, DEFAULT_BG + 1)
-                # save cursor position
-                elif cmd_type == 's':
-                    saved_x, saved_y = x, y
-                # restore cursor position
-                elif cmd_type == 'u':
-                    x, y = saved_x, saved_y
-                #else: print('unhandled escape code %s' % cmd_type)
-                increment += len(seq)
-            # CR + LF
-            elif data[i] == 13 and data[i+1] == 10:
-                increment += 1
-                x = 0
-                y += 1
-                if y > max_y: max_y = y
-            # LF
-            elif data[i] == 10:
-                x = 0
-                y += 1
-                if y > max_y: max_y = y
-            # indent
-            elif data[i] == 9:
-                x += 8
-            # regular character
-            else:
-                char = data[i]
-                # account for color 0 (transparent)
-                self.art.set_tile_at(0, 0, x, y, char, fg + 1, bg + 1)
-                x += 1
-            i += increment
-        # resize to last line touched
-        self.resize(WIDTH, max_y)
+        chars, fgs, bgs = read_ans(data)
+        height = len(chars)
         # rare cases where no lines covered
-        if self.art.height == 0:
+        if height == 0:
             return False
+        self.resize(WIDTH, height)
+        self.art.fill_rect(0, 0, 0, 0, WIDTH, height, chars, fgs, bgs)
         return True
@@ -1,7 +1,7 @@
 
 import numpy as np
 
-from image_convert import ImageConverter
+from image_convert import BlockMatcher, ImageConverter
 from ui_dialog import UIDialog, Field, SkipFieldType
 from formats.in_bitmap import BitmapImageImporter, ConvertImageChooserDialog, ConvertImageOptionsDialog
 
@@ -47,7 +47,7 @@ class TwoColorConvertImageOptionsDialog(ConvertImageOptionsDialog):
             return ConvertImageOptionsDialog.get_initial_field_text(self, field_number)
 
 
-class TwoColorImageConverter(ImageConverter):
+class TwoColorBlockMatcher(BlockMatcher):
     
     def get_color_combos_for_block(self, src_block):
         colors, counts = np.unique(src_block, False, False, return_counts=True)
@@ -59,6 +59,10 @@ class TwoColorImageConverter(ImageConverter):
             return [2], []
 
 
+class TwoColorImageConverter(ImageConverter):
+    block_matcher_class = TwoColorBlockMatcher
+
+
 class TwoColorBitmapImageImporter(BitmapImageImporter):
     format_name = '2-color bitmap image'
     format_description = """
@@ -21,6 +21,12 @@ class ImageSequenceConverter:
         self.image_name = os.path.splitext(self.image_filename)[0]
         self.art = art
         self.bicubic_scale = bicubic_scale
+        # worker process pool, started by first frame's converter and
+        # shared by the rest
+        self.pool = None
+        # frames share a BlockMatcher too, and so its cache of matched blocks
+        self.block_matcher = None
+        self.cache_hits, self.cache_misses = 0, 0
         # queue up first frame
         self.next_image(first=True)
         self.init_success = True
@@ -63,9 +69,12 @@ class ImageSequenceConverter:
             self.current_frame_converter.update()
     
     def finish(self, cancelled=False):
+        if self.pool:
+            self.pool.terminate()
         time_taken = time.time() - self.start_time
         (verb, error) = ('cancelled', True) if cancelled else ('finished', False)
-        self.app.log('Conversion of image sequence %s %s after %.3f seconds' % (self.image_name, verb, time_taken), error)
+        cache_report = image_convert.get_block_cache_report(self.cache_hits, self.cache_misses)
+        self.app.log('Conversion of image sequence %s %s after %.3f seconds, %s' % (self.image_name, verb, time_taken, cache_report), error)
         self.app.converter = None
         self.app.update_window_title()
 
@@ -1,3 +1,4 @@
+import numpy as np
 
 from art_import import ArtImporter
 from ui_dialog import UIDialog, Field
@@ -75,18 +76,21 @@ Current character set and palette will be used.
                 break
         # recreate generator after first use
         lines = chunks(data, (width * 3) + lb_length)
-        x, y = 0, 0
+        # gather byte offset of each tile in file, skipping line breaks
+        tile_offsets = []
+        line_start = 0
         for line in lines:
-            index = 0
-            while index < len(line) - lb_length:
-                char = line[index]
-                # +1 to color indices; playscii color index 0 = transparent
-                fg = line[index+1] + 1
-                bg = line[index+2] + 1
-                self.art.set_tile_at(0, 0, x, y, char, fg, bg)
-                index += 3
-                x += 1
-                if x >= width:
-                    x = 0
-                    y += 1
+            tiles = min(-(-(len(line) - lb_length) // 3), len(line) // 3)
+            tile_offsets.append(line_start + np.arange(max(0, tiles)) * 3)
+            line_start += len(line)
+        # tiles fill rows left to right, top to bottom
+        tile_offsets = np.concatenate(tile_offsets)[:width * height]
+        data = np.frombuffer(data, dtype=np.uint8)
+        chars = data[tile_offsets]
+        # +1 to color indices; playscii color index 0 = transparent
+        fg = data[tile_offsets + 1].astype(int) + 1
+        bg = data[tile_offsets + 2].astype(int) + 1
+        tile_indices = np.arange(len(tile_offsets))
+        self.art.set_tiles_masked(0, 0, (tile_indices // width,
+                                         tile_indices % width), chars, fg, bg)
         return True
@@ -1,3 +1,4 @@
+import numpy as np
 
 from art_import import ArtImporter
 
@@ -22,21 +23,15 @@ Background colors can only be EGA colors 0-8.
         self.set_art_palette('ega')
         self.art.resize(80, 25)
         data = open(in_filename, 'rb').read(4000)
-        x, y = 0, 0
-        for i,byte in enumerate(data):
-            if i % 2 != 0:
-                continue
-            color_byte = data[i+1]
-            bits = bin(color_byte)[2:]
-            bits = bits.rjust(7, '0')
-            bg_bits = bits[:3]
-            fg_bits = bits[3:]
-            offset = 1
-            fg = int(fg_bits, 2) + offset
-            bg = int(bg_bits, 2) + offset
-            self.art.set_tile_at(0, 0, x, y, byte, fg, bg)
-            x += 1
-            if x >= self.art.width:
-                x = 0
-                y += 1
+        # each tile is a (char, color) byte pair
+        tiles = np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.uint8)
+        chars, colors = tiles[0::2], tiles[1::2]
+        # playscii color index 0 = transparent, offset EGA indices by 1
+        offset = 1
+        fg = (colors & 0x0F).astype(int) + offset
+        bg = ((colors >> 4) & 0x07).astype(int) + offset
+        # tiles fill rows left to right, top to bottom
+        tile_indices = np.arange(len(chars))
+        ys, xs = tile_indices // self.art.width, tile_indices % self.art.width
+        self.art.set_tiles_masked(0, 0, (ys, xs), chars, fg, bg)
         return True
@@ -1,3 +1,4 @@
+import numpy as np
 
 from art_import import ArtImporter
 
@@ -20,13 +21,10 @@ Current character set and palette will be used.
         if len(lines) == 0 or longest == 0:
             return False
         self.art.resize(longest, len(lines))
-        x, y = 0, 0
-        for line in lines:
-            for char in line:
-                char_index = self.art.charset.char_mapping.get(char, None)
-                if char_index:
-                    self.art.set_char_index_at(0, 0, x, y, char_index)
-                x += 1
-            x = 0
-            y += 1
+        chars = np.zeros((len(lines), longest), dtype=int)
+        for y, line in enumerate(lines):
+            chars[y, :len(line)] = [self.art.charset.char_mapping.get(char, None) or 0
+                                    for char in line]
+        # characters not in charset's mapping are left blank
+        self.art.set_tiles_masked(0, 0, chars != 0, chars)
         return True
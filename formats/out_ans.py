@@ -1,62 +1,135 @@
- 
+
+import numpy as np
+
 from art_export import ArtExporter
+from ui_dialog import UIDialog, Field
+from ui_art_dialog import ExportOptionsDialog
 
 WIDTH = 80
-ENCODING = 'cp1252' # old default
-ENCODING = 'us-ascii' # DEBUG
-ENCODING = 'latin_1' # DEBUG - seems to handle >128 chars ok?
+DEFAULT_FULL_WIDTH = False
+# runs of at least this many blank black cells are skipped with a cursor
+# move rather than written
+MIN_SKIP = 5
+
+ESC = b'\x1b['
+# byte written for each character index; special (top row) chars won't
+# display in terminal anyway
+CHAR_BYTES = np.arange(256, dtype=np.uint8)
+CHAR_BYTES[:32] = ord(' ')
+
+class ANSExportOptionsDialog(ExportOptionsDialog):
+    title = 'ANSI export options'
+    field0_label = 'Export full width (%s columns), not %s' % ('%s', WIDTH)
+    fields = [
+        Field(label=field0_label, type=bool, width=0, oneline=True)
+    ]
+    
+    def get_initial_field_text(self, field_number):
+        if field_number == 0:
+            return [' ', UIDialog.true_field_text][DEFAULT_FULL_WIDTH]
+    
+    def get_field_label(self, field_index):
+        label = self.fields[field_index].label
+        if field_index == 0:
+            label %= self.ui.active_art.width
+        return label
+    
+    def confirm_pressed(self):
+        self.dismiss()
+        options = {'full_width': bool(self.field_texts[0].strip())}
+        ExportOptionsDialog.do_export(self.ui.app, self.filename, options)
+
 
 class ANSExporter(ArtExporter):
     format_name = 'ANSI'
     format_description = """
 Classic scene format using ANSI standard codes.
-Assumes 80 columns, DOS character set and EGA palette.
+Assumes 80 columns (or optionally art's full width),
+DOS character set and EGA palette.
 Exports active layer of active frame.
     """
     file_extension = 'ans'
+    options_dialog_class = ANSExportOptionsDialog
     
-    def get_display_command(self, fg, bg):
-        "return a display command sequence string for given colors"
-        # reset colors on every tile
-        s = chr(27) + chr(91) + '0;'
-        if fg >= 8:
-            s += '1;'
-            fg -= 8
-        if bg >= 8:
-            s += '5;'
-            bg -= 8
-        s += '%s;' % (fg + 30)
-        s += '%s' % (bg + 40)
-        s += 'm'
-        return s
-    
-    def write(self, data):
-        self.outfile.write(data.encode(ENCODING))
+    def get_display_command(self, fg, bg, old_fg, old_bg):
+        """
+        Return display command bytes changing terminal colors from old
+        fg/bg (None if unknown) to given ones, empty if they're the same.
+        """
+        # bright fg is bold, bright bg is blink; only a reset turns them off
+        if old_fg is None or (old_fg >= 8 and fg < 8) or \
+           (old_bg >= 8 and bg < 8):
+            codes = ['0']
+            # reset gives grey on black
+            old_fg, old_bg = 7, 0
+        else:
+            codes = []
+        if fg >= 8 and old_fg < 8:
+            codes.append('1')
+        if bg >= 8 and old_bg < 8:
+            codes.append('5')
+        if fg % 8 != old_fg % 8:
+            codes.append(str(fg % 8 + 30))
+        if bg % 8 != old_bg % 8:
+            codes.append(str(bg % 8 + 40))
+        if len(codes) == 0:
+            return b''
+        return ESC + ';'.join(codes).encode() + b'm'
     
     def run_export(self, out_filename, options):
-        # binary file; encoding into ANSI bytes happens just before write
-        self.outfile = open(out_filename, 'wb')
         layer = self.art.active_layer
         frame = self.art.active_frame
+        width = self.art.width
+        if not options.get('full_width', DEFAULT_FULL_WIDTH):
+            # cut off tiles beyond supported width
+            width = min(width, WIDTH)
+        chars = self.art.chars[frame][layer, :, :width]
+        # no byte for chars past 255, write a blank
+        chars = CHAR_BYTES[np.where(chars < 256, chars, 0)]
+        # offset palette indices so 0 = black not transparent;
+        # transparent is black too
+        fgs = np.maximum(self.art.fg_colors[frame][layer, :, :width].astype(int) - 1, 0)
+        bgs = np.maximum(self.art.bg_colors[frame][layer, :, :width].astype(int) - 1, 0)
+        blanks = chars == ord(' ')
+        columns = np.arange(width)
+        # current terminal colors
+        fg, bg = None, None
+        out = []
         for y in range(self.art.height):
-            for x in range(WIDTH):
-                # cut off tiles beyond supported width
-                if x >= self.art.width - 1:
+            row_chars, row_bgs = chars[y], bgs[y]
+            # blank cells show no fg, so keep last non-blank cell's;
+            # -1 for leading blanks, which keep whatever fg is current
+            last_fg = np.maximum.accumulate(np.where(blanks[y], -1, columns))
+            row_fgs = np.where(last_fg >= 0, fgs[y][last_fg], -1)
+            # blank black cells at end of line needn't be written
+            written = np.flatnonzero(~blanks[y] | (row_bgs != 0))
+            row_width = written[-1] + 1 if len(written) > 0 else 0
+            row_chars = row_chars[:row_width]
+            row_fgs, row_bgs = row_fgs[:row_width], row_bgs[:row_width]
+            # write each run of identical cells at once
+            changes = (row_chars[1:] != row_chars[:-1]) | \
+                      (row_fgs[1:] != row_fgs[:-1]) | \
+                      (row_bgs[1:] != row_bgs[:-1])
+            starts = np.flatnonzero(np.concatenate(([row_width > 0], changes)))
+            ends = np.concatenate((starts[1:], [row_width]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                char = row_chars[start]
+                new_fg, new_bg = int(row_fgs[start]), int(row_bgs[start])
+                if char == ord(' ') and new_bg == 0 and end - start >= MIN_SKIP:
+                    # skip over blank black cells with cursor forward
+                    out.append(ESC + b'%dC' % (end - start))
                     continue
-                char, fg, bg, xform = self.art.get_tile_at(frame, layer, x, y)
-                # offset palette indices so 0 = black not transparent
-                fg -= 1
-                bg -= 1
-                # write a display command every tile
-                # works fine, though it's a larger file - any real downside to this?
-                self.write(self.get_display_command(fg, bg))
-                # write the character for this tile
-                if char > 31:
-                    self.write(chr(char))
-                else:
-                    # special (top row) chars won't display in terminal anyway
-                    self.write(chr(0))
-            # carriage return + line feed
-            self.outfile.write(b'\r\n')
-        self.outfile.close()
+                if new_fg == -1:
+                    new_fg = 7 if fg is None else fg
+                out.append(self.get_display_command(new_fg, new_bg, fg, bg))
+                fg, bg = new_fg, new_bg
+                out.append(bytes([char]) * (end - start))
+            # carriage return + line feed, unless line filled an 80 column
+            # screen and wrapped already
+            if row_width < WIDTH or width > WIDTH:
+                out.append(b'\r\n')
+        # leave terminal in default state
+        out.append(ESC + b'0m')
+        with open(out_filename, 'wb') as f:
+            f.write(b''.join(out))
         return True
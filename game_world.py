@@ -42,6 +42,18 @@ class MyGameObject(GameObject):
 """
 
 
+def copy_state(value):
+    """
+    Return copy of given JSON-style state value: containers are copied,
+    everything else (numbers, strings etc) is immutable and shared.
+    """
+    if isinstance(value, dict):
+        return {k: copy_state(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [copy_state(v) for v in value]
+    return value
+
+
 # Quickie class to debug render order
 RenderItem = namedtuple('RenderItem', ['obj', 'layer', 'sort_value'])
 
@@ -409,7 +421,8 @@ class GameWorld:
         # HACK: set some property defaults, no idea why they don't take :[
         self.collision_enabled = self.properties.collision_enabled = True
         self.game_title = self.properties.game_title = new_game_title
-        self.save_to_file(DEFAULT_STATE_FILENAME)
+        # state is loaded right away, save it now
+        self.save_to_file(DEFAULT_STATE_FILENAME, False)
         return True
     
     def unload_game(self):
@@ -878,8 +891,11 @@ class GameWorld:
         last_state = os.path.splitext(last_state)[0]
         self.save_to_file(last_state)
     
-    def save_to_file(self, filename=None):
-        "Save current world state to a file."
+    def save_to_file(self, filename=None, background=True):
+        """
+        Save current world state to a file. State is copied now and written
+        in the background unless background is False.
+        """
         objects = []
         for obj in self.objects.values():
             if obj.should_save:
@@ -901,9 +917,21 @@ class GameWorld:
             timestamp = int(time.time())
             filename = '%s%s.%s' % (self.game_dir, timestamp,
                                      STATE_FILE_EXTENSION)
-        json.dump(d, open(filename, 'w'),
-                  sort_keys=True, indent=1)
-        self.app.log('Saved game state %s to disk.' % filename)
+        # objects may change their lists etc while we write
+        d = copy_state(d)
+        def write(temp_filename, progress):
+            with open(temp_filename, 'w') as f:
+                json.dump(d, f, sort_keys=True, indent=1)
+        self.app.svl.save(filename, write, self.save_finished,
+                          background=background)
+    
+    def save_finished(self, job):
+        if job.error:
+            self.app.log('Error saving game state %s:' % job.filename, error=True)
+            for line in job.error.splitlines():
+                self.app.log(line)
+            return
+        self.app.log('Saved game state %s to disk.' % job.filename)
         self.app.update_window_title()
     
     def _get_all_loaded_classes(self):
@@ -1070,6 +1098,8 @@ class GameWorld:
         # import all submodules and catalog classes
         self._import_all()
         self.classes = self._get_all_loaded_classes()
+        # state might still be being saved
+        self.app.svl.wait(filename)
         try:
             d = json.load(open(filename))
             #self.app.log('Loading game state %s...' % filename)
@@ -1,11 +1,12 @@
 
-import math, os.path, time
+import math, multiprocessing, os.path, time, traceback
+from collections import OrderedDict
 import numpy as np
 
 from PIL import Image, ImageChops, ImageStat
 
 from renderable_sprite import SpriteRenderable
-from lab_color import rgb_to_lab, lab_color_diff
+from lab_color import lab_distance_matrix
 
 """
 notes / future research
@@ -23,9 +24,230 @@ https://www.youtube.com/watch?v=L6CkYou6hYU
 - downsample each block bilinearly, divide each into 4x4 cells, then compare them with similarly bilinearly-downsampled char blocks
 """
 
+# block diffs closer than this are considered equal
+DIFF_TOLERANCE = 0.0001
+# blocks with at least this many colors find their best chars before
+# scoring every color combo
+MIN_PAIRED_COLORS = 6
+# glyphs and blocks are compared by their coverage of a grid of this many
+# cells across and down
+FEATURE_CELLS = 4
+GLYPH_FEATURE_CACHE_DIR = 'glyph_features/'
+# most recently matched blocks to keep the best tiles of
+BLOCK_CACHE_SIZE = 32768
+
+def get_cell_weights(size, cells=FEATURE_CELLS):
+    """
+    Return (cells, size) matrix that averages a row or column of given
+    number of pixels into given number of cells, weighting pixels by how
+    much of them falls in each cell.
+    """
+    edges = np.linspace(0, size, cells + 1)
+    pixels = np.arange(size)
+    overlaps = np.minimum(edges[1:, None], pixels + 1) - np.maximum(edges[:-1, None], pixels)
+    weights = np.maximum(overlaps, 0)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+def get_cell_features(values, cell_weights):
+    """
+    Return (..., cells * cells) feature vectors of given (..., height,
+    width) values, eg glyph masks, averaged over each cell of a grid.
+    """
+    row_weights, column_weights = cell_weights
+    cells = row_weights @ values @ column_weights.T
+    return cells.reshape(cells.shape[:-2] + (-1,))
+
+class BlockMatcher:
+    """
+    Finds the best matching tile for each block of a palettized image.
+    Holds only arrays, so it can be sent to worker processes.
+    """
+    
+    def __init__(self, char_w, char_h, char_mask_matrix, color_diffs,
+                 char_features=None, candidates=None):
+        self.char_w, self.char_h = char_w, char_h
+        # (characters, pixels) mask of each character's fg pixels
+        self.char_mask_matrix = char_mask_matrix
+        # (colors, colors) diff of each palette color from each other
+        self.color_diffs = color_diffs
+        # (characters, cells) glyph coverage of each feature grid cell
+        self.char_features = char_features
+        self.cell_weights = get_cell_weights(char_h), get_cell_weights(char_w)
+        # characters nearest a block's features to score fully, for each
+        # of its two dominant colors as fg; all are scored if None
+        self.candidates = candidates
+        if char_features is None or candidates is None or \
+           candidates * 2 >= len(char_mask_matrix):
+            self.candidates = None
+        # block bytes: best (char, fg, bg), least recently used first.
+        # we only match blocks for one charset and palette, so they needn't
+        # be part of the key.
+        self.block_cache = OrderedDict()
+        self.cache_hits, self.cache_misses = 0, 0
+    
+    def convert_band(self, src_band, width, height):
+        """
+        Return (chars, fg colors, bg colors) (height, width) arrays of best
+        tiles for given rows of source image.
+        """
+        chars = np.zeros((height, width), dtype=np.uint16)
+        fgs = np.zeros((height, width), dtype=np.uint16)
+        bgs = np.zeros((height, width), dtype=np.uint16)
+        for y in range(height):
+            y_start = y * self.char_h
+            for x in range(width):
+                x_start = x * self.char_w
+                block = src_band[y_start:y_start + self.char_h,
+                                 x_start:x_start + self.char_w]
+                chars[y, x], fgs[y, x], bgs[y, x] = self.get_cached_tile_for_block(block)
+        return chars, fgs, bgs
+    
+    def get_cached_tile_for_block(self, src_block):
+        "Return best (char, fg, bg) for given block, from cache if seen."
+        key = src_block.tobytes()
+        tile = self.block_cache.get(key)
+        if tile is not None:
+            self.block_cache.move_to_end(key)
+            self.cache_hits += 1
+            return tile
+        self.cache_misses += 1
+        tile = self.get_best_tile_for_block(src_block)
+        self.block_cache[key] = tile
+        if len(self.block_cache) > BLOCK_CACHE_SIZE:
+            self.block_cache.popitem(last=False)
+        return tile
+    
+    def get_color_combos_for_block(self, src_block):
+        """
+        returns # of unique colors, AND
+        array of unique (fg, bg) color index pairs for given block
+        """
+        # get unique colors in source block
+        colors, counts = np.unique(src_block, False, False, return_counts=True)
+        # early out for single-color blocks
+        if len(colors) == 1:
+            return colors, []
+        # every pair of different colors, sorted by most to least used
+        # colors; fg/bg color swap SHOULD be allowed
+        colors_by_use = colors[np.argsort(-counts, kind='stable')]
+        color1, color2 = np.divmod(np.arange(len(colors) ** 2), len(colors))
+        different = color1 != color2
+        combos = colors_by_use[np.column_stack((color1[different], color2[different]))]
+        return colors, combos
+    
+    def get_best_tile_for_block(self, src_block):
+        "returns a (char, fg, bg) tuple for the best match of given block"
+        colors, combos = self.get_color_combos_for_block(src_block)
+        # single color block?
+        if len(combos) == 0:
+            # if a block is all transparent pixels or outside image bounds,
+            # no unique colors will be found
+            bg = 0 if len(colors) == 0 else colors[0]
+            return (0, 0, bg)
+        # score every char with every (bg, fg) combo at once:
+        # diff = sum of diffs of fg pixels if fg, + bg pixels if bg
+        combos = np.array(combos)
+        combo_colors, combo_indices = np.unique(combos, return_inverse=True)
+        bg_indices, fg_indices = combo_indices.reshape(combos.shape).T
+        # (pixels, colors) diff of each source pixel from each combo color
+        pixel_diffs = self.color_diffs[src_block.ravel()][:, combo_colors].astype(np.float64)
+        # indices of chars to score, if not all of them
+        chars = None
+        if self.candidates:
+            chars = self.get_candidate_chars(src_block,
+                                             pixel_diffs[:, bg_indices[0]],
+                                             pixel_diffs[:, fg_indices[0]])
+        char_mask_matrix = self.char_mask_matrix if chars is None else self.char_mask_matrix[chars]
+        # (chars, colors) summed diffs of each char's fg pixels if that color
+        fg_diffs = char_mask_matrix @ pixel_diffs
+        # ...and of each char's bg pixels
+        bg_diffs = pixel_diffs.sum(axis=0) - fg_diffs
+        if len(combo_colors) >= MIN_PAIRED_COLORS and \
+           len(combos) == len(combo_colors) * (len(combo_colors) - 1):
+            # every pair of colors is a combo, so a char's least diff is its
+            # diff with some fg color plus its least bg diff of any other
+            # color; only chars that tie for best need every combo scored
+            least = np.argpartition(bg_diffs, 1, axis=1)[:, :2]
+            least_diffs = np.take_along_axis(bg_diffs, least, axis=1)
+            other_bg_diffs = np.where(np.arange(len(combo_colors)) == least[:, :1],
+                                      least_diffs[:, 1:], least_diffs[:, :1])
+            char_diffs = (fg_diffs + other_bg_diffs).min(axis=1)
+            best_chars = np.flatnonzero(char_diffs <= char_diffs.min() + DIFF_TOLERANCE)
+            fg_diffs, bg_diffs = fg_diffs[best_chars], bg_diffs[best_chars]
+            chars = best_chars if chars is None else chars[best_chars]
+        # (combos, chars)
+        diffs = fg_diffs[:, fg_indices].T + bg_diffs[:, bg_indices].T
+        # first (in combo then char order) of least different blocks;
+        # allow for rounding so equal diffs favor earlier ones
+        best = np.flatnonzero(diffs <= diffs.min() + DIFF_TOLERANCE)[0]
+        combo, best_char = divmod(best, len(fg_diffs))
+        if chars is not None:
+            best_char = chars[best_char]
+        best_bg, best_fg = combos[combo]
+        return (best_char, best_fg, best_bg)
+    
+    def get_candidate_chars(self, src_block, bg_diffs, fg_diffs):
+        """
+        Return sorted indices of characters whose features are nearest
+        given block's, given its pixels' diffs from its two most used
+        colors, with either color as fg.
+        """
+        # how much each pixel looks like fg: 1 if it's the fg color,
+        # 0 if it's the bg color
+        total_diffs = bg_diffs + fg_diffs
+        fg_amounts = np.divide(bg_diffs, total_diffs, out=np.full_like(total_diffs, 0.5),
+                               where=total_diffs > 0)
+        features = get_cell_features(fg_amounts.reshape(src_block.shape),
+                                     self.cell_weights)
+        # (2, characters) distances from features, and inverse for
+        # colors swapped
+        distances = np.array([((self.char_features - features) ** 2).sum(axis=1),
+                              ((self.char_features - (1 - features)) ** 2).sum(axis=1)])
+        nearest = np.argpartition(distances, self.candidates, axis=1)
+        return np.unique(nearest[:, :self.candidates])
+
+
+# each worker process's BlockMatcher, set by init_worker
+worker_matcher = None
+
+def init_worker(block_matcher):
+    global worker_matcher
+    worker_matcher = block_matcher
+
+def convert_band(task, block_matcher=None):
+    """
+    Convert given (first row, source image rows, width, height) band of
+    tiles with given BlockMatcher, or worker process's if none, return
+    (first row, chars, fgs, bgs, block cache hits, block cache misses).
+    """
+    block_matcher = block_matcher or worker_matcher
+    y, src_band, width, height = task
+    hits, misses = block_matcher.cache_hits, block_matcher.cache_misses
+    tiles = block_matcher.convert_band(src_band, width, height)
+    return (y,) + tiles + (block_matcher.cache_hits - hits,
+                           block_matcher.cache_misses - misses)
+
+def get_block_cache_report(hits, misses):
+    "Return text for conversion log line reporting block cache hit rate."
+    blocks = hits + misses
+    rate = 100 * hits / blocks if blocks > 0 else 0
+    return 'block cache hit rate %.1f%% (%s of %s blocks)' % (rate, hits, blocks)
+
+
 class ImageConverter:
     
-    tiles_per_tick = 1
+    # finds best tiles; subclasses can use one that picks colors differently
+    block_matcher_class = BlockMatcher
+    # if set, only fully score this many characters nearest each block in
+    # glyph feature index, for each of its two most used colors as fg;
+    # None = score every character. scoring every character finds the
+    # best match, and is usually about as fast.
+    glyph_candidates = None
+    # rows of tiles in each band of work sent to a worker process
+    band_rows = 2
+    # worker processes to convert bands in; None = one per CPU core,
+    # 0 = none, convert a band per update in app's own process
+    processes = None
     lab_color_comparison = True
     # delay in seconds before beginning to convert tiles.
     # lets eg UI catch up to BitmapImageImporter changes to Art.
@@ -63,9 +285,9 @@ class ImageConverter:
         self.src_img = self.src_img.resize((w, h), resample=scale_method)
         # convert source image to art's palette
         self.src_img = self.art.palette.get_palettized_image(self.src_img)
-        self.color_diffs = self.get_generated_color_diffs(self.art.palette.colors)
+        self.color_diffs = self.get_generated_color_diffs(self.art.palette)
         # convert palettized source image to an array for fast comparisons
-        self.src_array = np.fromstring(self.src_img.tobytes(), dtype=np.uint8)
+        self.src_array = np.frombuffer(self.src_img.tobytes(), dtype=np.uint8)
         src_w, src_h = self.src_img.size
         self.src_array = np.reshape(self.src_array, (src_h, src_w))
         # convert charmap to 1-bit color for fast value swaps during
@@ -77,7 +299,7 @@ class ImageConverter:
             bw_pal.append(0)
         bw_pal_img.putpalette(tuple(bw_pal))
         self.char_img = self.char_img.quantize(palette=bw_pal_img)
-        self.char_array = np.fromstring(self.char_img.tobytes(), dtype=np.uint8)
+        self.char_array = np.frombuffer(self.char_img.tobytes(), dtype=np.uint8)
         self.char_array = np.reshape(self.char_array, (self.art.charset.image_height, self.art.charset.image_width))
         # create, size and position image preview
         preview_img = self.src_img.copy()
@@ -106,31 +328,107 @@ class ImageConverter:
                 # characters might end mid-row, bail if so
                 if len(self.char_blocks) > self.art.charset.last_index:
                     break
+        # (characters, char height, char width) masks of each character's
+        # fg pixels
+        self.char_masks = np.array([self.char_array[y0:y1, x0:x1] == 1
+                                    for (x0, y0, x1, y1) in self.char_blocks])
+        # flattened to (characters, pixels) for block scoring
+        self.char_mask_matrix = self.char_masks.reshape((len(self.char_blocks), -1)).astype(np.float64)
+        self.block_matcher = self.get_block_matcher()
+        self.cache_hits, self.cache_misses = 0, 0
+        # (first row, rows) bands of tiles to convert
+        self.bands = [(y, min(self.band_rows, self.art.height - y))
+                      for y in range(0, self.art.height, self.band_rows)]
+        # start workers on every band now, results are written into art
+        # as they come in
+        self.pool = self.get_pool()
+        self.results = []
+        if self.pool:
+            self.results = [self.pool.apply_async(convert_band, (self.get_band_task(y, rows),))
+                            for y, rows in self.bands]
+            self.bands = []
         self.init_success = True
     
-    def get_generated_color_diffs(self, colors):
-        # build table of color diffs
-        unique_colors = len(colors)
-        color_diffs = np.zeros((unique_colors, unique_colors), dtype=np.float32)
+    def get_block_matcher(self):
+        """
+        Return BlockMatcher for our charset and palette. A sequence's frames
+        share the same one, and so its cache of matched blocks.
+        """
+        if self.sequence_converter and self.sequence_converter.block_matcher:
+            return self.sequence_converter.block_matcher
+        # glyph feature index is only needed to pick candidate chars
+        char_features = self.get_char_features() if self.glyph_candidates else None
+        block_matcher = self.block_matcher_class(self.char_w, self.char_h,
+                                                 self.char_mask_matrix,
+                                                 self.color_diffs,
+                                                 char_features,
+                                                 self.glyph_candidates)
+        if self.sequence_converter:
+            self.sequence_converter.block_matcher = block_matcher
+        return block_matcher
+    
+    def get_char_features(self):
+        """
+        Return (characters, cells) array of charset's glyph features,
+        cached in cache dir by charset image's hash.
+        """
+        charset = self.art.charset
+        key = '%s_%sx%s_%s' % (self.app.get_file_hash(charset.image_filename),
+                               self.char_w, self.char_h, len(self.char_blocks))
+        filename = self.app.cache_dir + GLYPH_FEATURE_CACHE_DIR + key + '.npy'
+        if os.path.exists(filename):
+            try:
+                return np.load(filename)
+            except (OSError, ValueError):
+                pass
+        cell_weights = get_cell_weights(self.char_h), get_cell_weights(self.char_w)
+        features = get_cell_features(self.char_masks.astype(np.float64), cell_weights)
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            np.save(filename, features)
+        except OSError:
+            self.app.log("ImageConverter: Couldn't cache glyph features in %s" % filename)
+        return features
+    
+    def get_pool(self):
+        """
+        Return process pool to convert bands in, or None if we're converting
+        in our own process. A sequence's frames share the same pool.
+        """
+        if self.sequence_converter and self.sequence_converter.pool:
+            return self.sequence_converter.pool
+        if self.processes == 0:
+            return None
+        # spawn fresh worker processes rather than forking the app, which
+        # has a window, GL context and possibly threads; only the block
+        # matcher's arrays need to be sent to them
+        context = multiprocessing.get_context('spawn')
+        try:
+            pool = context.Pool(self.processes, init_worker,
+                                (self.block_matcher,))
+        except OSError as e:
+            self.app.log("ImageConverter: Couldn't start worker processes, converting in app's process: %s" % e)
+            return None
+        if self.sequence_converter:
+            self.sequence_converter.pool = pool
+        return pool
+    
+    def get_band_task(self, y, rows):
+        "Return task for convert_band of given band of tiles."
+        src_band = self.src_array[y * self.char_h:(y + rows) * self.char_h]
+        return y, src_band, self.art.width, rows
+    
+    def get_generated_color_diffs(self, palette):
+        "returns (colors, colors) table of diffs of each palette color from each other"
         # option: L*a*b color space conversion for greater accuracy
-        get_color_diff = self.get_lab_color_diff if self.lab_color_comparison else self.get_rgb_color_diff
-        #get_color_diff = self.get_nonlinear_rgb_color_diff
-        for i,color in enumerate(colors):
-            for j,other_color in enumerate(colors):
-                color_diffs[i][j] = get_color_diff(color, other_color)
-        return color_diffs
-    
-    def get_rgb_color_diff(self, color1, color2):
-        r = abs(color1[0] - color2[0])
-        g = abs(color1[1] - color2[1])
-        b = abs(color1[2] - color2[2])
-        a = abs(color1[3] - color2[3])
-        return abs(r + g + b + a)
-    
-    def get_lab_color_diff(self, color1, color2):
-        l1, a1, b1 = rgb_to_lab(*color1[:3])
-        l2, a2, b2 = rgb_to_lab(*color2[:3])
-        return lab_color_diff(l1, a1, b1, l2, a2, b2)
+        if self.lab_color_comparison:
+            lab_colors = palette.get_lab_colors()
+            color_diffs = lab_distance_matrix(lab_colors, lab_colors)
+        else:
+            # sum of RGBA channel diffs
+            colors = np.array(palette.colors, dtype=np.int64)
+            color_diffs = np.abs(colors[:, np.newaxis] - colors[np.newaxis]).sum(axis=2)
+        return color_diffs.astype(np.float32)
     
     def get_nonlinear_rgb_color_diff(self, color1, color2):
         # from http://www.compuphase.com/cmetric.htm
@@ -143,90 +441,33 @@ class ImageConverter:
     def update(self):
         if time.time() < self.start_time + self.start_delay:
             return
-        for i in range(self.tiles_per_tick):
-            x_start, y_start = self.x * self.char_w, self.y * self.char_h
-            x_end, y_end = x_start + self.char_w, y_start + self.char_h
-            block = self.src_array[y_start:y_end, x_start:x_end]
-            char, fg, bg = self.get_best_tile_for_block(block)
-            # get_best_etc sometimes returns 0 for darkest blocks,
-            # but transparency isn't properly supported yet
-            fg = self.art.palette.darkest_index if fg == 0 else fg
-            bg = self.art.palette.darkest_index if bg == 0 else bg
-            self.art.set_tile_at(self.art.active_frame, self.art.active_layer,
-                                 self.x, self.y, char, fg, bg)
-            #print('set block %s,%s to ch %s fg %s bg %s' % (self.x, self.y, char, fg, bg))
-            self.x += 1
-            if self.x >= self.art.width:
-                self.x = 0
-                self.y += 1
-                if self.y >= self.art.height:
-                    self.finish()
-                    break
+        if self.bands:
+            # no workers, convert next band here
+            task = self.get_band_task(*self.bands.pop(0))
+            self.set_band(*convert_band(task, self.block_matcher))
+        for result in [r for r in self.results if r.ready()]:
+            self.results.remove(result)
+            try:
+                self.set_band(*result.get())
+            except:
+                for line in traceback.format_exc().splitlines():
+                    self.app.log(line)
+                self.finish(True)
+                return
+        if not self.bands and not self.results:
+            self.finish()
     
-    def get_color_combos_for_block(self, src_block):
-        """
-        returns # of unique colors, AND
-        list of unique (fg, bg) color index tuples for given block
-        """
-        # get unique colors in source block
-        colors, counts = np.unique(src_block, False, False, return_counts=True)
-        # early out for single-color blocks
-        if len(colors) == 1:
-            return colors, []
-        # sort by most to least used colors
-        color_counts = []
-        for i,color in enumerate(colors):
-            color_counts += [(color, counts[i])]
-        color_counts.sort(key=lambda item: item[1], reverse=True)
-        combos = []
-        for color1,count1 in color_counts:
-            for color2,count2 in color_counts:
-                if color1 == color2:
-                    continue
-                # fg/bg color swap SHOULD be allowed
-                if (color1, color2) in combos:
-                    continue
-                combos.append((color1, color2))
-        return colors, combos
-    
-    def get_best_tile_for_block(self, src_block):
-        "returns a (char, fg, bg) tuple for the best match of given block"
-        colors, combos = self.get_color_combos_for_block(src_block)
-        # single color block?
-        if len(combos) == 0:
-            # if a block is all transparent pixels or outside image bounds,
-            # no unique colors will be found
-            bg = 0 if len(colors) == 0 else colors[0]
-            return (0, 0, bg)
-        # compare all combos + chars w/ source block
-        best_char = 0
-        best_diff = 9999999999999
-        best_fg, best_bg = 0, 0
-        for bg,fg in combos:
-            # reset char index before each run through charset
-            char_index = 0
-            char_array = self.char_array.copy()
-            # replace 1-bit color of char image with fg and bg colors
-            char_array[char_array == 0] = bg
-            char_array[char_array == 1] = fg
-            for (x0, y0, x1, y1) in self.char_blocks:
-                char_block = char_array[y0:y1, x0:x1]
-                # using array of difference values w/ fancy numpy indexing,
-                # sum() it
-                # (used to be get_block_diff(block1, block2))
-                diff = self.color_diffs[src_block, char_block].sum()
-                # no difference = return immediately
-                if diff == 0:
-                    return (char_index, fg, bg)
-                if diff < best_diff:
-                    best_diff = diff
-                    best_char = char_index
-                    best_fg, best_bg = fg, bg
-                    #print('%s is new best char index, diff %s:' % (char_index, diff))
-                char_index += 1
-        # return best (least different to source block) char/fg/bg found
-        #print('%s is best char index, diff %s:' % (best_char, best_diff))
-        return (best_char, best_fg, best_bg)
+    def set_band(self, y, chars, fgs, bgs, cache_hits, cache_misses):
+        "Write given converted band of tiles starting at given row into art."
+        self.cache_hits += cache_hits
+        self.cache_misses += cache_misses
+        # best tile matching sometimes returns 0 for darkest blocks,
+        # but transparency isn't properly supported yet
+        darkest = self.art.palette.darkest_index
+        fgs = np.where(fgs == 0, darkest, fgs)
+        bgs = np.where(bgs == 0, darkest, bgs)
+        self.art.fill_rect(self.art.active_frame, self.art.active_layer,
+                           0, y, self.art.width, len(chars), chars, fgs, bgs)
     
     def print_block(self, block, fg, bg):
         "prints ASCII representation of a block with . and # as white and black"
@@ -243,10 +484,17 @@ class ImageConverter:
     
     def finish(self, cancelled=False):
         self.finished = True
-        if not self.sequence_converter:
+        if self.sequence_converter:
+            self.sequence_converter.cache_hits += self.cache_hits
+            self.sequence_converter.cache_misses += self.cache_misses
+        else:
+            if self.pool:
+                # drop any bands still being converted
+                self.pool.terminate()
             time_taken = time.time() - self.start_time
             verb = 'cancelled' if cancelled else 'finished'
-            self.app.log('Conversion of image %s %s after %.3f seconds' % (self.image_filename, verb, time_taken))
+            cache_report = get_block_cache_report(self.cache_hits, self.cache_misses)
+            self.app.log('Conversion of image %s %s after %.3f seconds, %s' % (self.image_filename, verb, time_taken, cache_report))
             self.app.converter = None
         self.preview_sprite = None
         self.app.update_window_title()
@@ -1,7 +1,9 @@
-import os
+import os, struct
+import numpy as np
 from OpenGL import GL
-from PIL import Image, ImageChops, GifImagePlugin
+from PIL import Image
 
+import art_raster
 from framebuffer import ExportFramebuffer, ExportFramebufferNoCRT
 
 def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0, 0)):
@@ -11,11 +13,20 @@ def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0,
     w = art.charset.char_width * art.width
     h = art.charset.char_height * art.height
     w, h = int(w * scale), int(h * scale)
-    # error out if over max texture size
+    # without GL, render in software (without CRT)
+    if app.headless:
+        return art_raster.get_frame_image(art, frame, scale, bg_color,
+                                          app.show_hidden_layers)
+    # over max texture size, render in software instead
     if w > app.max_texture_size or h > app.max_texture_size:
-        app.log("ERROR: Image output size (%s x %s) exceeds your hardware's max supported texture size (%s x %s)!" % (w, h, app.max_texture_size, app.max_texture_size), error=True)
-        app.log('  Please export at a smaller scale or chop up your artwork :[', error=True)
-        return None
+        app.log("Image output size (%s x %s) exceeds your hardware's max supported texture size (%s x %s), rendering in software" % (w, h, app.max_texture_size, app.max_texture_size))
+        if allow_crt and not app.fb.disable_crt:
+            app.log('  CRT filter is only available for smaller images')
+        # cursor might be hovering, undo any preview changes
+        for edit in app.cursor.preview_edits:
+            edit.undo()
+        return art_raster.get_frame_image(art, frame, scale, bg_color,
+                                          app.show_hidden_layers)
     # create CRT framebuffer
     post_fb = post_fb_class(app, w, h)
     # create render target and target framebuffer that will become image
@@ -52,71 +63,138 @@ def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0,
     src_img = src_img.transpose(Image.FLIP_TOP_BOTTOM)
     return src_img
 
+def get_gif_colors(art, layers, bg_color=None):
+    """
+    Return (table size bits, GIF color table bytes, array mapping palette
+    index to GIF index) for given layers of given art, which may use more
+    colors than GIF's 256; if so the least used map to their nearest kept
+    color.
+    """
+    # count uses of each color index in all frames
+    counts = np.zeros(1, dtype=np.int64)
+    for frame in range(art.frames):
+        for stack in (art.fg_colors, art.bg_colors):
+            frame_counts = np.bincount(np.asarray(stack[frame])[layers].ravel(),
+                                       minlength=len(counts))
+            frame_counts[:len(counts)] += counts
+            counts = frame_counts
+    colors = art_raster.get_palette_colors(art.palette, len(counts) - 1)
+    colors = np.round(colors[:, :3] * 255).astype(np.uint8)
+    counts = np.pad(counts, (0, len(colors) - len(counts)))
+    # color 0 is always transparent (or bg), and GIF index 0
+    counts[0] = 0
+    used = np.nonzero(counts)[0]
+    used = used[np.argsort(-counts[used], kind='stable')]
+    kept = np.concatenate(([0], used[:255]))
+    lookup = np.zeros(len(colors), dtype=np.uint8)
+    lookup[kept] = np.arange(len(kept))
+    if len(used) > 255:
+        dropped = used[255:]
+        diff = colors[dropped, np.newaxis].astype(int) - colors[kept[1:]]
+        lookup[dropped] = 1 + np.argmin((diff ** 2).sum(axis=2), axis=1)
+    table = colors[kept]
+    if bg_color is not None:
+        table[0] = [round(c * 255) for c in bg_color[:3]]
+    # table size is a power of 2, at least 2
+    bits = max(1, (len(table) - 1).bit_length())
+    table = np.concatenate((table, np.zeros((2 ** bits - len(table), 3),
+                                            dtype=np.uint8)))
+    return bits, table.tobytes(), lookup
+
+def get_changed_box(stacks, prev_stacks, char_width, char_height):
+    """
+    Return (x0, y0, x1, y1) pixel box around tiles that differ between
+    given frames' tile data, None if none do.
+    """
+    changed = np.zeros(stacks[0].shape[1:], dtype=bool)
+    for tiles, prev_tiles in zip(stacks, prev_stacks):
+        changed |= (tiles != prev_tiles).any(axis=0)
+    rows, cols = np.nonzero(changed.any(axis=1))[0], np.nonzero(changed.any(axis=0))[0]
+    if len(rows) == 0:
+        return None
+    return (cols[0] * char_width, rows[0] * char_height,
+            (cols[-1] + 1) * char_width, (rows[-1] + 1) * char_height)
+
+def get_union_box(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def get_gif_frame(indices, box, delay, disposal, transparency):
+    "Return bytes of one GIF frame: given box of given index array."
+    x0, y0, x1, y1 = box
+    img = Image.fromarray(np.ascontiguousarray(indices[y0:y1, x0:x1]), 'P')
+    # graphic control extension: disposal, delay in 1/100s, transparency
+    data = struct.pack('<3sBHBB', b'!\xf9\x04',
+                       disposal << 2 | int(transparency), delay, 0, 0)
+    # image descriptor, no local color table, LZW data in sub-blocks
+    data += struct.pack('<c4HBB', b',', x0, y0, x1 - x0, y1 - y0, 0, 8)
+    return data + img.tobytes('gif', 'P') + b'\0'
+
 def export_animation(app, art, out_filename, bg_color=None, loop=True):
-    # get list of rendered frame images
-    frames = []
-    # use arbitrary color for transparency
-    i_transp = art.palette.get_random_non_palette_color()
+    """
+    Write all frames of given art to an animated GIF. Frames are made
+    straight from tile data as palette indices, and after the first only
+    the box around changed tiles is written.
+    """
     # if bg color is specified, this isn't art mode; play along
-    if bg_color is not None:
-        f_transp = bg_color
-        art.palette.colors[0] = (round(bg_color[0] * 255),
-                                 round(bg_color[1] * 255),
-                                 round(bg_color[2] * 255),
-                                 255)
-    else:
-        # GL wants floats
-        f_transp = (i_transp[0]/255, i_transp[1]/255, i_transp[2]/255, 1.)
-    for frame in range(art.frames):
-        frame_img = get_frame_image(app, art, frame, allow_crt=False,
-                                    scale=1, bg_color=f_transp)
-        if bg_color is not None:
-            # if bg color is specified, assume no transparency
-            frame_img = art.palette.get_palettized_image(frame_img, force_no_transparency=True)
-        else:
-            frame_img = art.palette.get_palettized_image(frame_img, i_transp[:3])
-        frames.append(frame_img)
-    # compile frames into animated GIF with proper frame delays
-    # technique thanks to:
-    # https://github.com/python-pillow/Pillow/blob/master/Scripts/gifmaker.py
-    output_img = open(out_filename, 'wb')
-    for i,img in enumerate(frames):
-        delay = art.frame_delays[i] * 1000
-        if i == 0:
-            data = GifImagePlugin.getheader(img)[0]
-            # PIL only wants to write GIF87a for some reason...
-            # welcome to 1989 B]
-            data[0] = data[0].replace(b'7', b'9')
-            # TODO: loop doesn't work?
-            if bg_color is not None:
-                # if bg color is specified, assume no transparency
-                if loop:
-                    data += GifImagePlugin.getdata(img, duration=delay, loop=0)
-                else:
-                    data += GifImagePlugin.getdata(img, duration=delay)
-            else:
-                data += GifImagePlugin.getdata(img, duration=delay,
-                                               transparency=0, loop=0)
-            for b in data:
-                output_img.write(b)
-            continue
-        delta = ImageChops.subtract_modulo(img, frames[i-1])
-        # Image.getbbox() rather unhelpfully returns None if no delta
-        dw, dh = delta.size
-        bbox = delta.getbbox() or (0, 0, dw, dh)
-        for b in GifImagePlugin.getdata(img.crop(bbox), offset=bbox[:2],
-                                        duration=delay, transparency=0,
-                                        loop=0):
-            output_img.write(b)
-    output_img.write(b';')
-    output_img.close()
-    output_format = 'Animated GIF'
-    #app.log('%s exported (%s)' % (out_filename, output_format))
+    transparency = bg_color is None
+    layers = art_raster.get_layer_order(art, app.show_hidden_layers)
+    frame_stacks = art.get_frame_stacks()
+    cw, ch = art.charset.char_width, art.charset.char_height
+    bits, table, lookup = get_gif_colors(art, layers, bg_color)
+    w, h = art.width * cw, art.height * ch
+    def needs_clear(indices, prev_indices, box):
+        "True if prev frame must be cleared for given frame's transparency"
+        if not transparency or box is None:
+            return False
+        x0, y0, x1, y1 = box
+        return ((indices[y0:y1, x0:x1] == 0) &
+                (prev_indices[y0:y1, x0:x1] != 0)).any()
+    # frame to write once we know whether the next needs it cleared
+    prev = None
+    full_box = (0, 0, w, h)
+    with open(out_filename, 'wb') as f:
+        # header, logical screen descriptor with global color table
+        f.write(struct.pack('<6s2HBBB', b'GIF89a', w, h, 0xf0 | (bits - 1), 0, 0))
+        f.write(table)
+        if loop:
+            # loop forever
+            f.write(b'!\xff\x0bNETSCAPE2.0\x03\x01\0\0\0')
+        for frame in range(art.frames):
+            stacks = [np.asarray(stack[frame])[layers] for stack in frame_stacks]
+            indices = lookup[art_raster.render_tile_indices(art.charset, *stacks)]
+            delay = int(round(art.frame_delays[frame] * 100))
+            if not prev:
+                first_indices = indices
+                prev = (stacks, indices, full_box, indices, delay)
+                continue
+            prev_stacks, prev_indices, prev_box, prev_data, prev_delay = prev
+            box = get_changed_box(stacks, prev_stacks, cw, ch)
+            cleared = needs_clear(indices, prev_indices, box)
+            if cleared:
+                # clearing only covers a frame's own box
+                prev_box = get_union_box(box, prev_box)
+            f.write(get_gif_frame(prev_data, prev_box, prev_delay,
+                                  2 if cleared else 1, transparency))
+            data = indices
+            if cleared:
+                box = get_union_box(box, prev_box)
+            elif transparency:
+                # unchanged pixels can show through, which compresses well
+                data = np.where(indices == prev_indices, 0, indices)
+            # GIF frames can't be empty; redraw a pixel for the delay
+            box = box or (0, 0, 1, 1)
+            prev = (stacks, indices, box, data, delay)
+        # at loop, first frame (drawn in full) may need last cleared
+        cleared = loop and needs_clear(first_indices, prev[1], full_box)
+        box = full_box if cleared else prev[2]
+        f.write(get_gif_frame(prev[3], box, prev[4], 2 if cleared else 1,
+                              transparency))
+        f.write(b';')
 
 
 def export_still_image(app, art, out_filename, crt=True, scale=1, bg_color=None):
     # respect "disable CRT entirely" setting for slow GPUs
-    crt = False if app.fb.disable_crt else crt
+    crt = False if app.headless or app.fb.disable_crt else crt
     # just write RGBA if palette has more than one color with <1 alpha
     # TODO: add PNG/PNGset export option for palettized;
     # for now always export 32bit
@@ -2,6 +2,7 @@
 # from EDSCII
 
 import math
+import numpy as np
 
 def rgb_to_xyz(r, g, b):
     r /= 255.0
@@ -60,3 +61,33 @@ def lab_color_diff(l1, a1, b1, l2, a2, b2):
     da = (a1 - a2)**2
     db = (b1 - b2)**2
     return math.sqrt(dl + da + db)
+
+def rgb_to_lab_array(colors):
+    """
+    Return (..., 3) float64 array of L*a*b values of given (..., 3 or 4)
+    array of base-255 RGB(A) colors, eg a palette's; alpha is ignored.
+    Same math as rgb_to_xyz and xyz_to_lab, for all colors at once.
+    """
+    rgb = np.asarray(colors, dtype=np.float64)[..., :3] / 255.0
+    rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055)**2.4, rgb / 12.92)
+    rgb *= 100
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    # observer: 2deg, illuminant: D65
+    x = (r * 0.4124 + g * 0.3576 + b * 0.1805) / 95.047
+    y = (r * 0.2126 + g * 0.7152 + b * 0.0722) / 100.0
+    z = (r * 0.0193 + g * 0.1192 + b * 0.9505) / 108.883
+    xyz = np.stack((x, y, z), axis=-1)
+    xyz = np.where(xyz > 0.008856, xyz**(1.0/3), (7.787 * xyz) + (16.0 / 116))
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    return np.stack(((116 * y) - 16, 500 * (x - y), 200 * (y - z)), axis=-1)
+
+def lab_distance_matrix(labs1, labs2):
+    """
+    Return (len(labs1), len(labs2)) array of lab_color_diff of each of
+    given (n, 3) L*a*b colors from each of other given ones.
+    """
+    deltas = labs1[:, np.newaxis, :] - labs2[np.newaxis, :, :]
+    dl = deltas[..., 0]**2
+    da = deltas[..., 1]**2
+    db = deltas[..., 2]**2
+    return np.sqrt(dl + da + db)
@@ -1,9 +1,10 @@
 import os.path, math, time
+import numpy as np
 from random import randint
 from PIL import Image
 
 from texture import Texture
-from lab_color import rgb_to_lab, lab_color_diff
+from lab_color import rgb_to_lab_array, lab_distance_matrix
 
 PALETTE_DIR = 'palettes/'
 PALETTE_EXTENSIONS = ['png', 'gif', 'bmp']
@@ -61,10 +62,13 @@ class Palette:
         src_img = src_img.convert('RGBA')
         width, height = src_img.size
         # store texture for chooser preview etc
-        self.src_texture = Texture(src_img.tobytes(), width, height)
+        if not self.app.headless:
+            self.src_texture = Texture(src_img.tobytes(), width, height)
         # scan image L->R T->B for unique colors, store em as tuples
         # color 0 is always fully transparent
         self.colors = [(0, 0, 0, 0)]
+        # L*a*b values of colors, made when first needed
+        self.lab_colors = None
         # determine lightest and darkest colors in palette for defaults
         lightest = 0
         darkest = 255 * 3 + 1
@@ -93,7 +97,8 @@ class Palette:
             x += 1
         # debug: save out generated palette texture
         #img.save('palette.png')
-        self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
+        if not self.app.headless:
+            self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
     
     def has_updated(self):
         "return True if source image file has changed since last check"
@@ -182,19 +187,17 @@ class Palette:
         b_diff = abs(color_a[2] - color_b[2])
         return (r_diff + g_diff + b_diff) <= tolerance
     
+    def get_lab_colors(self):
+        "returns (colors, 3) array of L*a*b values of this palette's colors"
+        if self.lab_colors is None:
+            self.lab_colors = rgb_to_lab_array(self.colors)
+        return self.lab_colors
+    
     def get_closest_color_index(self, r, g, b):
-        "returns index of closest color in this palette to given color (kinda slow?)"
-        closest_diff = 99999999999
-        closest_diff_index = -1
-        for i,color in enumerate(self.colors):
-            l1, a1, b1 = rgb_to_lab(r, g, b)
-            l2, a2, b2 = rgb_to_lab(*color[:3])
-            diff = lab_color_diff(l1, a1, b1, l2, a2, b2)
-            if diff < closest_diff:
-                closest_diff = diff
-                closest_diff_index = i
-        #print('%s is closest to input color %s' % (self.colors[closest_diff_index], (r, g, b)))
-        return closest_diff_index
+        "returns index of closest color in this palette to given color"
+        lab = rgb_to_lab_array([(r, g, b)])
+        diffs = lab_distance_matrix(lab, self.get_lab_colors())[0]
+        return int(np.argmin(diffs))
     
     def get_random_color_index(self):
         # exclude transparent first index
@@ -219,6 +222,7 @@ class PaletteFromList(Palette):
             else:
                 colors.append(color)
         self.colors = [(0, 0, 0, 0)] + colors
+        self.lab_colors = None
         lightest = 0
         darkest = 255 * 3 + 1
         for color in self.colors:
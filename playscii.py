@@ -20,7 +20,7 @@ if platform.system() == 'Darwin' and hasattr(sys, 'frozen'):
     os.chdir(os.path.abspath(os.path.dirname(sys.executable)))
 
 # app imports
-import ctypes, time, hashlib, importlib, traceback
+import ctypes, time, hashlib, importlib, multiprocessing, traceback
 import webbrowser
 import sdl2
 import sdl2.ext
@@ -41,6 +41,9 @@ except: pass
 # submodules - set here so cfg file can modify them all easily
 from audio import AudioLord
 from shader import ShaderLord
+from background_save import SaveLord
+from art_index import ArtIndexLord
+from thumbnail import ThumbnailLord
 from camera import Camera
 from charset import CharacterSet, CharacterSetLord, CHARSET_DIR
 from palette import Palette, PaletteLord, PALETTE_DIR
@@ -51,12 +54,11 @@ from renderable import TileRenderable, OnionTileRenderable
 from renderable_line import DebugLineRenderable
 from renderable_sprite import UIBGTextureRenderable, SpriteRenderable
 from framebuffer import Framebuffer
-from art import ART_DIR, ART_FILE_EXTENSION, ART_SCRIPT_DIR
+from art import ART_DIR, ART_FILE_EXTENSION, ART_SCRIPT_DIR, THUMBNAIL_CACHE_DIR
 from ui import UI, OIS_WIDTH
 from cursor import Cursor
 from grid import ArtGrid
 from input_handler import InputLord
-from ui_file_chooser_dialog import THUMBNAIL_CACHE_DIR
 # some classes are imported only so the cfg file can modify their defaults
 from renderable_line import LineRenderable
 from ui_swatch import CharacterSetSwatch
@@ -129,6 +131,9 @@ class Application:
     img_convert_message = 'converting bitmap image: %s'
     # can_edit: if False, user can't use art or edit functionality
     can_edit = True
+    # headless: no window or GL context, eg batch export; art renders in
+    # software and charsets/palettes don't create textures
+    headless = False
     # these values should be written to cfg files on exit
     # key = module path, value = [member object (blank if self), var name]
     persistent_setting_names = {
@@ -163,6 +168,8 @@ class Application:
         self.timestep = (1 / self.update_rate) * 1000
         # for FPS counter
         self.frame_time, self.fps = 0, 0
+        # bytes of tile/geo data sent to GL buffers this frame and last frame
+        self.buffer_bytes_uploaded, self.last_buffer_bytes_uploaded = 0, 0
         self.should_quit = False
         self.mouse_x, self.mouse_y = 0, 0
         self.mouse_dx, self.mouse_dy = 0, 0
@@ -303,6 +310,12 @@ class Application:
         self.set_icon()
         # SHADERLORD rules shader init/destroy, hot reload
         self.sl = ShaderLord(self)
+        # SAVELORD writes saved files in the background
+        self.svl = SaveLord(self)
+        # ARTINDEXLORD keeps art files' metadata for art chooser
+        self.ail = ArtIndexLord(self)
+        # THUMBNAILLORD makes art thumbnails without holding up the UI
+        self.thl = ThumbnailLord(self)
         # separate cameras for edit vs game mode
         self.art_camera = Camera(self)
         self.camera = self.art_camera
@@ -554,6 +567,8 @@ class Application:
     
     def revert_active_art(self):
         filename = self.ui.active_art.filename
+        # unsaved changes in journal would be recovered on load
+        self.ui.active_art.discard_journal()
         self.close_art(self.ui.active_art)
         self.load_art_for_edit(filename)
     
@@ -566,7 +581,7 @@ class Application:
         dirnames = []
         # build list of dirs to check, by priority:
         # gamedir/subdir if it exists, then ./subdir, then ./
-        if self.gw.game_dir is not None:
+        if self.gw and self.gw.game_dir is not None:
             game_dir = self.gw.game_dir
             if subdir:
                 game_dir += subdir
@@ -791,6 +806,8 @@ class Application:
             self.render()
             self.last_frame_end = self.get_elapsed_time()
             self.frames += 1
+            self.last_buffer_bytes_uploaded = self.buffer_bytes_uploaded
+            self.buffer_bytes_uploaded = 0
             self.sl.check_hot_reload()
             self.csl.check_hot_reload()
             self.pl.check_hot_reload()
@@ -861,6 +878,9 @@ class Application:
         if self.ui.visible:
             self.ui.update()
         self.al.update()
+        self.svl.update()
+        self.ail.update()
+        self.thl.update()
     
     def debug_onion_frames(self):
         "debug function to log onion renderable state"
@@ -988,6 +1008,10 @@ class Application:
     
     def quit(self):
         if self.init_success:
+            # finish any saves in progress
+            self.svl.destroy()
+            self.ail.destroy()
+            self.thl.destroy()
             self.save_persistent_config()
             self.save_session()
             for r in self.edit_renderables:
@@ -1201,6 +1225,8 @@ def get_app():
     return app
 
 if __name__ == "__main__":
+    # image conversion worker processes of a frozen build start here
+    multiprocessing.freeze_support()
     app = get_app()
     error = app.main_loop()
     app.quit()
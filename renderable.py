@@ -1,7 +1,7 @@
 import os, math, ctypes
 import numpy as np
 from OpenGL import GL
-from art import VERT_LENGTH
+from art import VERT_LENGTH, UV_STRIDE
 from palette import MAX_COLORS
 
 # inactive layer alphas
@@ -9,6 +9,11 @@ LAYER_VIS_FULL = 1
 LAYER_VIS_DIM = 0.25
 LAYER_VIS_NONE = 0
 
+# bytes per tile in char/fg/bg buffers: 4 verts * 1 float
+TILE_FLOAT_BYTES = 4 * 4
+# bytes per tile in UV buffer: 4 verts * 2 floats
+TILE_UV_BYTES = UV_STRIDE * 4
+
 
 class TileRenderable:
     """
@@ -112,17 +117,21 @@ class TileRenderable:
         # tile data buffers
         # use GL_DYNAMIC_DRAW given they change every time a char/color changes
         self.char_buffer, self.uv_buffer = GL.glGenBuffers(2)
+        # art stores one value per tile, expand to per-vertex floats
+        chars, uvs, fg, bg = self.art.get_vertex_tile_data(self.frame)
+        # tile count our tile buffers were allocated for
+        self.buffer_tiles = self.art.layers * self.art.width * self.art.height
         # character indices (which become vertex UVs)
-        self.update_buffer(self.char_buffer, self.art.chars[self.frame],
+        self.update_buffer(self.char_buffer, chars,
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'charIndex', 1)
         # UV "mods" - modify UV derived from character index
-        self.update_buffer(self.uv_buffer, self.art.uv_mods[self.frame],
+        self.update_buffer(self.uv_buffer, uvs,
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'uvMod', 2)
         self.fg_buffer, self.bg_buffer = GL.glGenBuffers(2)
         # foreground/background color indices (which become rgba colors)
-        self.update_buffer(self.fg_buffer, self.art.fg_colors[self.frame],
+        self.update_buffer(self.fg_buffer, fg,
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'fgColorIndex', 1)
-        self.update_buffer(self.bg_buffer, self.art.bg_colors[self.frame],
+        self.update_buffer(self.bg_buffer, bg,
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'bgColorIndex', 1)
     
     def update_geo_buffers(self):
@@ -131,28 +140,91 @@ class TileRenderable:
         # total vertex count probably changed
         self.vert_count = int(len(self.art.elem_array))
     
-    def update_tile_buffers(self, update_chars, update_uvs, update_fg, update_bg):
-        "Update GL data arrays for tile characters, fg/bg colors, transforms."
+    def update_tile_buffers(self, update_chars, update_uvs, update_fg,
+                            update_bg, regions=None):
+        """
+        Update GL data arrays for tile characters, fg/bg colors, transforms.
+        If a table of {layer: [x0, y0, x1, y1]} changed tile regions is given,
+        upload only those parts of the buffers.
+        """
+        art = self.art
+        tiles = art.layers * art.width * art.height
+        # buffers must all be reallocated at full size if art size changed
+        if tiles != self.buffer_tiles:
+            update_chars = update_uvs = update_fg = update_bg = True
+            self.buffer_tiles = tiles
+        elif regions is not None:
+            self.update_tile_buffer_regions(update_chars, update_uvs,
+                                            update_fg, update_bg, regions)
+            return
+        chars, uvs, fg, bg = art.get_vertex_tile_data(self.frame,
+                                                      update_chars,
+                                                      update_uvs,
+                                                      update_fg,
+                                                      update_bg)
         updates = {}
         if update_chars:
-            updates[self.char_buffer] = self.art.chars
+            updates[self.char_buffer] = chars
         if update_uvs:
-            updates[self.uv_buffer] = self.art.uv_mods
+            updates[self.uv_buffer] = uvs
         if update_fg:
-            updates[self.fg_buffer] = self.art.fg_colors
+            updates[self.fg_buffer] = fg
         if update_bg:
-            updates[self.bg_buffer] = self.art.bg_colors
+            updates[self.bg_buffer] = bg
         for update in updates:
-            self.update_buffer(update, updates[update][self.frame],
+            self.update_buffer(update, updates[update],
                                GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW,
                                GL.GL_FLOAT, None, None)
     
+    def update_tile_buffer_regions(self, update_chars, update_uvs, update_fg,
+                                   update_bg, regions):
+        "Upload only given {layer: [x0, y0, x1, y1]} regions of tile buffers."
+        w, h = self.art.width, self.art.height
+        for layer, (x0, y0, x1, y1) in regions.items():
+            layer_start = layer * w * h
+            # upload narrow regions row by row, wide ones in one range
+            if (x1 - x0) * 2 < w:
+                ranges = [(layer_start + y * w + x0, layer_start + y * w + x1)
+                          for y in range(y0, y1)]
+            else:
+                ranges = [(layer_start + y0 * w + x0,
+                           layer_start + (y1 - 1) * w + x1)]
+            for start, end in ranges:
+                chars, uvs, fg, bg = self.art.get_vertex_tile_data(self.frame,
+                                                                   update_chars,
+                                                                   update_uvs,
+                                                                   update_fg,
+                                                                   update_bg,
+                                                                   start, end)
+                if update_chars:
+                    self.update_buffer_range(self.char_buffer, chars,
+                                             start * TILE_FLOAT_BYTES)
+                if update_uvs:
+                    self.update_buffer_range(self.uv_buffer, uvs,
+                                             start * TILE_UV_BYTES)
+                if update_fg:
+                    self.update_buffer_range(self.fg_buffer, fg,
+                                             start * TILE_FLOAT_BYTES)
+                if update_bg:
+                    self.update_buffer_range(self.bg_buffer, bg,
+                                             start * TILE_FLOAT_BYTES)
+    
+    def update_buffer_range(self, buffer_index, array, offset):
+        "Overwrite part of given array buffer, starting at given byte offset."
+        if self.log_buffer_updates:
+            self.app.log('update_buffer_range: %s, %s bytes at %s' % (buffer_index, array.nbytes, offset))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer_index)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, offset, array.nbytes, array)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self.app.buffer_bytes_uploaded += array.nbytes
+    
     def update_buffer(self, buffer_index, array, target, buffer_type, data_type,
                       attrib_name, attrib_size):
         if self.log_buffer_updates:
             self.app.log('update_buffer: %s, %s, %s, %s, %s, %s, %s' % (buffer_index, array, target, buffer_type, data_type, attrib_name, attrib_size))
         GL.glBindBuffer(target, buffer_index)
         GL.glBufferData(target, array.nbytes, array, buffer_type)
+        self.app.buffer_bytes_uploaded += array.nbytes
         if attrib_name:
             attrib = self.shader.get_attrib_location(attrib_name)
             GL.glEnableVertexAttribArray(attrib)
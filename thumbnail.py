@@ -0,0 +1,148 @@
+import mmap, os, threading
+from collections import deque
+
+import numpy as np
+
+from art import THUMBNAIL_CACHE_DIR
+from art_format import TILE_ARRAY_NAMES, read_art_file, read_frame_arrays, read_tile_lists
+from art_raster import render_tiles, get_image
+from texture import Texture
+
+# color of placeholder shown while a thumbnail is being made
+PLACEHOLDER_COLOR = (48, 48, 48, 255)
+
+def read_first_frame(filename):
+    """
+    Return (header dict, tile arrays) of only given art file's first frame,
+    enough to make its thumbnail.
+    """
+    d = read_art_file(filename)
+    d['frames'] = d['frames'][:1]
+    if d.get('version', 1) < 2:
+        return d, read_tile_lists(d)
+    # only read the blocks we need
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = read_frame_arrays(data, d, 0)
+        arrays = {name: np.array([array]) for name, array in arrays.items()}
+        data.close()
+    return d, arrays
+
+def render_first_frame(d, arrays, charset, palette):
+    "Return PIL image of first frame of art read by read_first_frame."
+    # version 2+ files list layers once, version 1 files for each frame
+    layers = d['layers'] if 'layers' in d else d['frames'][0]['layers']
+    order = sorted(range(len(layers)), key=lambda i: layers[i]['z'])
+    order = [i for i in order if layers[i].get('visible', 1)]
+    tiles = [arrays[name][0][order] for name in TILE_ARRAY_NAMES]
+    return get_image(render_tiles(charset, palette, *tiles))
+
+
+class ThumbnailLord:
+    """
+    Makes thumbnails of art files for the art chooser, cached in cache dir.
+    A worker thread reads and renders (in software) the art. Only the most
+    recently requested thumbnails are made, so scrolling through many
+    files doesn't back up.
+    """
+    max_pending = 8
+    "Max thumbnails waiting to be made; older requests are dropped"
+    
+    def __init__(self, app):
+        self.app = app
+        self.dir = app.cache_dir + THUMBNAIL_CACHE_DIR
+        self.pending = deque(maxlen=self.max_pending)
+        "(art filename, thumbnail filename, charset, palette) for worker."
+        self.condition = threading.Condition()
+        self.finished = deque()
+        "Thumbnail filenames worker has written."
+        self.thread = None
+        self.generation = 0
+        "Incremented when a thumbnail is made, so views know to refresh."
+        self.placeholders = {}
+        "Placeholder textures by size."
+    
+    def get_filename(self, key):
+        return self.dir + key + '.png'
+    
+    def get_thumbnail(self, art_filename, key, charset_name, palette_name):
+        """
+        Return filename of given art's thumbnail with given key, or None
+        and queue it to be made if it isn't yet.
+        """
+        thumb_filename = self.get_filename(key)
+        if os.path.exists(thumb_filename):
+            return thumb_filename
+        # load these on main thread, as they create GL textures
+        charset = self.app.load_charset(charset_name)
+        palette = self.app.load_palette(palette_name)
+        if charset and palette:
+            self.queue(art_filename, thumb_filename, charset, palette)
+        return None
+    
+    def queue(self, art_filename, thumb_filename, charset, palette):
+        """
+        Queue a thumbnail to be made of given art, which uses given
+        CharacterSet and Palette, replacing any queued for same art.
+        """
+        with self.condition:
+            for request in list(self.pending):
+                if request[0] == art_filename:
+                    self.pending.remove(request)
+            self.pending.append((art_filename, thumb_filename, charset,
+                                 palette))
+            self.condition.notify()
+        if not self.thread:
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+    
+    def remove(self, key):
+        "Delete thumbnail with given key, eg for an art file that's changed."
+        thumb_filename = self.get_filename(key)
+        if os.path.exists(thumb_filename):
+            os.remove(thumb_filename)
+    
+    def worker(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                # newest request is likeliest to be on screen
+                request = self.pending.pop()
+            if request is None:
+                break
+            art_filename, thumb_filename, charset, palette = request
+            try:
+                img = render_first_frame(*read_first_frame(art_filename),
+                                         charset, palette)
+                # chooser mustn't see a partly written thumbnail
+                img.save(thumb_filename + '.tmp', 'PNG')
+                os.replace(thumb_filename + '.tmp', thumb_filename)
+            except:
+                # leave placeholder up for unreadable art
+                continue
+            self.finished.append(thumb_filename)
+    
+    def update(self):
+        "Note thumbnails worker has made, so views refresh."
+        while len(self.finished) > 0:
+            self.finished.popleft()
+            self.generation += 1
+    
+    def get_placeholder_texture(self, width, height):
+        "Return a blank texture of given art size, to show until thumbnail is."
+        if not (width, height) in self.placeholders:
+            data = bytes(PLACEHOLDER_COLOR) * width * height
+            self.placeholders[(width, height)] = Texture(data, width, height)
+        return self.placeholders[(width, height)]
+    
+    def destroy(self):
+        if self.thread:
+            with self.condition:
+                self.pending.clear()
+                self.pending.append(None)
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+        for texture in self.placeholders.values():
+            texture.destroy()
@@ -328,6 +328,7 @@ class QuitUnsavedChangesDialog(UIDialog):
         # kind of a hack: make the check BIND_quit does come up false
         # for this art. externalities fairly minor.
         self.ui.active_art.unsaved_changes = False
+        self.ui.active_art.discard_journal()
         self.dismiss()
         self.ui.app.il.BIND_quit()
     
@@ -346,6 +347,7 @@ class CloseUnsavedChangesDialog(QuitUnsavedChangesDialog):
     
     def other_pressed(self):
         self.ui.active_art.unsaved_changes = False
+        self.ui.active_art.discard_journal()
         self.dismiss()
         self.ui.app.il.BIND_close_art()
 
@@ -223,6 +223,34 @@ class StopArtScriptsCommand(ConsoleCommand):
     def execute(console, args):
         console.ui.active_art.stop_all_scripts()
 
+class TimeArtScriptsCommand(ConsoleCommand):
+    description = 'Time art scripts with given filenames on active art, leaving it unchanged.'
+    def execute(console, args):
+        if len(args) < 2:
+            return 'Usage: scrtime [iterations] [art script filenames]'
+        iterations = int(args[0])
+        art = console.ui.active_art
+        for filename in args[1:]:
+            if not art.get_valid_script_filename(filename):
+                console.ui.app.log("couldn't find art script %s" % filename)
+                continue
+            seconds = art.time_script(filename, iterations)
+            # script raised an error, which time_script logged
+            if seconds is None:
+                continue
+            console.ui.app.log('%s: %.2f ms per run' % (filename, seconds * 1000))
+
+class ArtMemoryCommand(ConsoleCommand):
+    description = 'Show tile data memory used by all loaded art.'
+    def execute(console, args):
+        total_used, total_expanded = 0, 0
+        for art in console.ui.app.art_loaded_for_edit:
+            used, expanded = art.get_memory_usage()
+            total_used += used
+            total_expanded += expanded
+            console.ui.app.log('%s: %s bytes (%s bytes as per-vertex floats)' % (art.filename, used, expanded))
+        console.ui.app.log('total: %s bytes (%s bytes as per-vertex floats)' % (total_used, total_expanded))
+
 # map strings to command classes for ConsoleUI.parse
 commands = {
     'exit': QuitCommand,
@@ -243,10 +271,12 @@ commands = {
     'scr': RunArtScriptCommand,
     'screv': RunEveryArtScriptCommand,
     'scrstop': StopArtScriptsCommand,
+    'scrtime': TimeArtScriptsCommand,
     'revert': RevertArtCommand,
     'img': OverlayImageCommand,
     'imp': ImportCommand,
-    'exp': ExportCommand
+    'exp': ExportCommand,
+    'artmem': ArtMemoryCommand
 }
 
 
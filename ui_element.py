@@ -273,7 +273,7 @@ class UIRenderable(TileRenderable):
 class FPSCounterUI(UIElement):
     
     tile_y = 1
-    tile_width, tile_height = 12, 2
+    tile_width, tile_height = 12, 3
     snap_right = True
     game_mode_visible = True
     all_modes_visible = True
@@ -294,6 +294,9 @@ class FPSCounterUI(UIElement):
         # display last tick time; frame_time includes delay, is useless
         text = '%.1f ms ' % self.ui.app.frame_time
         self.art.write_string(0, 0, x, 1, text, color, None, True)
+        # GL buffer data uploaded last frame
+        text = '%.1f KB up ' % (self.ui.app.last_buffer_bytes_uploaded / 1024)
+        self.art.write_string(0, 0, x, 2, text, color, None, True)
     
     def render(self):
         # always show FPS if low
@@ -1,5 +1,5 @@
 
-import os, time, json
+import os, time
 
 from PIL import Image
 
@@ -7,10 +7,9 @@ from texture import Texture
 from ui_chooser_dialog import ChooserDialog, ChooserItem, ChooserItemButton
 from ui_console import OpenCommand, LoadCharSetCommand, LoadPaletteCommand
 from ui_art_dialog import PaletteFromFileDialog, ImportOptionsDialog
-from art import ART_DIR, ART_FILE_EXTENSION, THUMBNAIL_CACHE_DIR, SCRIPT_FILE_EXTENSION, ART_SCRIPT_DIR
+from art import ART_DIR, ART_FILE_EXTENSION, SCRIPT_FILE_EXTENSION, ART_SCRIPT_DIR
 from palette import Palette, PALETTE_DIR, PALETTE_EXTENSIONS
 from charset import CharacterSet, CHARSET_DIR, CHARSET_FILE_EXTENSION
-from image_export import write_thumbnail
 
 
 class BaseFileChooserItem(ChooserItem):
@@ -125,36 +124,47 @@ class BaseFileChooserDialog(ChooserDialog):
 
 class ArtChooserItem(BaseFileChooserItem):
     
-    # set in load()
-    art_width = None
+    # art index entry, set in load()
+    art_entry = None
     hide_file_extension = True
     
     def get_description_lines(self):
         lines = BaseFileChooserItem.get_description_lines(self)
         if lines is not None:
             return lines
-        if not self.art_width:
-            return []
-        mod_time = time.gmtime(self.art_mod_time)
+        if not self.art_entry:
+            return ['[reading...]'] if os.path.exists(self.name) else []
+        if 'error' in self.art_entry:
+            return ["[couldn't read art]"]
+        mod_time = time.gmtime(self.art_entry['mtime'])
         mod_time = time.strftime('%Y-%m-%d %H:%M:%S', mod_time)
         lines = ['last change: %s' % mod_time]
-        line = '%s x %s, ' % (self.art_width, self.art_height)
-        line += '%s frame' % self.art_frames
+        frames, layers = self.art_entry['frames'], self.art_entry['layers']
+        line = '%s x %s, ' % (self.art_entry['width'], self.art_entry['height'])
+        line += '%s frame' % frames
         # pluralize properly
-        line += 's' if self.art_frames > 1 else ''
-        line += ', %s layer' % self.art_layers
-        line += 's' if self.art_layers > 1 else ''
+        line += 's' if frames > 1 else ''
+        line += ', %s layer' % layers
+        line += 's' if layers > 1 else ''
         lines += [line]
-        lines += ['char: %s, pal: %s' % (self.art_charset, self.art_palette)]
+        lines += ['char: %s, pal: %s' % (self.art_entry['charset'],
+                                         self.art_entry['palette'])]
         return lines
     
     def get_preview_texture(self, app):
         if os.path.isdir(self.name):
             return
-        thumbnail_filename = app.cache_dir + THUMBNAIL_CACHE_DIR + self.art_hash + '.png'
-        # create thumbnail if it doesn't exist
-        if not os.path.exists(thumbnail_filename):
-            write_thumbnail(app, self.name, thumbnail_filename)
+        # no preview until art index has read file
+        if not self.art_entry or 'error' in self.art_entry:
+            return
+        thumbnail_filename = app.thl.get_thumbnail(self.name,
+                                                   self.art_entry['thumbnail'],
+                                                   self.art_entry['charset'],
+                                                   self.art_entry['palette'])
+        # show placeholder until thumbnail is made
+        if not thumbnail_filename:
+            return app.thl.get_placeholder_texture(self.art_entry['width'],
+                                                   self.art_entry['height'])
         # read thumbnail
         img = Image.open(thumbnail_filename)
         img = img.convert('RGBA')
@@ -164,19 +174,9 @@ class ArtChooserItem(BaseFileChooserItem):
     def load(self, app):
         if os.path.isdir(self.name):
             return
-        if not os.path.exists(self.name):
-            return
-        # get last modified time for description
-        self.art_mod_time = os.path.getmtime(self.name)
-        # get file's hash for unique thumbnail name
-        self.art_hash = app.get_file_hash(self.name)
-        # rather than load the entire art, just get some high level stats
-        d = json.load(open(self.name))
-        self.art_width, self.art_height = d['width'], d['height']
-        self.art_frames = len(d['frames'])
-        self.art_layers = len(d['frames'][0]['layers'])
-        self.art_charset = d['charset']
-        self.art_palette = d['palette']
+        # rather than read the art, get its high level stats from index;
+        # if they're not there yet the dialog reloads us when they are
+        self.art_entry = app.ail.get_entry(self.name)
 
 
 class ArtChooserDialog(BaseFileChooserDialog):
@@ -199,6 +199,34 @@ class ArtChooserDialog(BaseFileChooserDialog):
             self.current_dir += ART_DIR
         self.field_texts[self.active_field] = self.current_dir
     
+    def get_items(self):
+        items = BaseFileChooserDialog.get_items(self)
+        # index any art files in this dir it doesn't have yet
+        self.ui.app.ail.scan([item.name for item in items
+                              if not os.path.isdir(item.name)])
+        self.index_generation = self.ui.app.ail.generation
+        self.thumbnail_generation = self.ui.app.thl.generation
+        return items
+    
+    def update(self):
+        BaseFileChooserDialog.update(self)
+        item = self.get_selected_item()
+        if not item or os.path.isdir(item.name):
+            return
+        # refresh selected item if art index has read it since we loaded it
+        if self.index_generation != self.ui.app.ail.generation:
+            self.index_generation = self.ui.app.ail.generation
+            if not item.art_entry:
+                self.load_selected_item()
+                if item.art_entry:
+                    self.reset_art(False)
+                    self.position_preview()
+        # replace placeholder if a thumbnail's been made since
+        if self.thumbnail_generation != self.ui.app.thl.generation:
+            self.thumbnail_generation = self.ui.app.thl.generation
+            if self.preview_renderable.texture in self.ui.app.thl.placeholders.values():
+                self.position_preview()
+    
     def confirm_pressed(self):
         if not os.path.exists(self.field_texts[0]):
             return